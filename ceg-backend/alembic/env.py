@@ -23,6 +23,10 @@ fileConfig(config.config_file_name)
 # from myapp import mymodel
 target_metadata = Base.metadata
 
+# La URL de la aplicación (variable DATABASE_URL) tiene prioridad sobre la de alembic.ini
+if os.getenv("DATABASE_URL"):
+    config.set_main_option("sqlalchemy.url", os.environ["DATABASE_URL"])
+
 # other values from the config, defined by the needs of env.py,
 # can be acquired:
 # my_important_option = config.get_main_option("my_important_option")
@@ -0,0 +1,68 @@
+"""Enforce court non-overlap in the database
+
+Revision ID: a3c9e1f47b20
+Revises: ece17142f6bd
+Create Date: 2026-10-18 16:05:12.418230
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a3c9e1f47b20'
+down_revision: Union[str, None] = 'ece17142f6bd'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Nombre de la restricción; es también el mensaje del error en SQLite (ver crud.es_solapamiento)
+RESTRICCION = 'reservas_pista_sin_solapamiento'
+
+
+def upgrade() -> None:
+    dialecto = op.get_bind().dialect.name
+    if dialecto == 'sqlite':
+        # SQLite no tiene restricciones de exclusión: dos triggers rechazan la fila si la
+        # pista ya está ocupada ese día en un intervalo que se cruza con el nuevo
+        op.execute(f"""
+            CREATE TRIGGER {RESTRICCION}_insert
+            BEFORE INSERT ON reservas
+            WHEN EXISTS (
+                SELECT 1 FROM reservas
+                WHERE pista_id = NEW.pista_id AND dia = NEW.dia
+                  AND hora_inicio < NEW.hora_fin AND hora_fin > NEW.hora_inicio
+            )
+            BEGIN
+                SELECT RAISE(ABORT, '{RESTRICCION}');
+            END
+        """)
+        op.execute(f"""
+            CREATE TRIGGER {RESTRICCION}_update
+            BEFORE UPDATE OF pista_id, dia, hora_inicio, hora_fin ON reservas
+            WHEN EXISTS (
+                SELECT 1 FROM reservas
+                WHERE pista_id = NEW.pista_id AND dia = NEW.dia
+                  AND hora_inicio < NEW.hora_fin AND hora_fin > NEW.hora_inicio
+                  AND id <> NEW.id
+            )
+            BEGIN
+                SELECT RAISE(ABORT, '{RESTRICCION}');
+            END
+        """)
+    elif dialecto == 'postgresql':
+        op.execute("CREATE EXTENSION IF NOT EXISTS btree_gist")
+        op.execute(f"""
+            ALTER TABLE reservas ADD CONSTRAINT {RESTRICCION}
+            EXCLUDE USING gist (pista_id WITH =, tsrange(dia + hora_inicio, dia + hora_fin) WITH &&)
+        """)
+
+
+def downgrade() -> None:
+    dialecto = op.get_bind().dialect.name
+    if dialecto == 'sqlite':
+        op.execute(f"DROP TRIGGER IF EXISTS {RESTRICCION}_update")
+        op.execute(f"DROP TRIGGER IF EXISTS {RESTRICCION}_insert")
+    elif dialecto == 'postgresql':
+        op.execute(f"ALTER TABLE reservas DROP CONSTRAINT IF EXISTS {RESTRICCION}")
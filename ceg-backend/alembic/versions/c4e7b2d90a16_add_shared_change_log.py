@@ -0,0 +1,45 @@
+"""Add shared change log
+
+Revision ID: c4e7b2d90a16
+Revises: a3c9e1f47b20
+Create Date: 2026-10-18 21:14:37.902114
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4e7b2d90a16'
+down_revision: Union[str, None] = 'a3c9e1f47b20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    contador = op.create_table(
+        'contador_cambios',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('version', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.bulk_insert(contador, [{'id': 1, 'version': 0}])
+    op.create_table(
+        'cambios',
+        sa.Column('version', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('ambito', sa.String(), nullable=False),
+        sa.Column('tipo', sa.String(), nullable=False),
+        sa.Column('clave', sa.Integer(), nullable=True),
+        sa.Column('datos', sa.String(), nullable=True),
+        sa.Column('creado', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('version')
+    )
+    op.create_index('ix_cambios_ambito_version', 'cambios', ['ambito', 'version'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_cambios_ambito_version', table_name='cambios')
+    op.drop_table('cambios')
+    op.drop_table('contador_cambios')
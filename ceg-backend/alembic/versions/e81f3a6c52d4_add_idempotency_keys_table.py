@@ -0,0 +1,38 @@
+"""Add idempotency keys table
+
+Revision ID: e81f3a6c52d4
+Revises: c4e7b2d90a16
+Create Date: 2026-10-18 23:02:11.418305
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e81f3a6c52d4'
+down_revision: Union[str, None] = 'c4e7b2d90a16'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'idempotencia',
+        sa.Column('clave', sa.String(), nullable=False),
+        sa.Column('huella', sa.String(), nullable=False),
+        sa.Column('status', sa.Integer(), nullable=True),
+        sa.Column('headers', sa.String(), nullable=True),
+        sa.Column('cuerpo', sa.LargeBinary(), nullable=True),
+        sa.Column('confirmada', sa.Boolean(), nullable=False),
+        sa.Column('caduca', sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint('clave')
+    )
+    op.create_index('ix_idempotencia_caduca', 'idempotencia', ['caduca'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_idempotencia_caduca', table_name='idempotencia')
+    op.drop_table('idempotencia')
@@ -0,0 +1,34 @@
+"""Add composite indexes for booking queries
+
+Revision ID: ece17142f6bd
+Revises: 357b6202dd69
+Create Date: 2026-10-18 10:12:41.532087
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'ece17142f6bd'
+down_revision: Union[str, None] = '357b6202dd69'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_reservas_pista_dia_horas', 'reservas', ['pista_id', 'dia', 'hora_inicio', 'hora_fin'], unique=False)
+    op.create_index('ix_reservas_dia_horas', 'reservas', ['dia', 'hora_inicio', 'hora_fin'], unique=False)
+    op.create_index('ix_jugadores_name_apellido_reserva', 'jugadores', ['name', 'apellido', 'reserva_id'], unique=False)
+    op.create_index(op.f('ix_jugadores_reserva_id'), 'jugadores', ['reserva_id'], unique=False)
+    op.create_index('ix_socios_name_lastname', 'socios', ['name', 'lastname'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_socios_name_lastname', table_name='socios')
+    op.drop_index(op.f('ix_jugadores_reserva_id'), table_name='jugadores')
+    op.drop_index('ix_jugadores_name_apellido_reserva', table_name='jugadores')
+    op.drop_index('ix_reservas_dia_horas', table_name='reservas')
+    op.drop_index('ix_reservas_pista_dia_horas', table_name='reservas')
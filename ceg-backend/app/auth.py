@@ -1,11 +1,10 @@
 import os
 from datetime import datetime, timedelta
 from typing import Optional
-from fastapi import Depends, HTTPException, status, APIRouter, Request
+from fastapi import Depends, HTTPException, status, APIRouter
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from jose import JWTError, jwt
-from passlib.context import CryptContext
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from dotenv import load_dotenv
 import logging
 
@@ -13,8 +12,9 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-from app import crud, models, schemas
-from app.database import get_db
+from app import cambios, crud_async, models, schemas, principales
+from app.database import get_async_db
+from app.security import averify_password
 
 # Cargar variables desde el archivo .env
 load_dotenv()
@@ -25,7 +25,6 @@ ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 30))
 
 router = APIRouter()
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 oauth2_scheme_socio = OAuth2PasswordBearer(tokenUrl="token_socio")
 oauth2_scheme_admin = OAuth2PasswordBearer(tokenUrl="token_admin")
 
@@ -47,31 +46,26 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
-
-def get_password_hash(password):
-    return pwd_context.hash(password)
-
-def authenticate_socio(db: Session, email: str, password: str):
-    socio = crud.get_socio_by_email(db, email=email)
+# bcrypt se ejecuta en el pool de app.security; la versión async no bloquea el bucle de eventos
+async def authenticate_socio(db: AsyncSession, email: str, password: str):
+    socio = await crud_async.get_socio_by_email(db, email=email)
     if not socio:
         return None
-    if not verify_password(password, socio.hashed_password):
+    if not await averify_password(password, socio.hashed_password):
         return None
     return socio
 
-def authenticate_admin(db: Session, username: str, password: str):
-    admin = crud.get_admin_by_name(db, name=username)
+async def authenticate_admin(db: AsyncSession, username: str, password: str):
+    admin = await crud_async.get_admin_by_name(db, name=username)
     if not admin:
         return None
-    if not verify_password(password, admin.hashed_password):
+    if not await averify_password(password, admin.hashed_password):
         return None
     return admin
 
 @router.post("/token_admin", response_model=schemas.Token)
-def login_for_access_token_admin(db: Session = Depends(get_db), form_data: OAuth2PasswordRequestForm = Depends()):
-    admin = authenticate_admin(db, username=form_data.username, password=form_data.password)
+async def login_for_access_token_admin(db: AsyncSession = Depends(get_async_db), form_data: OAuth2PasswordRequestForm = Depends()):
+    admin = await authenticate_admin(db, username=form_data.username, password=form_data.password)
     if not admin:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -82,8 +76,8 @@ def login_for_access_token_admin(db: Session = Depends(get_db), form_data: OAuth
     return {"access_token": access_token, "token_type": "bearer"}
 
 @router.post("/token_socio", response_model=schemas.Token)
-async def login_for_access_token_socio(db: Session = Depends(get_db), form_data: OAuth2PasswordRequestForm = Depends()):
-    socio = authenticate_socio(db, email=form_data.username, password=form_data.password)
+async def login_for_access_token_socio(db: AsyncSession = Depends(get_async_db), form_data: OAuth2PasswordRequestForm = Depends()):
+    socio = await authenticate_socio(db, email=form_data.username, password=form_data.password)
     if not socio:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -94,7 +88,7 @@ async def login_for_access_token_socio(db: Session = Depends(get_db), form_data:
     return {"access_token": access_token, "token_type": "bearer"}
 
 # Función para obtener el socio autenticado
-def get_current_socio(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+async def get_current_socio(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -113,13 +107,22 @@ def get_current_socio(token: str = Depends(oauth2_scheme), db: Session = Depends
     if token_data.role != "socio":
         raise HTTPException(status_code=403, detail="Not enough permissions")
     
-    socio = crud.get_socio_by_email(db, email=token_data.sub)
+    # Se evita la consulta si el socio ya se resolvió hace poco; antes se leen (como mucho
+    # cada PRINCIPAL_CACHE_SYNC segundos) los cambios de los demás workers para que una
+    # baja o modificación no siga en la caché
+    await cambios.registro.sincronizar_async(db, principales.PRINCIPAL_CACHE_SYNC)
+    socio = principales.cache.obtener("socio", token_data.sub)
     if socio is None:
-        raise credentials_exception
+        generacion = principales.cache.generacion
+        db_socio = await crud_async.get_socio_by_email(db, email=token_data.sub)
+        if db_socio is None:
+            raise credentials_exception
+        socio = schemas.Socio.model_validate(db_socio)
+        principales.cache.guardar("socio", token_data.sub, socio, generacion)
     return socio
 
 # Función para obtener el administrador autenticado
-async def get_current_admin(db: Session = Depends(get_db), token: str = Depends(oauth2_scheme_admin)):
+async def get_current_admin(db: AsyncSession = Depends(get_async_db), token: str = Depends(oauth2_scheme_admin)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -136,24 +139,31 @@ async def get_current_admin(db: Session = Depends(get_db), token: str = Depends(
     except JWTError:
         raise credentials_exception
     
-    # Busca al administrador utilizando 'sub' como identificador
-    admin = crud.get_admin_by_name(db, name=token_data.sub)  # Ajusta esta línea según el identificador utilizado como 'sub'
+    # Busca al administrador utilizando 'sub' como identificador (en la caché, puesta al
+    # día con el registro de cambios, o en la base de datos)
+    await cambios.registro.sincronizar_async(db, principales.PRINCIPAL_CACHE_SYNC)
+    admin = principales.cache.obtener("admin", token_data.sub)
     if admin is None:
-        raise credentials_exception
+        generacion = principales.cache.generacion
+        db_admin = await crud_async.get_admin_by_name(db, name=token_data.sub)  # Ajusta esta línea según el identificador utilizado como 'sub'
+        if db_admin is None:
+            raise credentials_exception
+        admin = schemas.Admin.model_validate(db_admin)
+        principales.cache.guardar("admin", token_data.sub, admin, generacion)
     return admin
 
 # Ruta para obtener los detalles del socio autenticado
 @router.get("/socios/me", response_model=schemas.Socio)
-async def get_current_socio_me(current_socio: models.Socio = Depends(get_current_socio)):
+async def get_current_socio_me(current_socio: schemas.Socio = Depends(get_current_socio)):
     return current_socio
 
 # Ruta para obtener los detalles del administrador autenticado
 @router.get("/admin/me", response_model=schemas.Admin)
-async def get_current_admin_me(current_admin: models.Admin = Depends(get_current_admin)):
+async def get_current_admin_me(current_admin: schemas.Admin = Depends(get_current_admin)):
     return current_admin
 
 @router.get("/admin/check-role")
-async def check_admin_role(current_admin: models.Admin = Depends(get_current_admin)):
+async def check_admin_role(current_admin: schemas.Admin = Depends(get_current_admin)):
     return {
         "is_admin": True,
         "role": "admin",
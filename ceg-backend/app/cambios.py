@@ -0,0 +1,178 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from sqlalchemy import delete, func, insert, select, update
+from sqlalchemy.orm import Session
+
+from app import models
+
+logger = logging.getLogger(__name__)
+
+# Cambios que se conservan en la tabla (además del último de cada ámbito); un worker que se
+# quede más atrás que eso vuelve a cargar sus cachés desde cero
+CAMBIOS_RETENCION = int(os.getenv("CAMBIOS_RETENCION", 10000))
+# Cada cuántas versiones se poda la tabla (lo hace la escritura que llega a ese múltiplo)
+CAMBIOS_PODA = int(os.getenv("CAMBIOS_PODA", 1000))
+
+_contador = models.ContadorCambios.__table__
+_cambios = models.Cambio.__table__
+
+
+class Cambio(NamedTuple):
+    version: int
+    ambito: str
+    tipo: str
+    clave: Optional[int]
+    datos: Any
+
+
+def registrar(db: Session, ambito: str, tipo: str, clave: Optional[int] = None, datos: Any = None) -> int:
+    """Apunta un cambio en la transacción en curso: se confirma o se deshace con ella."""
+    return registrar_lote(db, ambito, tipo, [(clave, datos)])[0]
+
+
+def registrar_lote(db: Session, ambito: str, tipo: str, elementos: List[Tuple[Optional[int], Any]]) -> List[int]:
+    """Apunta varios cambios del mismo tipo con un solo incremento del contador."""
+    if not elementos:
+        return []
+    # Va al final de la transacción: desde aquí hasta el commit los demás escritores esperan
+    ultima = db.execute(
+        update(_contador).where(_contador.c.id == 1)
+        .values(version=_contador.c.version + len(elementos))
+        .returning(_contador.c.version)
+    ).scalar_one()
+    versiones = list(range(ultima - len(elementos) + 1, ultima + 1))
+    ahora = datetime.utcnow()
+    db.execute(insert(_cambios), [
+        {"version": version, "ambito": ambito, "tipo": tipo, "clave": clave,
+         "datos": json.dumps(datos, ensure_ascii=False) if datos is not None else None, "creado": ahora}
+        for version, (clave, datos) in zip(versiones, elementos)
+    ])
+    if CAMBIOS_PODA > 0 and ultima // CAMBIOS_PODA != (versiones[0] - 1) // CAMBIOS_PODA:
+        podar(db, ultima)
+    return versiones
+
+
+def podar(db: Session, ultima: int):
+    """Borra los cambios más antiguos que CAMBIOS_RETENCION, salvo el último de cada ámbito."""
+    ultimos = select(func.max(_cambios.c.version)).group_by(_cambios.c.ambito)
+    db.execute(delete(_cambios).where(
+        _cambios.c.version <= ultima - CAMBIOS_RETENCION,
+        _cambios.c.version.not_in(ultimos)
+    ))
+
+
+class RegistroCambios:
+    """Aplica en las cachés de este proceso los cambios que ha escrito cualquier worker.
+
+    Cada caché se apunta con suscribir(ambito, manejador) y, si se carga desde la base de
+    datos, con al_iniciar(funcion). sincronizar() lee los cambios posteriores a la última
+    versión aplicada (una consulta por clave primaria) y los reparte en orden; quien vaya a
+    usar una caché lo llama antes. Al iniciar se lee primero la versión y después se cargan
+    las cachés, así que los manejadores pueden recibir cambios que la carga ya incluía:
+    tienen que ser idempotentes.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._manejadores: Dict[str, List[Callable[[Cambio], None]]] = defaultdict(list)
+        self._al_iniciar: List[Callable[[Session, int], None]] = []
+        self._al_sincronizar: List[Callable[[], None]] = []
+        # Última versión aplicada; None hasta la primera sincronización
+        self.version: Optional[int] = None
+        # Última versión de cada ámbito (para los ETag de app.versiones)
+        self.versiones: Dict[str, int] = {}
+        self.aplicados = 0
+        self.recargas = 0
+        # time.monotonic() de la última sincronización completa
+        self.sincronizado = 0.0
+
+    def suscribir(self, ambito: str, manejador: Callable[[Cambio], None]):
+        self._manejadores[ambito].append(manejador)
+
+    def al_iniciar(self, funcion: Callable[[Session, int], None]):
+        self._al_iniciar.append(funcion)
+
+    def al_sincronizar(self, funcion: Callable[[], None]):
+        """Tareas de mantenimiento de las cachés tras cada sincronización; tienen que ser baratas."""
+        self._al_sincronizar.append(funcion)
+
+    def sincronizar(self, db: Session):
+        if self.version is None:
+            self.iniciar(db)
+            return
+        leido = time.monotonic()
+        filas = db.execute(
+            select(_cambios).where(_cambios.c.version > self.version).order_by(_cambios.c.version)
+        ).all()
+        if filas:
+            self._aplicar(db, filas)
+        for funcion in self._al_sincronizar:
+            funcion()
+        self.sincronizado = max(self.sincronizado, leido)
+
+    async def sincronizar_async(self, db, intervalo: float = 0):
+        """Como sincronizar(); con intervalo, no consulta si la última sincronización
+        (de cualquier hilo) fue hace menos de esos segundos."""
+        if intervalo > 0 and self.version is not None and time.monotonic() - self.sincronizado < intervalo:
+            return
+        # Misma conexión de la sesión asíncrona; los manejadores no hacen E/S
+        await db.run_sync(self.sincronizar)
+
+    def iniciar(self, db: Session):
+        with self._lock:
+            if self.version is not None:
+                # Otro hilo lo ha iniciado mientras este esperaba
+                return
+            version = db.execute(select(_contador.c.version).where(_contador.c.id == 1)).scalar_one()
+            # La poda conserva el último cambio de cada ámbito
+            self.versiones = dict(db.execute(
+                select(_cambios.c.ambito, func.max(_cambios.c.version))
+                .where(_cambios.c.version <= version).group_by(_cambios.c.ambito)
+            ).all())
+            for funcion in self._al_iniciar:
+                funcion(db, version)
+            self.version = version
+        logger.info(f"Registro de cambios iniciado en la versión {version}")
+        self.sincronizar(db)
+
+    def reiniciar(self):
+        """Olvida la versión aplicada: la siguiente sincronización vuelve a cargar las cachés."""
+        with self._lock:
+            self.version = None
+
+    def estadisticas(self) -> dict:
+        return {"version": self.version, "aplicados": self.aplicados, "recargas": self.recargas, "ambitos": dict(self.versiones)}
+
+    def _aplicar(self, db: Session, filas: Iterable):
+        with self._lock:
+            for fila in filas:
+                if fila.version <= self.version:
+                    # Otro hilo ya la ha aplicado
+                    continue
+                if fila.version != self.version + 1:
+                    # Faltan versiones ya podadas: las cachés se cargan de nuevo
+                    logger.warning(f"Registro de cambios atrasado (versión {self.version}, siguiente {fila.version}); se recargan las cachés")
+                    self.recargas += 1
+                    self.version = None
+                    self.iniciar(db)
+                    return
+                cambio = Cambio(fila.version, fila.ambito, fila.tipo, fila.clave,
+                                json.loads(fila.datos) if fila.datos is not None else None)
+                for manejador in self._manejadores.get(cambio.ambito, ()):
+                    try:
+                        manejador(cambio)
+                    except Exception:
+                        logger.exception(f"Error al aplicar el cambio {cambio.version} ({cambio.ambito})")
+                self.versiones[cambio.ambito] = cambio.version
+                self.version = cambio.version
+                self.aplicados += 1
+
+
+registro = RegistroCambios()
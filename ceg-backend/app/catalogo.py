@@ -0,0 +1,77 @@
+from typing import Dict, List, Optional
+import threading
+import logging
+
+from sqlalchemy.orm import Session
+from app import models, schemas, cambios
+
+logger = logging.getLogger(__name__)
+
+
+class CatalogoPistas:
+    """Caché en memoria del catálogo de pistas.
+
+    Las pistas cambian muy pocas veces, así que se cargan todas en la primera
+    consulta y se sirven desde memoria. crud.create_pista, update_pista y delete_pista
+    apuntan el cambio en el registro compartido, y listar() y obtener() lo sincronizan
+    antes de responder: la caché se invalida en todos los workers. Se guardan como
+    schemas.Pista (no como objetos del ORM) para poder compartirlas entre sesiones sin
+    riesgo; quien necesite el objeto del ORM usa crud.get_pista o crud.get_pistas.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pistas: Optional[Dict[int, schemas.Pista]] = None
+        # Se incrementa en cada invalidación para descartar cargas que se solapen con ella
+        self._version = 0
+        self.aciertos = 0
+        self.fallos = 0
+
+    def listar(self, db: Session, skip: int = 0, limit: Optional[int] = None,
+               despues_de: Optional[int] = None) -> List[schemas.Pista]:
+        pistas = list(self._obtener_todas(db).values())
+        if despues_de is not None:
+            pistas = [p for p in pistas if p.id > despues_de]
+            skip = 0
+        return pistas[skip:] if limit is None else pistas[skip:skip + limit]
+
+    def obtener(self, db: Session, pista_id: int) -> Optional[schemas.Pista]:
+        return self._obtener_todas(db).get(pista_id)
+
+    def invalidar(self):
+        with self._lock:
+            self._pistas = None
+            self._version += 1
+
+    def estadisticas(self) -> dict:
+        return {
+            "aciertos": self.aciertos,
+            "fallos": self.fallos,
+            "cargada": self._pistas is not None,
+            "pistas": len(self._pistas) if self._pistas is not None else 0
+        }
+
+    def _obtener_todas(self, db: Session) -> Dict[int, schemas.Pista]:
+        cambios.registro.sincronizar(db)
+        with self._lock:
+            pistas = self._pistas
+            version = self._version
+            if pistas is not None:
+                self.aciertos += 1
+                return pistas
+            self.fallos += 1
+
+        pistas = {
+            pista.id: schemas.Pista.model_validate(pista)
+            for pista in db.query(models.Pista).order_by(models.Pista.id).all()
+        }
+        with self._lock:
+            if self._version == version:
+                self._pistas = pistas
+        logger.info(f"Catálogo de pistas cargado: {len(pistas)} pistas")
+        return pistas
+
+
+pistas = CatalogoPistas()
+cambios.registro.al_iniciar(lambda db, version: pistas.invalidar())
+cambios.registro.suscribir("pistas", lambda cambio: pistas.invalidar())
@@ -1,18 +1,47 @@
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy.orm import Session, selectinload
 from app.models import Socio, Admin
-from app.security import verify_password
-from sqlalchemy import and_
-from app import models, schemas
-from passlib.context import CryptContext
-import bcrypt
-from sqlalchemy.exc import SQLAlchemyError
+from app.security import verify_password, get_password_hash, get_password_hashes
+from sqlalchemy import and_, or_, select, insert
+from app import models, schemas, cambios, eventos, idempotencia
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 from datetime import timedelta, datetime, date, time
+from typing import Iterable, List, Optional, Set
+from contextlib import contextmanager
 import logging
 
 logger = logging.getLogger(__name__)
 
-# Configuración para el hashing de contraseñas
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Restricción de la base de datos que impide dos reservas solapadas en la misma pista
+# (trigger en SQLite, restricción de exclusión en PostgreSQL; ver app.models)
+RESTRICCION_SOLAPAMIENTO = models.RESTRICCION_SOLAPAMIENTO
+
+
+class ReservaSolapada(Exception):
+    """La base de datos ha rechazado la reserva porque la pista ya está ocupada en ese horario."""
+
+
+def es_solapamiento(error: IntegrityError) -> bool:
+    return RESTRICCION_SOLAPAMIENTO in str(error.orig)
+
+
+@contextmanager
+def transaccion_reserva(db: Session):
+    """Ejecuta el bloque y hace commit; el rechazo por solapamiento (en el flush o en el
+    commit) se traduce en ReservaSolapada tras deshacer la transacción. Si la petición
+    lleva Idempotency-Key, la clave queda confirmada en la misma transacción."""
+    try:
+        yield
+        idempotencia.confirmar(db)
+        db.commit()
+    except IntegrityError as e:
+        db.rollback()
+        if es_solapamiento(e):
+            raise ReservaSolapada("La pista ya está reservada en ese horario.") from e
+        raise
+
+def commit_reserva(db: Session):
+    with transaccion_reserva(db):
+        pass
 
 def authenticate_admin(db: Session, name: str, password: str):
     admin = db.query(Admin).filter(Admin.name == name).first()
@@ -30,14 +59,6 @@ def authenticate_socio(db: Session, email: str, password: str):
         return None
     return socio
 
-# Función para verificar si la contraseña coincide con el hash almacenado
-def verify_password(plain_password, hashed_password):
-    return pwd_context.verify(plain_password, hashed_password)
-
-# Función para hashear la contraseña
-def get_password_hash(password):
-    return pwd_context.hash(password)
-
 # Admin CRUD
 def get_admin(db: Session, admin_id: int):
     try:
@@ -53,9 +74,15 @@ def get_admin_by_name(db: Session, name: str):
         logger.error(f"Error getting admin with name {name}: {str(e)}")
         return None
 
-def get_admins(db: Session, skip: int = 0, limit: int = 10):
+def get_admins(db: Session, skip: int = 0, limit: int = 10, despues_de: Optional[int] = None):
     try:
-        return db.query(models.Admin).offset(skip).limit(limit).all()
+        query = db.query(models.Admin).order_by(models.Admin.id)
+        # Con cursor se pagina por id (keyset) en lugar de saltar filas con offset
+        if despues_de is not None:
+            query = query.filter(models.Admin.id > despues_de)
+        else:
+            query = query.offset(skip)
+        return query.limit(limit).all()
     except SQLAlchemyError as e:
         logger.error(f"Error getting admins: {str(e)}")
         return []
@@ -87,8 +114,10 @@ def update_admin(db: Session, admin_id: int, admin: schemas.AdminUpdate):
                 elif hasattr(db_admin, key):
                     setattr(db_admin, key, value)
             
+            cambios.registrar(db, "admins", "actualizado", admin_id)
             db.commit()
             db.refresh(db_admin)
+            cambios.registro.sincronizar(db)
             logger.info(f"Admin updated successfully: {db_admin.id}")
             return db_admin
         else:
@@ -104,7 +133,9 @@ def delete_admin(db: Session, admin_id: int):
         db_admin = db.query(models.Admin).filter(models.Admin.id == admin_id).first()
         if db_admin:
             db.delete(db_admin)
+            cambios.registrar(db, "admins", "eliminado", admin_id)
             db.commit()
+            cambios.registro.sincronizar(db)
             logger.info(f"Admin deleted successfully: {admin_id}")
             return db_admin
         else:
@@ -127,11 +158,16 @@ def get_socio_by_name_and_lastname(db: Session, name: str, lastname: str):
         models.Socio.lastname == lastname
     ).first()
 
-def get_socios(db: Session, skip: int = 0, limit: int = 10):
-    return db.query(models.Socio).offset(skip).limit(limit).all()
+def get_socios(db: Session, skip: int = 0, limit: int = 10, despues_de: Optional[int] = None):
+    query = db.query(models.Socio).order_by(models.Socio.id)
+    if despues_de is not None:
+        query = query.filter(models.Socio.id > despues_de)
+    else:
+        query = query.offset(skip)
+    return query.limit(limit).all()
 
 def hash_password(password: str):
-    return pwd_context.hash(password)
+    return get_password_hash(password)
 
 def create_socio(db: Session, socio: schemas.SocioCreate):
     try: 
@@ -154,6 +190,48 @@ def create_socio(db: Session, socio: schemas.SocioCreate):
         logger.error(f"Error creating socio: {str(e)}")
         raise
 
+def get_emails_registrados(db: Session, emails: Iterable[str]) -> Set[str]:
+    """Emails de la lista que ya pertenecen a algún socio, en una sola consulta."""
+    emails = list(emails)
+    if not emails:
+        return set()
+    return set(db.scalars(select(models.Socio.email).filter(models.Socio.email.in_(emails))))
+
+def create_socios_bulk(db: Session, socios: List[schemas.SocioCreate], tamano_lote: int = 500) -> List[Optional[int]]:
+    """Inserta socios ya validados en lotes de executemany y devuelve el id de cada uno.
+
+    Cada lote se confirma por separado; si uno falla (p. ej. un email dado de alta
+    mientras tanto) se deshace solo ese lote y sus socios quedan con id None.
+    """
+    hashes = get_password_hashes([socio.password for socio in socios])
+    ids: List[Optional[int]] = []
+    for inicio in range(0, len(socios), tamano_lote):
+        filas = [
+            {
+                "name": socio.name,
+                "lastname": socio.lastname,
+                "email": socio.email,
+                "phone": socio.phone,
+                "type": socio.type,
+                "hashed_password": hashed_password
+            }
+            for socio, hashed_password in zip(socios[inicio:inicio + tamano_lote], hashes[inicio:inicio + tamano_lote])
+        ]
+        try:
+            resultado = db.execute(
+                insert(models.Socio).returning(models.Socio.id, sort_by_parameter_order=True),
+                filas
+            )
+            lote_ids = list(resultado.scalars())
+            db.commit()
+            ids.extend(lote_ids)
+        except SQLAlchemyError as e:
+            db.rollback()
+            logger.error(f"Error al insertar el lote de socios {inicio}-{inicio + len(filas)}: {str(e)}")
+            ids.extend([None] * len(filas))
+    logger.info(f"Importación masiva: {sum(1 for i in ids if i is not None)} socios creados")
+    return ids
+
 import logging
 
 logger = logging.getLogger(__name__)
@@ -168,7 +246,9 @@ def update_socio(db: Session, socio_id: int, socio_in: dict):
             for key, value in socio_in.items():
                 if hasattr(db_socio, key):
                     setattr(db_socio, key, value)
+            cambios.registrar(db, "socios", "actualizado", socio_id)
             db.commit()
+            cambios.registro.sincronizar(db)
             logger.info("Commit realizado en la base de datos")
             db.refresh(db_socio)
             
@@ -194,8 +274,10 @@ def update_socio_me(db: Session, socio: models.Socio, socio_update: schemas.Soci
         setattr(socio, field, value)
     
     try:
+        cambios.registrar(db, "socios", "actualizado", socio.id)
         db.commit()
         db.refresh(socio)
+        cambios.registro.sincronizar(db)
         logger.info(f"Socio {socio.id} actualizado exitosamente en la base de datos")
     except Exception as e:
         db.rollback()
@@ -209,7 +291,9 @@ def delete_socio(db: Session, socio_id: int):
         db_socio = db.query(models.Socio).filter(models.Socio.id == socio_id).first()
         if db_socio:
             db.delete(db_socio)
+            cambios.registrar(db, "socios", "eliminado", socio_id)
             db.commit()
+            cambios.registro.sincronizar(db)
             logger.info(f"Socio deleted successfully: {socio_id}")
             return db_socio
         else:
@@ -220,9 +304,14 @@ def delete_socio(db: Session, socio_id: int):
         logger.error(f"Error deleting socio: {str(e)}")
         raise
 
-# Pistas CRUD
-def get_pistas(db: Session, skip: int = 0, limit: int = 10):
-    return db.query(models.Pista).offset(skip).limit(limit).all()
+# Pistas CRUD (los endpoints de lectura y las validaciones usan app.catalogo)
+def get_pistas(db: Session, skip: int = 0, limit: Optional[int] = 10, despues_de: Optional[int] = None):
+    query = db.query(models.Pista).order_by(models.Pista.id)
+    if despues_de is not None:
+        query = query.filter(models.Pista.id > despues_de)
+    else:
+        query = query.offset(skip)
+    return query.all() if limit is None else query.limit(limit).all()
 
 def get_pista(db: Session, pista_id: int):
     return db.query(models.Pista).filter(models.Pista.id == pista_id).first()
@@ -231,8 +320,11 @@ def create_pista(db: Session, pista: schemas.PistaCreate):
     try:
         db_pista = models.Pista(**pista.dict())
         db.add(db_pista)
+        db.flush()
+        cambios.registrar(db, "pistas", "creada", db_pista.id)
         db.commit()
         db.refresh(db_pista)
+        cambios.registro.sincronizar(db)
         logger.info(f"Pista created successfully: {db_pista.id}")
         return db_pista
     except Exception as e:
@@ -248,8 +340,10 @@ def update_pista(db: Session, pista_id: int, pista: schemas.PistaUpdate):
             logger.info(f"Updating pista {pista_id} with data: {update_data}")
             for key, value in update_data.items():
                 setattr(db_pista, key, value)
+            cambios.registrar(db, "pistas", "actualizada", pista_id)
             db.commit()
             db.refresh(db_pista)
+            cambios.registro.sincronizar(db)
             logger.info(f"Pista updated successfully: {pista_id}")
             return db_pista
         else:
@@ -268,7 +362,9 @@ def delete_pista(db: Session, pista_id: int):
             logger.info(f"Pista found: {pista.id}")
             db.delete(pista)
             logger.info("Pista marked for deletion")
+            cambios.registrar(db, "pistas", "eliminada", pista_id)
             db.commit()
+            cambios.registro.sincronizar(db)
             logger.info("Database commit successful")
             return True
         else:
@@ -283,44 +379,104 @@ def delete_pista(db: Session, pista_id: int):
 def get_reserva(db: Session, reserva_id: int):
     return db.query(models.Reserva).filter(models.Reserva.id == reserva_id).first()
 
-def get_reservas(db: Session, skip: int = 0, limit: int = 100):
-    today = date.today()
-    return db.query(models.Reserva)\
-            .options(joinedload(models.Reserva.jugadores))\
-            .filter(models.Reserva.dia >= today)\
-            .order_by(models.Reserva.dia, models.Reserva.hora_inicio)\
-            .offset(skip)\
-            .limit(limit)\
-            .all()
-
-
-def create_reserva(db: Session, reserva: schemas.ReservaCreate):
-    # Combinar fecha y hora para crear objetos datetime completos
-    fecha = reserva.dia
-    hora_inicio = datetime.combine(fecha, reserva.hora_inicio)
-    hora_fin = datetime.combine(fecha, reserva.hora_fin)
+def filtro_despues_de_reserva(dia: date, hora_inicio: time, reserva_id: int):
+    """Condición keyset: reservas posteriores a (dia, hora_inicio, id) en ese mismo orden."""
+    return and_(
+        models.Reserva.dia >= dia,
+        or_(
+            models.Reserva.dia > dia,
+            models.Reserva.hora_inicio > hora_inicio,
+            and_(models.Reserva.hora_inicio == hora_inicio, models.Reserva.id > reserva_id)
+        )
+    )
 
+def get_reservas(db: Session, skip: int = 0, limit: int = 100, despues_de: Optional[tuple] = None, desde: Optional[date] = None):
+    desde = desde or date.today()
+    query = db.query(models.Reserva)\
+            .options(selectinload(models.Reserva.jugadores))\
+            .filter(models.Reserva.dia >= desde)\
+            .order_by(models.Reserva.dia, models.Reserva.hora_inicio, models.Reserva.id)
+    # Con cursor (dia, hora_inicio, id) cada página cuesta lo mismo, sin importar cuántas se hayan leído
+    if despues_de is not None:
+        query = query.filter(filtro_despues_de_reserva(*despues_de))
+    else:
+        query = query.offset(skip)
+    return query.limit(limit).all()
+
+def iter_reservas(db: Session, desde: Optional[date] = None, hasta: Optional[date] = None, tamano_lote: int = 1000):
+    """Recorre las reservas de [desde, hasta] por lotes de `tamano_lote` filas, sin cargarlas todas en memoria."""
+    stmt = select(models.Reserva)\
+            .options(selectinload(models.Reserva.jugadores))\
+            .order_by(models.Reserva.dia, models.Reserva.hora_inicio, models.Reserva.id)\
+            .execution_options(yield_per=tamano_lote)
+    if desde is not None:
+        stmt = stmt.filter(models.Reserva.dia >= desde)
+    if hasta is not None:
+        stmt = stmt.filter(models.Reserva.dia <= hasta)
+    # El mapa de identidad de la sesión guarda referencias débiles: cada lote se libera
+    # en cuanto quien lo consume lo suelta, así que la memoria no crece con el rango
+    yield from db.execute(stmt).scalars().partitions()
+
+
+def create_reserva(db: Session, reserva: schemas.ReservaCreate) -> schemas.Reserva:
+    """Crea la reserva y sus jugadores en una sola unidad de trabajo: un flush y un commit.
+
+    Devuelve una copia (schemas.Reserva) tomada tras el flush, cuando ya hay ids: el commit
+    caduca los atributos del objeto del ORM y serializarlo obligaría a volver a leerlo.
+    """
     db_reserva = models.Reserva(
         pista_id=reserva.pista_id,
-        dia=fecha,
-        hora_inicio=hora_inicio,
-        hora_fin=hora_fin,
-        individuales=reserva.individuales
+        dia=reserva.dia,
+        hora_inicio=reserva.hora_inicio,
+        hora_fin=reserva.hora_fin,
+        individuales=reserva.individuales,
+        jugadores=[
+            models.Jugador(name=j.name, apellido=j.apellido, tipo_jugador=j.tipo_jugador)
+            for j in reserva.jugadores if j.name and j.apellido  # Solo jugadores con datos
+        ]
     )
-    db.add(db_reserva)
-    db.flush()  # Esto asigna un ID a db_reserva sin hacer commit
-
-    # Crear jugadores asociados a la reserva
-    for jugador_data in reserva.jugadores:
-        db_jugador = models.Jugador(
-            name=jugador_data.name,
-            apellido=jugador_data.apellido,
-            tipo_jugador=jugador_data.tipo_jugador,
-            reserva_id=db_reserva.id
+    with transaccion_reserva(db):
+        db.add(db_reserva)
+        db.flush()
+        creada = schemas.Reserva.model_validate(db_reserva)
+        cambios.registrar(db, "reservas", "creada", creada.id, eventos.reserva_compacta(creada))
+    # Aplica el cambio en las cachés de este proceso y lo reparte a los clientes del flujo SSE
+    cambios.registro.sincronizar(db)
+    return creada
+
+def create_reservas_batch(db: Session, reservas: List[schemas.ReservaCreate]) -> List[models.Reserva]:
+    """Crea todas las reservas (ya validadas) y sus jugadores en una única transacción."""
+    db_reservas = [
+        models.Reserva(
+            pista_id=reserva.pista_id,
+            dia=reserva.dia,
+            hora_inicio=reserva.hora_inicio,
+            hora_fin=reserva.hora_fin,
+            individuales=reserva.individuales,
+            jugadores=[
+                models.Jugador(name=j.name, apellido=j.apellido, tipo_jugador=j.tipo_jugador)
+                for j in reserva.jugadores if j.name and j.apellido
+            ]
         )
-        db.add(db_jugador)
-
-    return db_reserva
+        for reserva in reservas
+    ]
+    try:
+        with transaccion_reserva(db):
+            db.add_all(db_reservas)
+            db.flush()
+            cambios.registrar_lote(db, "reservas", "creada", [(r.id, eventos.reserva_compacta(r)) for r in db_reservas])
+            ids = [r.id for r in db_reservas]
+    except SQLAlchemyError as e:
+        db.rollback()
+        logger.error(f"Error al crear el lote de reservas: {str(e)}")
+        raise
+    cambios.registro.sincronizar(db)
+    logger.info(f"Lote de {len(ids)} reservas creado")
+    # Se recargan en una sola consulta (más la de jugadores) en lugar de un refresh por reserva
+    creadas = db.query(models.Reserva).options(selectinload(models.Reserva.jugadores))\
+            .filter(models.Reserva.id.in_(ids)).all()
+    por_id = {r.id: r for r in creadas}
+    return [por_id[i] for i in ids]
 
 def create_jugador(db: Session, jugador: schemas.JugadorCreate):
     db_jugador = models.Jugador(**jugador.dict())
@@ -353,8 +509,11 @@ def update_reserva(db: Session, reserva_id: int, reserva: schemas.ReservaUpdateW
                 db_reserva.jugadores.append(new_jugador)
                 logger.info(f"Jugador añadido: {new_jugador.__dict__}")
 
-        db.commit()
+        with transaccion_reserva(db):
+            db.flush()
+            cambios.registrar(db, "reservas", "actualizada", db_reserva.id, eventos.reserva_compacta(db_reserva))
         db.refresh(db_reserva)
+        cambios.registro.sincronizar(db)
         logger.info(f"Reserva actualizada con éxito: {db_reserva.id}")
         logger.info(f"Jugadores actualizados: {[{j.name, j.apellido, j.tipo_jugador} for j in db_reserva.jugadores]}")
         return db_reserva
@@ -374,10 +533,13 @@ def delete_reserva(db: Session, reserva_id: int):
         db.query(models.Jugador).filter(models.Jugador.reserva_id == reserva_id).delete()
         
         # Eliminar la reserva
+        eliminada = {"id": reserva_id, "pista_id": db_reserva.pista_id, "dia": db_reserva.dia.isoformat() if db_reserva.dia else None}
         db.delete(db_reserva)
         
         # Commit de los cambios
+        cambios.registrar(db, "reservas", "eliminada", reserva_id, eliminada)
         db.commit()
+        cambios.registro.sincronizar(db)
         
         logger.info(f"Reserva con ID {reserva_id} eliminada correctamente")
         return db_reserva
@@ -386,11 +548,51 @@ def delete_reserva(db: Session, reserva_id: int):
         logger.error(f"Error al eliminar reserva: {str(e)}")
         raise
 
-def get_reservas_by_jugador(db: Session, name: str, lastname: str):
-    return db.query(models.Reserva).join(models.Jugador).filter(
-        models.Jugador.name == name,
-        models.Jugador.apellido == lastname
-    ).all()
+def filtro_ventana(desde: Optional[datetime] = None, hasta: Optional[datetime] = None):
+    """Condición SQL para las reservas que empiezan entre desde y hasta (ambos incluidos)."""
+    condiciones = []
+    # El rango sobre dia permite usar el índice; la segunda condición afina por hora
+    if desde is not None:
+        condiciones += [
+            models.Reserva.dia >= desde.date(),
+            or_(models.Reserva.dia > desde.date(), models.Reserva.hora_inicio >= desde.time())
+        ]
+    if hasta is not None:
+        condiciones += [
+            models.Reserva.dia <= hasta.date(),
+            or_(models.Reserva.dia < hasta.date(), models.Reserva.hora_inicio <= hasta.time())
+        ]
+    return and_(*condiciones)
+
+def select_reservas_by_jugador(name: str, lastname: str, desde: Optional[datetime] = None, hasta: Optional[datetime] = None, limit: Optional[int] = None):
+    # Pista y jugadores se cargan en bloque para no lanzar dos consultas por reserva al serializar
+    stmt = select(models.Reserva).options(
+        selectinload(models.Reserva.pista),
+        selectinload(models.Reserva.jugadores)
+    )
+    if desde is None and hasta is None:
+        stmt = stmt.join(models.Jugador).filter(
+            models.Jugador.name == name,
+            models.Jugador.apellido == lastname
+        )
+    else:
+        # Con ventana se recorre el índice por día y el jugador se comprueba con EXISTS,
+        # así el coste depende de las reservas de la ventana y no del historial del socio
+        stmt = stmt.filter(
+            filtro_ventana(desde, hasta),
+            models.Reserva.jugadores.any(and_(
+                models.Jugador.name == name,
+                models.Jugador.apellido == lastname
+            ))
+        )
+    stmt = stmt.order_by(models.Reserva.dia, models.Reserva.hora_inicio)
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    return stmt
+
+def get_reservas_by_jugador(db: Session, name: str, lastname: str, desde: Optional[datetime] = None, hasta: Optional[datetime] = None, limit: Optional[int] = None):
+    stmt = select_reservas_by_jugador(name, lastname, desde, hasta, limit)
+    return db.execute(stmt).scalars().unique().all()
 
 def create_jugador(db: Session, jugador: schemas.JugadorCreate):
     db_jugador = models.Jugador(**jugador.dict())
@@ -0,0 +1,64 @@
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app import models, schemas, cambios
+from app.security import aget_password_hash
+from app.crud import select_reservas_by_jugador
+from datetime import datetime
+from typing import Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Versiones asíncronas de las funciones de crud.py que usan los endpoints async.
+# Las relaciones se cargan siempre de forma explícita: una AsyncSession no admite
+# cargas perezosas al serializar la respuesta.
+
+# Admin CRUD
+async def get_admin_by_name(db: AsyncSession, name: str):
+    result = await db.execute(select(models.Admin).filter(models.Admin.name == name))
+    return result.scalars().first()
+
+# Socio CRUD
+async def get_socio(db: AsyncSession, socio_id: int):
+    return await db.get(models.Socio, socio_id)
+
+async def get_socio_by_email(db: AsyncSession, email: str):
+    result = await db.execute(select(models.Socio).filter(models.Socio.email == email))
+    return result.scalars().first()
+
+async def get_socios(db: AsyncSession, skip: int = 0, limit: int = 10, despues_de: Optional[int] = None):
+    stmt = select(models.Socio).order_by(models.Socio.id)
+    if despues_de is not None:
+        stmt = stmt.filter(models.Socio.id > despues_de)
+    else:
+        stmt = stmt.offset(skip)
+    result = await db.execute(stmt.limit(limit))
+    return result.scalars().all()
+
+async def update_socio_me(db: AsyncSession, socio: models.Socio, socio_update: schemas.SocioUpdateMe):
+    update_data = socio_update.dict(exclude_unset=True)
+
+    if 'password' in update_data:
+        # bcrypt es costoso en CPU: se calcula en el pool de hashing
+        socio.hashed_password = await aget_password_hash(update_data.pop('password'))
+
+    for field, value in update_data.items():
+        setattr(socio, field, value)
+
+    try:
+        await db.run_sync(lambda sesion: cambios.registrar(sesion, "socios", "actualizado", socio.id))
+        await db.commit()
+        await db.refresh(socio)
+        await cambios.registro.sincronizar_async(db)
+        logger.info(f"Socio {socio.id} actualizado exitosamente en la base de datos")
+    except Exception as e:
+        await db.rollback()
+        logger.error(f"Error al actualizar socio {socio.id} en la base de datos: {str(e)}")
+        raise
+
+    return socio
+
+# Reservas CRUD
+async def get_reservas_by_jugador(db: AsyncSession, name: str, lastname: str, desde: Optional[datetime] = None, hasta: Optional[datetime] = None, limit: Optional[int] = None):
+    result = await db.execute(select_reservas_by_jugador(name, lastname, desde, hasta, limit))
+    return result.scalars().unique().all()
@@ -1,12 +1,159 @@
-from sqlalchemy import create_engine
+import os
+import re
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import Callable, List, Optional, Tuple
+from dotenv import load_dotenv
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
-SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
+load_dotenv()
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
+SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./test.db")
+
+def _url_async(url: str) -> str:
+    # Mismo destino con el driver asíncrono correspondiente
+    if url.startswith("sqlite:"):
+        return "sqlite+aiosqlite:" + url[len("sqlite:"):]
+    if url.startswith("postgresql:") or url.startswith("postgresql+psycopg2:"):
+        return "postgresql+asyncpg:" + url.split(":", 1)[1]
+    return url
+
+ASYNC_SQLALCHEMY_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or _url_async(SQLALCHEMY_DATABASE_URL)
+
+# Pool de conexiones (cada motor tiene el suyo)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", -1))  # segundos; -1 = no reciclar
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "false").lower() in ("1", "true", "yes")
+
+# PRAGMAs de SQLite que se aplican a cada conexión nueva. Con WAL los lectores (el tablero
+# de reservas) no se bloquean mientras otra conexión escribe, y synchronous=NORMAL es
+# seguro en WAL: solo se puede perder la última transacción ante un corte de luz.
+SQLITE_PRAGMAS = {
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT", 5000)),  # ms
+    "cache_size": int(os.getenv("SQLITE_CACHE_SIZE", -20000)),  # negativo = KiB
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", 256 * 1024 * 1024)),  # bytes
+    "temp_store": os.getenv("SQLITE_TEMP_STORE", "MEMORY"),
+}
+
+def _es_sqlite(url: str) -> bool:
+    return make_url(url).get_backend_name() == "sqlite"
+
+def _opciones_motor(url: str, asincrono: bool = False) -> dict:
+    opciones = {"pool_pre_ping": DB_POOL_PRE_PING, "pool_recycle": DB_POOL_RECYCLE}
+    if _es_sqlite(url):
+        opciones["connect_args"] = {"check_same_thread": False}
+        # Una base en memoria vive en una sola conexión: no admite tamaño de pool
+        if make_url(url).database in (None, "", ":memory:"):
+            return opciones
+        if asincrono:
+            # aiosqlite usa NullPool por defecto (una conexión nueva por sesión)
+            opciones["poolclass"] = AsyncAdaptedQueuePool
+    opciones["pool_size"] = DB_POOL_SIZE
+    opciones["max_overflow"] = DB_MAX_OVERFLOW
+    return opciones
+
+def _aplicar_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        for nombre, valor in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {nombre}={valor}")
+    finally:
+        cursor.close()
+
+engine = create_engine(SQLALCHEMY_DATABASE_URL, **_opciones_motor(SQLALCHEMY_DATABASE_URL))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Motor asíncrono (aiosqlite) para los endpoints async; las sesiones no caducan
+# los objetos al hacer commit porque en async no se pueden recargar de forma perezosa
+async_engine = create_async_engine(ASYNC_SQLALCHEMY_DATABASE_URL, **_opciones_motor(ASYNC_SQLALCHEMY_DATABASE_URL, asincrono=True))
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+if _es_sqlite(SQLALCHEMY_DATABASE_URL):
+    event.listen(engine, "connect", _aplicar_pragmas)
+if _es_sqlite(ASYNC_SQLALCHEMY_DATABASE_URL):
+    event.listen(async_engine.sync_engine, "connect", _aplicar_pragmas)
+
+# Veces que una petición puede lanzar la misma forma de sentencia antes de avisar de un
+# posible N+1 (p. ej. una carga perezosa de jugadores por cada reserva); 0 = no avisar
+SQL_REPEAT_THRESHOLD = int(os.getenv("SQL_REPEAT_THRESHOLD", 10))
+
+_PARAMETRO = re.compile(r"%\(\w+\)s|\$\d+|\?")
+_LISTA_PARAMETROS = re.compile(r"\?(?:\s*,\s*\?)+")
+
+def forma_sentencia(sentencia: str) -> str:
+    """La sentencia sin los detalles que cambian entre ejecuciones (listas de IN de distinto tamaño)."""
+    return _LISTA_PARAMETROS.sub("?", _PARAMETRO.sub("?", sentencia))
+
+class ConsultasPeticion:
+    """Sentencias SQL lanzadas durante una petición: cuántas, tiempo total y la más lenta."""
+
+    def __init__(self):
+        self.sentencias = 0
+        self.tiempo = 0.0
+        self.mas_lenta: Tuple[float, str] = (0.0, "")
+        self.formas: Counter = Counter()
+
+    def registrar(self, sentencia: str, duracion: float):
+        self.sentencias += 1
+        self.tiempo += duracion
+        if duracion > self.mas_lenta[0]:
+            self.mas_lenta = (duracion, sentencia)
+        self.formas[forma_sentencia(sentencia)] += 1
+
+    def repetidas(self, umbral: int = SQL_REPEAT_THRESHOLD) -> List[Tuple[str, int]]:
+        if umbral <= 0:
+            return []
+        return [(forma, veces) for forma, veces in self.formas.most_common() if veces > umbral]
+
+# Contador de la petición en curso (lo pone el middleware); fuera de una petición es None
+consultas_peticion: ContextVar[Optional[ConsultasPeticion]] = ContextVar("consultas_peticion", default=None)
+
+# Funciones que reciben la duración de cada sentencia, haya petición o no (app.metricas
+# añade aquí su histograma "db"); comparten el mismo par de listeners que el contador
+observadores_sentencia: List[Callable[[float], None]] = []
+
+def _antes_sentencia(conn, cursor, statement, parameters, context, executemany):
+    if observadores_sentencia or consultas_peticion.get() is not None:
+        context._inicio_consulta = time.perf_counter()
+
+def _despues_sentencia(conn, cursor, statement, parameters, context, executemany):
+    inicio = getattr(context, "_inicio_consulta", None)
+    if inicio is None:
+        return
+    duracion = time.perf_counter() - inicio
+    consultas = consultas_peticion.get()
+    if consultas is not None:
+        consultas.registrar(statement, duracion)
+    for observador in observadores_sentencia:
+        observador(duracion)
+
+for _motor in (engine, async_engine.sync_engine):
+    event.listen(_motor, "before_cursor_execute", _antes_sentencia)
+    event.listen(_motor, "after_cursor_execute", _despues_sentencia)
+
+def configuracion_efectiva() -> dict:
+    """Configuración real del motor síncrono, leída de una conexión (para el log de arranque)."""
+    configuracion = {
+        "url": make_url(SQLALCHEMY_DATABASE_URL).render_as_string(hide_password=True),
+        "pool": engine.pool.status(),
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+    if _es_sqlite(SQLALCHEMY_DATABASE_URL):
+        with engine.connect() as conexion:
+            for nombre in SQLITE_PRAGMAS:
+                configuracion[nombre] = conexion.exec_driver_sql(f"PRAGMA {nombre}").scalar()
+    return configuracion
+
 Base = declarative_base()
 
 def get_db():
@@ -15,4 +162,7 @@ def get_db():
         yield db
     finally:
         db.close()
-        
\ No newline at end of file
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
@@ -0,0 +1,163 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+from collections import deque
+from typing import List, Optional
+
+from app import cambios
+from app.database import AsyncSessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Eventos en cola por cliente antes de desconectarlo, eventos recientes que se conservan
+# para reenviarlos al reconectar (Last-Event-ID), segundos entre latidos y segundos entre
+# lecturas del registro de cambios mientras haya clientes conectados
+EVENTOS_COLA_CLIENTE = int(os.getenv("EVENTOS_COLA_CLIENTE", 256))
+EVENTOS_HISTORIAL = int(os.getenv("EVENTOS_HISTORIAL", 1000))
+EVENTOS_LATIDO = float(os.getenv("EVENTOS_LATIDO", 15))
+EVENTOS_SONDEO = float(os.getenv("EVENTOS_SONDEO", 0.5))
+
+# Versión del registro de cambios cuando se leyó el tablero: el cliente se suscribe desde ahí
+ULTIMO_EVENTO_HEADER = "X-Ultimo-Evento"
+
+
+def reserva_compacta(reserva) -> dict:
+    """Delta de una reserva para el tablero: los mismos campos que schemas.Reserva."""
+    return {
+        "id": reserva.id,
+        "pista_id": reserva.pista_id,
+        "dia": reserva.dia.isoformat() if reserva.dia else None,
+        "hora_inicio": reserva.hora_inicio.isoformat() if reserva.hora_inicio else None,
+        "hora_fin": reserva.hora_fin.isoformat() if reserva.hora_fin else None,
+        "individuales": reserva.individuales,
+        "jugadores": [
+            {"name": j.name, "apellido": j.apellido, "tipo_jugador": j.tipo_jugador}
+            for j in reserva.jugadores
+        ],
+    }
+
+
+class Suscripcion:
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        self.loop = loop
+        self.cola: asyncio.Queue = asyncio.Queue(maxsize=EVENTOS_COLA_CLIENTE)
+
+    def entregar(self, evento: Optional[tuple]):
+        # Se ejecuta en el bucle del cliente; None indica que el cliente va tan atrasado
+        # que se le desconecta (al reconectar pedirá lo que le falte o recargará el tablero)
+        try:
+            self.cola.put_nowait(evento)
+        except asyncio.QueueFull:
+            while not self.cola.empty():
+                self.cola.get_nowait()
+            self.cola.put_nowait(None)
+
+
+class BusEventos:
+    """Reparte a los clientes del flujo SSE los cambios de reservas del registro compartido.
+
+    Los eventos salen de app.cambios, así que cada worker reparte las escrituras de todos;
+    el id de cada evento es la versión del cambio, la misma en todos los workers. El registro
+    se sincroniza desde los hilos del threadpool (o desde sondear()) y cada suscriptor lee en
+    el bucle de eventos, así que la entrega pasa por call_soon_threadsafe. Los últimos
+    eventos se guardan para que un cliente que reconecta con Last-Event-ID reciba lo que se
+    perdió sin volver a pedir el tablero. Como los cambios de otros ámbitos también gastan
+    versiones, los ids no son consecutivos: el historial recuerda desde qué versión está
+    completo.
+    """
+
+    def __init__(self, historial: int = EVENTOS_HISTORIAL):
+        self._lock = threading.Lock()
+        self._suscripciones: List[Suscripcion] = []
+        self._historial: deque = deque(maxlen=historial)
+        # Versión a partir de la cual el historial tiene todos los eventos
+        self._cubre_desde = 0
+
+    @property
+    def ultimo_id(self) -> int:
+        return cambios.registro.version or 0
+
+    @property
+    def suscriptores(self) -> int:
+        return len(self._suscripciones)
+
+    def reiniciar(self, version: int):
+        with self._lock:
+            self._historial.clear()
+            self._cubre_desde = version
+
+    def aplicar(self, cambio: cambios.Cambio):
+        self.publicar((cambio.version, cambio.tipo, json.dumps(cambio.datos, ensure_ascii=False)))
+
+    def publicar(self, evento: tuple):
+        with self._lock:
+            if self._historial and evento[0] <= self._historial[-1][0]:
+                return
+            if len(self._historial) == self._historial.maxlen:
+                self._cubre_desde = self._historial[0][0]
+            self._historial.append(evento)
+            suscripciones = list(self._suscripciones)
+        for suscripcion in suscripciones:
+            try:
+                suscripcion.loop.call_soon_threadsafe(suscripcion.entregar, evento)
+            except RuntimeError:
+                # El bucle del cliente ya se ha cerrado
+                self.cancelar(suscripcion)
+
+    def suscribir(self) -> Suscripcion:
+        suscripcion = Suscripcion(asyncio.get_running_loop())
+        with self._lock:
+            self._suscripciones.append(suscripcion)
+        return suscripcion
+
+    def cancelar(self, suscripcion: Suscripcion):
+        with self._lock:
+            if suscripcion in self._suscripciones:
+                self._suscripciones.remove(suscripcion)
+
+    def desde(self, ultimo_id: int) -> Optional[List[tuple]]:
+        """Eventos posteriores a `ultimo_id`, o None si ya no están todos en el historial."""
+        with self._lock:
+            # Un id mayor que la versión sincronizada no sale de esta base de datos
+            if ultimo_id > self.ultimo_id or ultimo_id < self._cubre_desde:
+                return None
+            return [e for e in self._historial if e[0] > ultimo_id]
+
+    def estadisticas(self) -> dict:
+        with self._lock:
+            return {
+                "suscriptores": self.suscriptores,
+                "ultimo_id": self.ultimo_id,
+                "cubre_desde": self._cubre_desde,
+                "historial": len(self._historial)
+            }
+
+
+bus = BusEventos()
+cambios.registro.al_iniciar(lambda db, version: bus.reiniciar(version))
+cambios.registro.suscribir("reservas", bus.aplicar)
+
+
+async def sincronizar():
+    """Pone al día el registro de cambios (y con él el bus) con una sesión propia y breve."""
+    async with AsyncSessionLocal() as db:
+        await cambios.registro.sincronizar_async(db)
+
+
+async def sondear():
+    """Tarea de fondo de cada worker: trae los cambios de los demás mientras haya clientes."""
+    while True:
+        await asyncio.sleep(EVENTOS_SONDEO)
+        if not bus.suscriptores:
+            continue
+        try:
+            await sincronizar()
+        except Exception:
+            logger.exception("Error al leer el registro de cambios para el flujo de eventos")
+
+
+def formato_sse(evento: tuple) -> str:
+    evento_id, tipo, datos = evento
+    return f"id: {evento_id}\nevent: {tipo}\ndata: {datos}\n\n"
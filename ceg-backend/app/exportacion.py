@@ -0,0 +1,87 @@
+import csv
+import io
+import json
+from datetime import date
+from typing import Iterator, List, Optional
+
+from app import crud, catalogo, models
+from app.database import SessionLocal
+
+# Reservas que se leen de la base de datos en cada ida y vuelta del cursor
+TAMANO_LOTE = 1000
+
+COLUMNAS_CSV = [
+    "reserva_id", "dia", "hora_inicio", "hora_fin", "pista_id", "pista", "individuales",
+    "jugador", "apellido", "tipo_jugador"
+]
+
+TIPOS_CONTENIDO = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+
+def _iso(valor) -> Optional[str]:
+    return valor.isoformat() if valor is not None else None
+
+
+def _nombre_pista(db, pista_id: int) -> Optional[str]:
+    pista = catalogo.pistas.obtener(db, pista_id)
+    return pista.name if pista else None
+
+
+def _reserva_dict(db, reserva: models.Reserva) -> dict:
+    return {
+        "id": reserva.id,
+        "dia": _iso(reserva.dia),
+        "hora_inicio": _iso(reserva.hora_inicio),
+        "hora_fin": _iso(reserva.hora_fin),
+        "pista_id": reserva.pista_id,
+        "pista": _nombre_pista(db, reserva.pista_id),
+        "individuales": reserva.individuales,
+        "jugadores": [
+            {"name": j.name, "apellido": j.apellido, "tipo_jugador": j.tipo_jugador}
+            for j in reserva.jugadores
+        ],
+    }
+
+
+def _lineas_ndjson(db, lote: List[models.Reserva]) -> str:
+    return "".join(json.dumps(_reserva_dict(db, r), ensure_ascii=False) + "\n" for r in lote)
+
+
+def _lineas_csv(db, lote: List[models.Reserva]) -> str:
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer)
+    for reserva in lote:
+        base = [
+            reserva.id, _iso(reserva.dia), _iso(reserva.hora_inicio), _iso(reserva.hora_fin),
+            reserva.pista_id, _nombre_pista(db, reserva.pista_id), reserva.individuales
+        ]
+        # Una fila por jugador; una reserva sin jugadores sale igualmente con esas columnas vacías
+        jugadores = reserva.jugadores or [None]
+        for jugador in jugadores:
+            if jugador is None:
+                escritor.writerow(base + ["", "", ""])
+            else:
+                escritor.writerow(base + [jugador.name, jugador.apellido, jugador.tipo_jugador])
+    return buffer.getvalue()
+
+
+def exportar_reservas(formato: str, desde: Optional[date] = None, hasta: Optional[date] = None) -> Iterator[str]:
+    """Genera el export de reservas trozo a trozo, un trozo por lote.
+
+    Abre su propia sesión: el generador se consume mientras se envía la respuesta,
+    cuando la sesión de la dependencia get_db ya se ha cerrado.
+    """
+    serializar = _lineas_ndjson if formato == "ndjson" else _lineas_csv
+    db = SessionLocal()
+    try:
+        if formato == "csv":
+            buffer = io.StringIO()
+            csv.writer(buffer).writerow(COLUMNAS_CSV)
+            yield buffer.getvalue()
+        for lote in crud.iter_reservas(db, desde, hasta, TAMANO_LOTE):
+            yield serializar(db, lote)
+    finally:
+        db.close()
@@ -0,0 +1,334 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+from sqlalchemy import and_, delete, insert, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app import models
+from app.database import AsyncSessionLocal
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+
+# Respuestas guardadas en memoria, tiempo que se conservan (segundos) y tamaño máximo de cada una
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", 10000))
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL", 3600))
+IDEMPOTENCY_MAX_BODY = int(os.getenv("IDEMPOTENCY_MAX_BODY", 1024 * 1024))
+# Segundos que una petición en curso retiene su clave (si el worker muere, un reintento
+# posterior la puede ejecutar), segundos entre consultas de quien espera a una petición de
+# otro worker y cada cuántas claves nuevas se borran de la tabla las caducadas
+IDEMPOTENCY_LEASE = float(os.getenv("IDEMPOTENCY_LEASE", 60))
+IDEMPOTENCY_SONDEO = float(os.getenv("IDEMPOTENCY_SONDEO", 0.05))
+IDEMPOTENCY_PODA = int(os.getenv("IDEMPOTENCY_PODA", 1000))
+
+METODOS_IDEMPOTENTES = {"POST", "PUT", "PATCH", "DELETE"}
+
+# sha256 de la clave del cliente, el método, la ruta y Authorization (la clave primaria de la tabla)
+Clave = str
+
+_tabla = models.ClaveIdempotencia.__table__
+
+# Clave de la petición idempotente en curso; la pone el middleware y la lee confirmar()
+peticion_idempotente: ContextVar[Optional[Clave]] = ContextVar("peticion_idempotente", default=None)
+
+
+@dataclass
+class RespuestaGuardada:
+    status: int
+    headers: List[Tuple[bytes, bytes]]
+    cuerpo: bytes
+
+    @classmethod
+    def desde_fila(cls, fila) -> "RespuestaGuardada":
+        headers = [(k.encode("latin-1"), v.encode("latin-1")) for k, v in json.loads(fila.headers)]
+        return cls(fila.status, headers, fila.cuerpo)
+
+    def headers_json(self) -> str:
+        return json.dumps([(k.decode("latin-1"), v.decode("latin-1")) for k, v in self.headers])
+
+
+@dataclass
+class Entrada:
+    huella: str  # hash del cuerpo de la petición original
+    caduca: float = 0.0
+    respuesta: Optional[RespuestaGuardada] = None
+    terminada: asyncio.Event = field(default_factory=asyncio.Event)
+
+
+class AlmacenIdempotencia:
+    """Respuestas de las peticiones con cabecera Idempotency-Key.
+
+    La clave se reserva en la tabla idempotencia antes de ejecutar la petición, así que
+    vale para todos los workers: un reintento que llega a otro recibe la respuesta guardada
+    y uno que llega mientras la primera sigue en curso espera a que termine (consultando la
+    tabla cada IDEMPOTENCY_SONDEO segundos). Las escrituras de reservas marcan la clave como
+    confirmada en su propia transacción (confirmar()): si el worker muere antes de guardar
+    la respuesta, el reintento recibe un 409 en lugar de repetir la reserva. Solo se guardan
+    las respuestas definitivas (status < 500): tras un error del servidor sin nada confirmado
+    el reintento se ejecuta de nuevo.
+
+    Delante de la tabla hay una caché LRU en memoria con caducidad: los reintentos que llegan
+    al mismo worker no consultan la base de datos, y las peticiones con la misma clave que
+    coinciden en él esperan a la primera sin sondear. La caché se usa desde el bucle de
+    eventos, así que no hace falta lock.
+    """
+
+    def __init__(self, max_entradas: int = IDEMPOTENCY_CACHE_SIZE, ttl: float = IDEMPOTENCY_TTL,
+                 sesiones=AsyncSessionLocal):
+        self._entradas: "OrderedDict[Clave, Entrada]" = OrderedDict()
+        self.max_entradas = max_entradas
+        self.ttl = ttl
+        self.sesiones = sesiones
+        self.repetidas = 0
+        self.agrupadas = 0
+        self.ejecutadas = 0
+        self.reclamadas = 0
+
+    def obtener(self, clave: Clave) -> Optional[Entrada]:
+        entrada = self._entradas.get(clave)
+        if entrada is None:
+            return None
+        if entrada.respuesta is not None and entrada.caduca < time.monotonic():
+            del self._entradas[clave]
+            return None
+        self._entradas.move_to_end(clave)
+        return entrada
+
+    def empezar(self, clave: Clave, huella: str) -> Entrada:
+        entrada = Entrada(huella=huella)
+        self._entradas[clave] = entrada
+        self.ejecutadas += 1
+        self._recortar()
+        return entrada
+
+    def terminar(self, clave: Clave, entrada: Entrada, respuesta: Optional[RespuestaGuardada]):
+        if respuesta is None or self.ttl <= 0:
+            # No se guarda: quien esté esperando ejecutará la petición por su cuenta
+            if self._entradas.get(clave) is entrada:
+                del self._entradas[clave]
+        else:
+            entrada.respuesta = respuesta
+            entrada.caduca = time.monotonic() + self.ttl
+        entrada.terminada.set()
+
+    async def reclamar(self, clave: Clave, huella: str):
+        """Reserva la clave en la tabla para esta petición y devuelve None; si ya la tiene
+        otra (en curso o terminada), devuelve su fila."""
+        async with self.sesiones() as db:
+            while True:
+                ahora = datetime.utcnow()
+                await db.execute(delete(_tabla).where(_tabla.c.clave == clave, self._caducadas(ahora)))
+                try:
+                    await db.execute(insert(_tabla).values(
+                        clave=clave, huella=huella, confirmada=False,
+                        caduca=ahora + timedelta(seconds=IDEMPOTENCY_LEASE)
+                    ))
+                    self.reclamadas += 1
+                    if IDEMPOTENCY_PODA > 0 and self.reclamadas % IDEMPOTENCY_PODA == 0:
+                        await db.execute(delete(_tabla).where(self._caducadas(ahora)))
+                    await db.commit()
+                    return None
+                except IntegrityError:
+                    await db.rollback()
+                fila = (await db.execute(select(_tabla).where(_tabla.c.clave == clave))).first()
+                await db.commit()
+                if fila is not None:
+                    return fila
+                # La otra petición ha fallado y ha soltado la clave entre medias: se vuelve a intentar
+
+    async def guardar(self, clave: Clave, respuesta: RespuestaGuardada):
+        async with self.sesiones() as db:
+            await db.execute(update(_tabla).where(_tabla.c.clave == clave).values(
+                status=respuesta.status, headers=respuesta.headers_json(), cuerpo=respuesta.cuerpo,
+                caduca=datetime.utcnow() + timedelta(seconds=self.ttl)
+            ))
+            await db.commit()
+
+    async def liberar(self, clave: Clave):
+        """Suelta la clave de una petición que no ha dejado respuesta; si llegó a confirmar
+        su escritura, la fila se queda (sin respuesta) hasta que caduque."""
+        async with self.sesiones() as db:
+            await db.execute(delete(_tabla).where(_tabla.c.clave == clave, _tabla.c.confirmada.is_(False)))
+            await db.execute(update(_tabla).where(_tabla.c.clave == clave).values(caduca=datetime.utcnow()))
+            await db.commit()
+
+    def _caducadas(self, ahora: datetime):
+        # Las respuestas y las peticiones sin confirmar caducan a su hora; una confirmada que
+        # no llegó a guardar la respuesta se conserva otro TTL para seguir rechazando reintentos
+        return or_(
+            and_(_tabla.c.caduca < ahora, or_(_tabla.c.status.is_not(None), _tabla.c.confirmada.is_(False))),
+            _tabla.c.caduca < ahora - timedelta(seconds=self.ttl)
+        )
+
+    def estadisticas(self) -> dict:
+        return {
+            "entradas": len(self._entradas),
+            "max_entradas": self.max_entradas,
+            "ttl": self.ttl,
+            "ejecutadas": self.ejecutadas,
+            "reclamadas": self.reclamadas,
+            "repetidas": self.repetidas,
+            "agrupadas": self.agrupadas
+        }
+
+    def _recortar(self):
+        # Se descartan las más antiguas ya terminadas; las que están en curso se conservan
+        for clave in list(self._entradas):
+            if len(self._entradas) <= self.max_entradas:
+                break
+            if self._entradas[clave].respuesta is not None:
+                del self._entradas[clave]
+
+
+almacen = AlmacenIdempotencia()
+
+
+def confirmar(db: Session):
+    """Marca la petición idempotente en curso (si la hay) como aplicada, dentro de la
+    transacción de la escritura: se confirma o se deshace con ella."""
+    clave = peticion_idempotente.get()
+    if clave is not None:
+        db.execute(update(_tabla).where(_tabla.c.clave == clave).values(confirmada=True))
+
+
+def clave_peticion(clave_cliente: str, metodo: str, ruta: str, autorizacion: Optional[str]) -> Clave:
+    # La misma clave de otro usuario (u otra ruta) es otra petición
+    return hashlib.sha256("\n".join((clave_cliente, metodo, ruta, autorizacion or "")).encode()).hexdigest()
+
+
+def _cabecera(scope, nombre: bytes) -> Optional[str]:
+    for clave, valor in scope["headers"]:
+        if clave == nombre:
+            return valor.decode("latin-1")
+    return None
+
+
+async def _respuesta_json(send, status: int, detalle: str):
+    cuerpo = ('{"detail": "%s"}' % detalle).encode()
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(cuerpo)).encode())]})
+    await send({"type": "http.response.body", "body": cuerpo})
+
+
+async def _reproducir(send, respuesta: RespuestaGuardada):
+    await send({"type": "http.response.start", "status": respuesta.status,
+                "headers": respuesta.headers + [(REPLAYED_HEADER.lower().encode(), b"true")]})
+    await send({"type": "http.response.body", "body": respuesta.cuerpo})
+
+
+class IdempotenciaMiddleware:
+    """Middleware ASGI que aplica el almacén a las peticiones de modificación con Idempotency-Key."""
+
+    def __init__(self, app, almacen: AlmacenIdempotencia = almacen):
+        self.app = app
+        self.almacen = almacen
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in METODOS_IDEMPOTENTES:
+            return await self.app(scope, receive, send)
+        clave_cliente = _cabecera(scope, IDEMPOTENCY_HEADER.lower().encode())
+        if not clave_cliente or self.almacen.max_entradas <= 0:
+            return await self.app(scope, receive, send)
+
+        # El cuerpo se lee entero para calcular su huella y se vuelve a entregar a la aplicación
+        trozos = []
+        while True:
+            mensaje = await receive()
+            if mensaje["type"] == "http.disconnect":
+                return
+            trozos.append(mensaje.get("body", b""))
+            if not mensaje.get("more_body", False):
+                break
+        cuerpo = b"".join(trozos)
+        huella = hashlib.sha256(cuerpo).hexdigest()
+        clave = clave_peticion(clave_cliente, scope["method"], scope["path"], _cabecera(scope, b"authorization"))
+
+        while True:
+            entrada = self.almacen.obtener(clave)
+            if entrada is None:
+                break
+            if entrada.huella != huella:
+                return await _respuesta_json(send, 422, "Idempotency-Key ya usada con otra petición")
+            if entrada.respuesta is not None:
+                self.almacen.repetidas += 1
+                return await _reproducir(send, entrada.respuesta)
+            # Hay una petición con la misma clave en curso en este worker: se espera a su resultado
+            self.almacen.agrupadas += 1
+            await entrada.terminada.wait()
+
+        entrada = self.almacen.empezar(clave, huella)
+        respuesta = None
+        try:
+            fila = await self.almacen.reclamar(clave, huella)
+            if fila is not None and fila.status is None and fila.caduca >= datetime.utcnow():
+                # La está ejecutando otro worker: se espera a que guarde su respuesta
+                self.almacen.agrupadas += 1
+                while fila is not None and fila.status is None and fila.caduca >= datetime.utcnow():
+                    await asyncio.sleep(IDEMPOTENCY_SONDEO)
+                    fila = await self.almacen.reclamar(clave, huella)
+            if fila is not None:
+                if fila.huella != huella:
+                    return await _respuesta_json(send, 422, "Idempotency-Key ya usada con otra petición")
+                if fila.status is None:
+                    return await _respuesta_json(send, 409, "La petición con esta Idempotency-Key ya se aplicó, pero su respuesta no se guardó")
+                respuesta = RespuestaGuardada.desde_fila(fila)
+                self.almacen.repetidas += 1
+                return await _reproducir(send, respuesta)
+            respuesta = await self._ejecutar(scope, receive, send, clave, cuerpo)
+        finally:
+            self.almacen.terminar(clave, entrada, respuesta)
+
+    async def _ejecutar(self, scope, receive, send, clave: Clave, cuerpo: bytes) -> Optional[RespuestaGuardada]:
+        entregado = False
+
+        async def receive_repetido():
+            nonlocal entregado
+            if not entregado:
+                entregado = True
+                return {"type": "http.request", "body": cuerpo, "more_body": False}
+            return await receive()
+
+        inicio = {}
+        partes: List[bytes] = []
+        tamano = 0
+
+        async def send_capturado(mensaje):
+            nonlocal tamano
+            if mensaje["type"] == "http.response.start":
+                inicio.update(mensaje)
+            elif mensaje["type"] == "http.response.body":
+                tamano += len(mensaje.get("body", b""))
+                if tamano <= IDEMPOTENCY_MAX_BODY:
+                    partes.append(mensaje.get("body", b""))
+            await send(mensaje)
+
+        respuesta = None
+        token = peticion_idempotente.set(clave)
+        try:
+            await self.app(scope, receive_repetido, send_capturado)
+            status = inicio.get("status", 500)
+            if status < 500 and tamano <= IDEMPOTENCY_MAX_BODY and self.almacen.ttl > 0:
+                respuesta = RespuestaGuardada(status, list(inicio.get("headers", [])), b"".join(partes))
+        finally:
+            peticion_idempotente.reset(token)
+            # La respuesta ya se ha enviado: un fallo aquí solo afecta a los reintentos
+            try:
+                if respuesta is not None:
+                    await self.almacen.guardar(clave, respuesta)
+                else:
+                    await self.almacen.liberar(clave)
+            except Exception:
+                logger.exception("No se pudo guardar la respuesta de la petición idempotente")
+        return respuesta
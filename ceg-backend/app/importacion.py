@@ -0,0 +1,78 @@
+import csv
+import io
+import json
+import logging
+from typing import List
+
+from fastapi import HTTPException
+from pydantic import ValidationError
+from sqlalchemy.orm import Session
+
+from app import crud, schemas
+
+logger = logging.getLogger(__name__)
+
+# Filas que se insertan en cada executemany (y en cada commit)
+TAMANO_LOTE = 500
+
+
+def leer_filas(contenido: bytes, content_type: str) -> List[dict]:
+    """Convierte el cuerpo de la petición (CSV con cabecera o array JSON) en una lista de dicts."""
+    try:
+        texto = contenido.decode("utf-8-sig")
+        if "csv" in content_type:
+            return [dict(fila) for fila in csv.DictReader(io.StringIO(texto))]
+        filas = json.loads(texto)
+    except (UnicodeDecodeError, ValueError, csv.Error) as e:
+        raise HTTPException(status_code=400, detail=f"No se pudo leer el fichero: {str(e)}")
+    if not isinstance(filas, list) or not all(isinstance(f, dict) for f in filas):
+        raise HTTPException(status_code=400, detail="Se esperaba un array JSON de socios")
+    return filas
+
+
+def _error_validacion(e: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(c) for c in err['loc'])}: {err['msg']}" for err in e.errors())
+
+
+def importar_socios(db: Session, filas: List[dict]) -> schemas.ResultadoImportacion:
+    resultado = schemas.ResultadoImportacion()
+    resultados: List[schemas.ResultadoFilaImportacion] = []
+    validos = []  # (resultado de la fila, socio)
+
+    for numero, fila in enumerate(filas, start=1):
+        # En CSV las celdas vacías llegan como "", no como ausentes
+        datos = {k: v for k, v in fila.items() if k and v not in ("", None)}
+        r = schemas.ResultadoFilaImportacion(fila=numero, email=datos.get("email"), estado="fallido")
+        resultados.append(r)
+        try:
+            validos.append((r, schemas.SocioCreate(**datos)))
+        except ValidationError as e:
+            r.detalle = _error_validacion(e)
+
+    # Duplicados: primero contra la base de datos (una consulta), después dentro del propio fichero
+    registrados = crud.get_emails_registrados(db, {s.email for _, s in validos if s.email})
+    vistos = set()
+    nuevos = []
+    for r, socio in validos:
+        if socio.email and (socio.email in registrados or socio.email in vistos):
+            r.estado = "omitido"
+            r.detalle = "Email ya registrado" if socio.email in registrados else "Email repetido en el fichero"
+            continue
+        if socio.email:
+            vistos.add(socio.email)
+        nuevos.append((r, socio))
+
+    ids = crud.create_socios_bulk(db, [socio for _, socio in nuevos], TAMANO_LOTE)
+    for (r, _), socio_id in zip(nuevos, ids):
+        if socio_id is None:
+            r.detalle = "Error al insertar el lote"
+        else:
+            r.estado = "creado"
+            r.id = socio_id
+
+    resultado.filas = resultados
+    resultado.creados = sum(1 for r in resultados if r.estado == "creado")
+    resultado.omitidos = sum(1 for r in resultados if r.estado == "omitido")
+    resultado.fallidos = sum(1 for r in resultados if r.estado == "fallido")
+    logger.info(f"Importación de socios: {resultado.creados} creados, {resultado.omitidos} omitidos, {resultado.fallidos} fallidos")
+    return resultado
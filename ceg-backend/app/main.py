@@ -1,6 +1,13 @@
-from fastapi import FastAPI, Depends
+from fastapi import FastAPI, Depends, Request, Response
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from app.auth import get_current_admin, create_access_token, router as auth_router
+from app.database import SessionLocal, async_engine, configuracion_efectiva
+from app import crud, cambios, security, paginacion, idempotencia, eventos, serializacion, metricas
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
 
 app = FastAPI()
 
@@ -10,14 +17,24 @@ origins = [
     "http://localhost:8080",  # Otras URLs que puedan necesitar acceso
 ]
 
+# Reintentos con Idempotency-Key (va por dentro de CORS para que las respuestas repetidas
+# también lleven sus cabeceras)
+app.add_middleware(idempotencia.IdempotenciaMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[paginacion.NEXT_CURSOR_HEADER, idempotencia.REPLAYED_HEADER, "ETag", eventos.ULTIMO_EVENTO_HEADER],
 )
 
+# Sentencias SQL por petición (Server-Timing) y métricas por ruta (la capa más externa,
+# para medir también CORS y las respuestas repetidas)
+app.add_middleware(metricas.ConsultasMiddleware)
+app.add_middleware(metricas.MetricasMiddleware)
+
 # Importar los routers individualmente
 from app.routers.admin import router as admin_router
 from app.routers.socios import socio_router, admin_socio_router
@@ -40,12 +57,39 @@ app.include_router(jugadores_router, prefix="/jugadores")
 app.include_router(pistas_router, prefix="/pistas")
 app.include_router(reservas_router, prefix="/reservas", tags=["reservas"])
 
+# Solo existe con METRICS_ENABLED (ver app.metricas)
+if metricas.METRICS_ENABLED:
+    @app.get("/metrics", include_in_schema=False)
+    def metrics():
+        return Response(content=metricas.registro.exponer(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.exception_handler(security.PoolHashSaturado)
+async def pool_hash_saturado_handler(request: Request, exc: security.PoolHashSaturado):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Servidor ocupado, inténtalo de nuevo en unos segundos"},
+        headers={"Retry-After": "1"}
+    )
+
+@app.exception_handler(crud.ReservaSolapada)
+async def reserva_solapada_handler(request: Request, exc: crud.ReservaSolapada):
+    # Otra petición ha ocupado la pista entre la validación y el commit
+    return JSONResponse(status_code=409, content={"detail": str(exc)})
+
 @app.on_event("startup")
 async def startup_event():
     # Código para inicializar la base de datos, etc.
-    pass
+    logger.info(f"Base de datos: {configuracion_efectiva()}")
+    serializacion.preparar()
+    with SessionLocal() as db:
+        # Carga las cachés del proceso (índice de ocupación...) desde la versión actual
+        cambios.registro.sincronizar(db)
+    # Cada worker lee los cambios de los demás para sus clientes del flujo SSE
+    app.state.sondeo_eventos = asyncio.create_task(eventos.sondear())
 
 @app.on_event("shutdown")
 async def shutdown_event():
     # Código para limpiar recursos, etc.
-    pass
\ No newline at end of file
+    app.state.sondeo_eventos.cancel()
+    await async_engine.dispose()
+    security.pool_hash.cerrar()
\ No newline at end of file
@@ -0,0 +1,240 @@
+import bisect
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import lru_cache
+from typing import Dict, List, Tuple
+
+from starlette.routing import Match
+
+from app.database import ConsultasPeticion, consultas_peticion, observadores_sentencia
+
+logger = logging.getLogger(__name__)
+
+# Desactivadas por defecto: /metrics no lleva autenticación, así que solo debe activarse
+# donde el puerto no sea accesible desde fuera (la red interna del scraper)
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "false").lower() in ("1", "true", "yes")
+# Límites superiores (segundos) de los cubos de los histogramas de latencia
+METRICS_BUCKETS = tuple(sorted(
+    float(b) for b in os.getenv("METRICS_BUCKETS", "0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10").split(",")
+))
+
+# Ruta que se usa para las peticiones que no casan con ninguna (así un escaneo de URLs
+# no crea una serie por cada ruta inventada)
+SIN_RUTA = "sin_ruta"
+
+Etiquetas = Tuple[Tuple[str, str], ...]
+
+
+class Histograma:
+    def __init__(self, cubos: Tuple[float, ...] = METRICS_BUCKETS):
+        self.cubos = cubos
+        self.cuentas = [0] * (len(cubos) + 1)  # el último es +Inf
+        self.suma = 0.0
+        self.total = 0
+
+    def observar(self, valor: float):
+        self.cuentas[bisect.bisect_left(self.cubos, valor)] += 1
+        self.suma += valor
+        self.total += 1
+
+
+class RegistroMetricas:
+    """Contadores, indicadores e histogramas en memoria, en formato de texto de Prometheus.
+
+    Las peticiones se registran en el bucle de eventos, pero las secciones (validación, BD,
+    serialización) se miden en los hilos del threadpool, así que todo pasa por un lock.
+    Como el resto de cachés, es por proceso: con varios workers cada uno expone lo suyo.
+    """
+
+    def __init__(self, cubos: Tuple[float, ...] = METRICS_BUCKETS):
+        self._lock = threading.Lock()
+        self.cubos = cubos
+        self.peticiones: Dict[Etiquetas, int] = defaultdict(int)
+        self.en_curso: Dict[Etiquetas, int] = defaultdict(int)
+        self.latencias: Dict[Etiquetas, Histograma] = {}
+        self.secciones: Dict[Etiquetas, Histograma] = {}
+
+    def _observar(self, histogramas: Dict[Etiquetas, Histograma], etiquetas: Etiquetas, valor: float):
+        histograma = histogramas.get(etiquetas)
+        if histograma is None:
+            histograma = histogramas[etiquetas] = Histograma(self.cubos)
+        histograma.observar(valor)
+
+    def empezar_peticion(self, metodo: str, ruta: str):
+        with self._lock:
+            self.en_curso[(("method", metodo), ("route", ruta))] += 1
+
+    def terminar_peticion(self, metodo: str, ruta: str, estado: int, duracion: float):
+        with self._lock:
+            self.en_curso[(("method", metodo), ("route", ruta))] -= 1
+            self.peticiones[(("method", metodo), ("route", ruta), ("status", str(estado)))] += 1
+            self._observar(self.latencias, (("method", metodo), ("route", ruta)), duracion)
+
+    def observar_seccion(self, seccion: str, duracion: float):
+        with self._lock:
+            self._observar(self.secciones, (("section", seccion),), duracion)
+
+    def exponer(self) -> str:
+        lineas: List[str] = []
+        with self._lock:
+            _contador(lineas, "http_requests_total", "Peticiones HTTP atendidas", self.peticiones)
+            _indicador(lineas, "http_requests_in_flight", "Peticiones HTTP en curso", self.en_curso)
+            _histogramas(lineas, "http_request_duration_seconds", "Latencia de las peticiones HTTP", self.latencias)
+            _histogramas(lineas, "app_section_duration_seconds",
+                         "Tiempo en las secciones de validación, BD y serialización", self.secciones)
+        return "\n".join(lineas) + "\n"
+
+
+def _formato_etiquetas(etiquetas: Etiquetas) -> str:
+    if not etiquetas:
+        return ""
+    pares = ",".join(
+        '%s="%s"' % (nombre, valor.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for nombre, valor in etiquetas
+    )
+    return "{" + pares + "}"
+
+
+def _valor(numero: float) -> str:
+    return repr(float(numero)) if isinstance(numero, float) else str(numero)
+
+
+def _contador(lineas: List[str], nombre: str, ayuda: str, valores: Dict[Etiquetas, int]):
+    lineas += [f"# HELP {nombre} {ayuda}", f"# TYPE {nombre} counter"]
+    lineas += [f"{nombre}{_formato_etiquetas(e)} {v}" for e, v in sorted(valores.items())]
+
+
+def _indicador(lineas: List[str], nombre: str, ayuda: str, valores: Dict[Etiquetas, int]):
+    lineas += [f"# HELP {nombre} {ayuda}", f"# TYPE {nombre} gauge"]
+    lineas += [f"{nombre}{_formato_etiquetas(e)} {v}" for e, v in sorted(valores.items())]
+
+
+def _histogramas(lineas: List[str], nombre: str, ayuda: str, histogramas: Dict[Etiquetas, Histograma]):
+    lineas += [f"# HELP {nombre} {ayuda}", f"# TYPE {nombre} histogram"]
+    for etiquetas, histograma in sorted(histogramas.items()):
+        acumulado = 0
+        for limite, cuenta in zip(histograma.cubos + (float("inf"),), histograma.cuentas):
+            acumulado += cuenta
+            le = "+Inf" if limite == float("inf") else _valor(limite)
+            lineas.append(f"{nombre}_bucket{_formato_etiquetas(etiquetas + (('le', le),))} {acumulado}")
+        lineas.append(f"{nombre}_sum{_formato_etiquetas(etiquetas)} {_valor(histograma.suma)}")
+        lineas.append(f"{nombre}_count{_formato_etiquetas(etiquetas)} {histograma.total}")
+
+
+registro = RegistroMetricas()
+
+
+@contextmanager
+def seccion(nombre: str):
+    """Mide el bloque (o la función, usado como decorador) como sección `nombre`."""
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        if METRICS_ENABLED:
+            registro.observar_seccion(nombre, time.perf_counter() - inicio)
+
+
+def _observar_sentencia(duracion: float):
+    registro.observar_seccion("db", duracion)
+
+
+# Cada sentencia SQL se mide como sección "db" con los listeners de app.database
+if METRICS_ENABLED:
+    observadores_sentencia.append(_observar_sentencia)
+
+
+def _buscar_plantilla(rutas, metodo: str, ruta: str) -> str:
+    alcance = {"type": "http", "method": metodo, "path": ruta, "root_path": ""}
+    parcial = None
+    for route in rutas:
+        match, _ = route.matches(alcance)
+        if match == Match.FULL:
+            return route.path
+        if match == Match.PARTIAL and parcial is None:
+            parcial = route.path
+    return parcial or SIN_RUTA
+
+
+class MetricasMiddleware:
+    """Middleware ASGI que cuenta las peticiones por ruta y estado y mide su latencia."""
+
+    def __init__(self, app, registro: RegistroMetricas = registro):
+        self.app = app
+        self.registro = registro
+        # Plantilla de la ruta ("/reservas/{reserva_id}") para que las etiquetas no dependan
+        # de los ids; se busca antes de atender la petición para poder contarla como en curso
+        self._plantilla = lru_cache(maxsize=4096)(self._buscar_plantilla)
+        self._rutas = None
+
+    def _buscar_plantilla(self, metodo: str, ruta: str) -> str:
+        return _buscar_plantilla(self._rutas, metodo, ruta)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            return await self.app(scope, receive, send)
+        metodo = scope["method"]
+        if self._rutas is None:
+            self._rutas = scope["app"].router.routes
+        ruta = self._plantilla(metodo, scope["path"])
+        estado = 500
+
+        async def send_medido(mensaje):
+            nonlocal estado
+            if mensaje["type"] == "http.response.start":
+                estado = mensaje["status"]
+            await send(mensaje)
+
+        self.registro.empezar_peticion(metodo, ruta)
+        inicio = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_medido)
+        finally:
+            self.registro.terminar_peticion(metodo, ruta, estado, time.perf_counter() - inicio)
+
+
+def server_timing(consultas: ConsultasPeticion) -> str:
+    return (f'db;desc="{consultas.sentencias} sentencias";dur={consultas.tiempo * 1000:.1f}, '
+            f'db-max;dur={consultas.mas_lenta[0] * 1000:.1f}')
+
+
+class ConsultasMiddleware:
+    """Middleware ASGI que atribuye a cada petición las sentencias SQL que lanza.
+
+    Las cuenta a través de la ContextVar de app.database (que también llega a los hilos
+    del threadpool), añade el resultado en la cabecera Server-Timing y avisa en el log si
+    la misma forma de sentencia se repite más de SQL_REPEAT_THRESHOLD veces (N+1). En las
+    respuestas en streaming la cabecera solo cuenta lo ejecutado antes de empezar a enviar.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        consultas = ConsultasPeticion()
+        token = consultas_peticion.set(consultas)
+
+        async def send_medido(mensaje):
+            if mensaje["type"] == "http.response.start" and consultas.sentencias:
+                cabeceras = list(mensaje.get("headers", []))
+                cabeceras.append((b"server-timing", server_timing(consultas).encode("latin-1", "replace")))
+                mensaje = {**mensaje, "headers": cabeceras}
+            await send(mensaje)
+
+        try:
+            await self.app(scope, receive, send_medido)
+        finally:
+            consultas_peticion.reset(token)
+            peticion = f"{scope['method']} {scope['path']}"
+            if consultas.sentencias:
+                duracion, sentencia = consultas.mas_lenta
+                logger.debug(f"{peticion}: {consultas.sentencias} sentencias en {consultas.tiempo * 1000:.1f} ms; "
+                             f"la más lenta ({duracion * 1000:.1f} ms): {sentencia[:200]}")
+            for forma, veces in consultas.repetidas():
+                logger.warning(f"Posible N+1 en {peticion}: la misma sentencia {veces} veces: {forma[:200]}")
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime, Date, Time
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime, Date, Time, Index, LargeBinary, DDL, event
 from sqlalchemy.orm import relationship
 from app.database import Base
 
@@ -23,16 +23,24 @@ class Socio(Base):
     type = Column(String)
     hashed_password = Column(String)
 
+    __table_args__ = (
+        Index("ix_socios_name_lastname", "name", "lastname"),
+    )
+
 class Jugador(Base):
     __tablename__ = "jugadores"
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, index=True)
     apellido = Column(String, index=True)
     tipo_jugador = Column(String)
-    reserva_id = Column(Integer, ForeignKey('reservas.id', ondelete="CASCADE"))
+    reserva_id = Column(Integer, ForeignKey('reservas.id', ondelete="CASCADE"), index=True)
     
     reserva = relationship("Reserva", back_populates="jugadores")
 
+    __table_args__ = (
+        Index("ix_jugadores_name_apellido_reserva", "name", "apellido", "reserva_id"),
+    )
+
 class Pista(Base):
     __tablename__ = "pistas"
     id = Column(Integer, primary_key=True, index=True)
@@ -54,4 +62,98 @@ class Reserva(Base):
 
     # Relaciones
     pista = relationship("Pista", back_populates="reservas")
-    jugadores = relationship("Jugador", back_populates="reserva", cascade="all, delete-orphan")
\ No newline at end of file
+    jugadores = relationship("Jugador", back_populates="reserva", cascade="all, delete-orphan")
+
+    # Índices para los solapamientos de pista y el tablero de reservas
+    __table_args__ = (
+        Index("ix_reservas_pista_dia_horas", "pista_id", "dia", "hora_inicio", "hora_fin"),
+        Index("ix_reservas_dia_horas", "dia", "hora_inicio", "hora_fin"),
+    )
+
+# Registro de cambios que comparten los workers (ver app.cambios). Cada escritura apunta sus
+# cambios en la misma transacción; la versión sale de la fila única de contador_cambios, que
+# al actualizarse bloquea a los demás escritores, así que las versiones quedan en orden de commit
+class ContadorCambios(Base):
+    __tablename__ = "contador_cambios"
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+class Cambio(Base):
+    __tablename__ = "cambios"
+    version = Column(Integer, primary_key=True, autoincrement=False)
+    ambito = Column(String, nullable=False)  # "reservas", "pistas", "socios", "admins"
+    tipo = Column(String, nullable=False)  # "creada", "actualizada", "eliminada"...
+    clave = Column(Integer, nullable=True)  # id del objeto modificado
+    datos = Column(String, nullable=True)  # JSON
+    creado = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        Index("ix_cambios_ambito_version", "ambito", "version"),
+    )
+
+event.listen(ContadorCambios.__table__, "after_create", DDL("INSERT INTO contador_cambios (id, version) VALUES (1, 0)"))
+
+# Peticiones con Idempotency-Key (ver app.idempotencia). La fila se reserva antes de ejecutar
+# la petición, la escritura de la reserva la marca como confirmada en su misma transacción y
+# al terminar guarda la respuesta; caduca es el plazo de la petición en curso o, ya
+# terminada, el de la respuesta guardada
+class ClaveIdempotencia(Base):
+    __tablename__ = "idempotencia"
+    clave = Column(String, primary_key=True)  # sha256 de la clave, el método, la ruta y Authorization
+    huella = Column(String, nullable=False)  # sha256 del cuerpo de la petición
+    status = Column(Integer, nullable=True)  # NULL mientras la petición está en curso
+    headers = Column(String, nullable=True)  # JSON
+    cuerpo = Column(LargeBinary, nullable=True)
+    confirmada = Column(Boolean, nullable=False, default=False)
+    caduca = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        Index("ix_idempotencia_caduca", "caduca"),
+    )
+
+# Restricción que impide dos reservas solapadas en la misma pista. La crea la migración
+# a3c9e1f47b20 y, con el mismo DDL, Base.metadata.create_all al crear la tabla reservas.
+# SQLite no tiene restricciones de exclusión: dos triggers rechazan la fila con el nombre
+# de la restricción como mensaje (ver crud.es_solapamiento)
+RESTRICCION_SOLAPAMIENTO = "reservas_pista_sin_solapamiento"
+
+_DDL_SOLAPAMIENTO = {
+    "sqlite": [
+        f"""
+        CREATE TRIGGER {RESTRICCION_SOLAPAMIENTO}_insert
+        BEFORE INSERT ON reservas
+        WHEN EXISTS (
+            SELECT 1 FROM reservas
+            WHERE pista_id = NEW.pista_id AND dia = NEW.dia
+              AND hora_inicio < NEW.hora_fin AND hora_fin > NEW.hora_inicio
+        )
+        BEGIN
+            SELECT RAISE(ABORT, '{RESTRICCION_SOLAPAMIENTO}');
+        END
+        """,
+        f"""
+        CREATE TRIGGER {RESTRICCION_SOLAPAMIENTO}_update
+        BEFORE UPDATE OF pista_id, dia, hora_inicio, hora_fin ON reservas
+        WHEN EXISTS (
+            SELECT 1 FROM reservas
+            WHERE pista_id = NEW.pista_id AND dia = NEW.dia
+              AND hora_inicio < NEW.hora_fin AND hora_fin > NEW.hora_inicio
+              AND id <> NEW.id
+        )
+        BEGIN
+            SELECT RAISE(ABORT, '{RESTRICCION_SOLAPAMIENTO}');
+        END
+        """,
+    ],
+    "postgresql": [
+        "CREATE EXTENSION IF NOT EXISTS btree_gist",
+        f"""
+        ALTER TABLE reservas ADD CONSTRAINT {RESTRICCION_SOLAPAMIENTO}
+        EXCLUDE USING gist (pista_id WITH =, tsrange(dia + hora_inicio, dia + hora_fin) WITH &&)
+        """,
+    ],
+}
+
+for _dialecto, _sentencias in _DDL_SOLAPAMIENTO.items():
+    for _sentencia in _sentencias:
+        event.listen(Reserva.__table__, "after_create", DDL(_sentencia).execute_if(dialect=_dialecto))
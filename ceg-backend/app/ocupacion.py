@@ -0,0 +1,204 @@
+from datetime import date, time
+from typing import Dict, Iterable, List, Optional, Tuple
+import threading
+import logging
+
+from sqlalchemy.orm import Session
+from app import models, cambios
+
+logger = logging.getLogger(__name__)
+
+MINUTOS_DIA = 24 * 60
+
+# Intervalo ocupado en una pista: (hora_inicio, hora_fin, reserva_id)
+Intervalo = Tuple[time, time, int]
+# Franja de la rejilla de disponibilidad: (minuto_inicio, minuto_fin, reserva_id o None)
+Franja = Tuple[int, int, Optional[int]]
+
+
+def minuto(hora: time, redondear_arriba: bool = False) -> int:
+    """Minuto del día (0-1440) de una hora; con redondear_arriba los segundos cuentan como un minuto más."""
+    minutos = hora.hour * 60 + hora.minute
+    if redondear_arriba and (hora.second or hora.microsecond):
+        minutos += 1
+    return minutos
+
+
+def hora(minutos: int) -> time:
+    if minutos >= MINUTOS_DIA:
+        return time(23, 59, 59)
+    return time(minutos // 60, minutos % 60)
+
+
+def mascara(inicio: int, fin: int) -> int:
+    """Mapa de bits con los minutos [inicio, fin) a 1."""
+    if fin <= inicio:
+        return 0
+    return ((1 << (fin - inicio)) - 1) << inicio
+
+
+def mascara_horas(hora_inicio: time, hora_fin: time) -> int:
+    return mascara(minuto(hora_inicio), minuto(hora_fin, redondear_arriba=True))
+
+
+def mapa_de_bits(intervalos: Iterable[Intervalo]) -> int:
+    mapa = 0
+    for hora_inicio, hora_fin, _ in intervalos:
+        mapa |= mascara_horas(hora_inicio, hora_fin)
+    return mapa
+
+
+def minutos_ocupados(mapa: int) -> int:
+    return mapa.bit_count()
+
+
+def calcular_franjas(mapa: int, intervalos: List[Intervalo], duracion: int, desde: int, hasta: int) -> List[Franja]:
+    """Divide [desde, hasta) en franjas de `duracion` minutos y marca las que chocan con el mapa."""
+    franjas = []
+    inicio = desde
+    while inicio + duracion <= hasta:
+        fin = inicio + duracion
+        reserva_id = None
+        if mapa & mascara(inicio, fin):
+            # Solo si la franja está ocupada se busca qué reserva la ocupa
+            reserva_id = next(
+                (i[2] for i in intervalos if mascara_horas(i[0], i[1]) & mascara(inicio, fin)),
+                None
+            )
+        franjas.append((inicio, fin, reserva_id))
+        inicio = fin
+    return franjas
+
+
+def _fecha(valor: Optional[str]) -> Optional[date]:
+    return date.fromisoformat(valor) if valor else None
+
+
+def _hora(valor: Optional[str]) -> Optional[time]:
+    return time.fromisoformat(valor) if valor else None
+
+
+class IndiceOcupacion:
+    """Ocupación en memoria de las pistas, agrupada por (pista_id, dia).
+
+    Cada día de cada pista se guarda como un mapa de bits de 1440 posiciones (un bit
+    por minuto), de modo que comprobar si un horario está libre o buscar huecos libres
+    son operaciones AND sobre un entero. Junto al mapa se guardan los intervalos de cada
+    reserva: cuando el AND detecta un choque se recorren los intervalos de ese día
+    (búsqueda lineal, son pocos) para indicar con qué reserva choca, y sirven también
+    para reconstruir el mapa al modificar o borrar una reserva.
+
+    El índice solo cubre desde hoy: en cada sincronización se descartan los días que
+    ya han pasado y esas consultas van a la base de datos.
+
+    Las escrituras de cualquier worker llegan a través del registro de cambios
+    (app.cambios): antes de consultar el índice hay que llamar a
+    cambios.registro.sincronizar(db).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._mapas: Dict[Tuple[int, date], int] = {}
+        self._intervalos: Dict[Tuple[int, date], Dict[int, Tuple[time, time]]] = {}
+        self._claves: Dict[int, Tuple[int, date]] = {}
+        # Primer día cubierto por el índice; los anteriores se consultan en la base de datos
+        self._desde: Optional[date] = None
+
+    def cargar(self, db: Session, desde: Optional[date] = None):
+        desde = desde or date.today()
+        reservas = db.query(
+            models.Reserva.id,
+            models.Reserva.pista_id,
+            models.Reserva.dia,
+            models.Reserva.hora_inicio,
+            models.Reserva.hora_fin
+        ).filter(models.Reserva.dia >= desde).all()
+
+        with self._lock:
+            self._mapas = {}
+            self._intervalos = {}
+            self._claves = {}
+            self._desde = desde
+            for reserva in reservas:
+                self._agregar(reserva.id, reserva.pista_id, reserva.dia, reserva.hora_inicio, reserva.hora_fin)
+        logger.info(f"Índice de ocupación cargado con {len(reservas)} reservas desde {desde}")
+
+    def avanzar(self, hoy: Optional[date] = None):
+        """Mueve el primer día cubierto a hoy y descarta los días anteriores."""
+        hoy = hoy or date.today()
+        if self._desde is None or hoy <= self._desde:
+            return
+        with self._lock:
+            if self._desde is None or hoy <= self._desde:
+                return
+            pasados = [clave for clave in self._mapas if clave[1] < hoy]
+            for clave in pasados:
+                del self._mapas[clave]
+                for reserva_id in self._intervalos.pop(clave):
+                    del self._claves[reserva_id]
+            self._desde = hoy
+        logger.info(f"Índice de ocupación desde {hoy}: descartados {len(pasados)} días de pista")
+
+    def cubre(self, dia: date) -> bool:
+        return self._desde is not None and dia >= self._desde
+
+    def aplicar(self, cambio: cambios.Cambio):
+        """Aplica un cambio de reservas del registro; aplicarlo dos veces no cambia nada."""
+        with self._lock:
+            self._eliminar(cambio.clave)
+            if cambio.tipo != "eliminada":
+                datos = cambio.datos
+                self._agregar(cambio.clave, datos["pista_id"], _fecha(datos["dia"]),
+                              _hora(datos["hora_inicio"]), _hora(datos["hora_fin"]))
+
+    def mapa(self, pista_id: int, dia: date) -> int:
+        return self._mapas.get((pista_id, dia), 0)
+
+    def intervalos(self, pista_id: int, dia: date) -> List[Intervalo]:
+        with self._lock:
+            intervalos = self._intervalos.get((pista_id, dia), {})
+            return sorted((inicio, fin, reserva_id) for reserva_id, (inicio, fin) in intervalos.items())
+
+    def solapamiento(self, pista_id: int, dia: date, hora_inicio: time, hora_fin: Optional[time],
+                     excluir_id: Optional[int] = None) -> Optional[Intervalo]:
+        """Devuelve la reserva de la pista que se solapa con [hora_inicio, hora_fin) o None."""
+        if hora_fin is None:
+            return None
+        clave = (pista_id, dia)
+        pedido = mascara_horas(hora_inicio, hora_fin)
+        with self._lock:
+            if not self._mapas.get(clave, 0) & pedido:
+                return None
+            for reserva_id, (inicio, fin) in sorted(self._intervalos[clave].items(), key=lambda i: i[1]):
+                if reserva_id != excluir_id and mascara_horas(inicio, fin) & pedido:
+                    return (inicio, fin, reserva_id)
+            return None
+
+    def _agregar(self, reserva_id: int, pista_id: int, dia: date, hora_inicio: time, hora_fin: time):
+        if dia is None or hora_inicio is None or hora_fin is None:
+            return
+        if self._desde is not None and dia < self._desde:
+            return
+        clave = (pista_id, dia)
+        self._intervalos.setdefault(clave, {})[reserva_id] = (hora_inicio, hora_fin)
+        self._mapas[clave] = self._mapas.get(clave, 0) | mascara_horas(hora_inicio, hora_fin)
+        self._claves[reserva_id] = clave
+
+    def _eliminar(self, reserva_id: int):
+        clave = self._claves.pop(reserva_id, None)
+        if clave is None:
+            return
+        intervalos = self._intervalos[clave]
+        del intervalos[reserva_id]
+        if not intervalos:
+            del self._intervalos[clave]
+            del self._mapas[clave]
+            return
+        # Se reconstruye el mapa por si otra reserva comparte minutos con la eliminada
+        self._mapas[clave] = mapa_de_bits((inicio, fin, i) for i, (inicio, fin) in intervalos.items())
+
+
+indice = IndiceOcupacion()
+cambios.registro.al_iniciar(lambda db, version: indice.cargar(db))
+cambios.registro.suscribir("reservas", indice.aplicar)
+cambios.registro.al_sincronizar(indice.avanzar)
@@ -0,0 +1,58 @@
+import base64
+import json
+from datetime import date, time
+from typing import Any, Callable, List, Optional, Sequence
+
+from fastapi import HTTPException, Response
+
+# Cabecera con el cursor de la página siguiente; el cuerpo de los listados sigue siendo una lista
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def codificar_cursor(valores: Sequence[Any]) -> str:
+    """Convierte la clave de la última fila (p. ej. (dia, hora_inicio, id)) en un cursor opaco."""
+    serializables = [v.isoformat() if isinstance(v, (date, time)) else v for v in valores]
+    return base64.urlsafe_b64encode(json.dumps(serializables).encode()).decode().rstrip("=")
+
+
+def decodificar_cursor(cursor: str) -> List[Any]:
+    try:
+        relleno = "=" * (-len(cursor) % 4)
+        valores = json.loads(base64.urlsafe_b64decode(cursor + relleno))
+        if not isinstance(valores, list):
+            raise ValueError("cursor no es una lista")
+        return valores
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Cursor de paginación no válido")
+
+
+def cursor_reserva(cursor: str):
+    """Decodifica un cursor de reservas en (dia, hora_inicio, id)."""
+    try:
+        dia, hora_inicio, reserva_id = decodificar_cursor(cursor)
+        return date.fromisoformat(dia), time.fromisoformat(hora_inicio), int(reserva_id)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Cursor de paginación no válido")
+
+
+def cursor_id(cursor: str) -> int:
+    """Decodifica un cursor de listados ordenados por id."""
+    try:
+        (ultimo_id,) = decodificar_cursor(cursor)
+        return int(ultimo_id)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Cursor de paginación no válido")
+
+
+def poner_cursor_siguiente(response: Response, items: Sequence[Any], limit: Optional[int], clave: Callable[[Any], Sequence[Any]]):
+    """Añade la cabecera X-Next-Cursor si la página está llena (puede haber más filas)."""
+    if limit and len(items) >= limit:
+        response.headers[NEXT_CURSOR_HEADER] = codificar_cursor(clave(items[-1]))
+
+
+def clave_reserva(reserva) -> Sequence[Any]:
+    return (reserva.dia, reserva.hora_inicio, reserva.id)
+
+
+def clave_id(item) -> Sequence[Any]:
+    return (item.id,)
@@ -0,0 +1,101 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from app import cambios
+
+# Tamaño máximo y tiempo de vida (segundos) de la caché de usuarios autenticados
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", 1024))
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", 60))
+# Segundos que app.auth deja pasar entre lecturas del registro de cambios: es lo que tarda
+# como máximo una baja o modificación hecha en otro worker en llegar a la caché de este
+PRINCIPAL_CACHE_SYNC = float(os.getenv("PRINCIPAL_CACHE_SYNC", 1))
+
+
+class CachePrincipales:
+    """Caché LRU con caducidad de los usuarios resueltos a partir del token.
+
+    La clave es (rol, sub) y el valor una copia en forma de esquema (schemas.Socio o
+    schemas.Admin), nunca un objeto del ORM. Las funciones de crud que modifican o
+    eliminan un socio o un administrador lo apuntan en el registro de cambios, y
+    app.auth lo sincroniza antes de buscar en la caché, como mucho una vez cada
+    PRINCIPAL_CACHE_SYNC segundos (así un acierto no toca la base de datos): la entrada
+    se invalida en el worker que hizo el cambio en el acto y en los demás en ese plazo.
+    La caducidad solo limita cuánto se queda en memoria un usuario que ya no se usa.
+    """
+
+    def __init__(self, max_entradas: int = PRINCIPAL_CACHE_SIZE, ttl: float = PRINCIPAL_CACHE_TTL):
+        self._lock = threading.Lock()
+        self._entradas: "OrderedDict[Tuple[str, str], Tuple[float, Any]]" = OrderedDict()
+        self._por_id: Dict[Tuple[str, int], Tuple[str, str]] = {}
+        self.max_entradas = max_entradas
+        self.ttl = ttl
+        # Cambia con cada invalidación; una consulta iniciada antes no puede guardar su resultado
+        self.generacion = 0
+        self.aciertos = 0
+        self.fallos = 0
+
+    def obtener(self, rol: str, sub: str) -> Optional[Any]:
+        clave = (rol, sub)
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None or entrada[0] < time.monotonic():
+                if entrada is not None:
+                    self._quitar(clave)
+                self.fallos += 1
+                return None
+            self._entradas.move_to_end(clave)
+            self.aciertos += 1
+            return entrada[1]
+
+    def guardar(self, rol: str, sub: str, principal: Any, generacion: int):
+        if self.max_entradas <= 0 or self.ttl <= 0:
+            return
+        clave = (rol, sub)
+        with self._lock:
+            if generacion != self.generacion:
+                return
+            self._quitar_id(rol, principal.id)
+            self._entradas[clave] = (time.monotonic() + self.ttl, principal)
+            self._entradas.move_to_end(clave)
+            self._por_id[(rol, principal.id)] = clave
+            while len(self._entradas) > self.max_entradas:
+                self._quitar(next(iter(self._entradas)))
+
+    def invalidar(self, rol: str, principal_id: int):
+        with self._lock:
+            self.generacion += 1
+            self._quitar_id(rol, principal_id)
+
+    def vaciar(self):
+        with self._lock:
+            self.generacion += 1
+            self._entradas.clear()
+            self._por_id.clear()
+
+    def estadisticas(self) -> dict:
+        return {
+            "aciertos": self.aciertos,
+            "fallos": self.fallos,
+            "entradas": len(self._entradas),
+            "max_entradas": self.max_entradas,
+            "ttl": self.ttl
+        }
+
+    def _quitar_id(self, rol: str, principal_id: int):
+        clave = self._por_id.pop((rol, principal_id), None)
+        if clave is not None:
+            self._entradas.pop(clave, None)
+
+    def _quitar(self, clave: Tuple[str, str]):
+        entrada = self._entradas.pop(clave, None)
+        if entrada is not None:
+            self._por_id.pop((clave[0], entrada[1].id), None)
+
+
+cache = CachePrincipales()
+cambios.registro.al_iniciar(lambda db, version: cache.vaciar())
+cambios.registro.suscribir("socios", lambda cambio: cache.invalidar("socio", cambio.clave))
+cambios.registro.suscribir("admins", lambda cambio: cache.invalidar("admin", cambio.clave))
@@ -1,68 +1,99 @@
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, date, time
 from sqlalchemy.orm import Session
-from . import models, schemas
+from . import models, schemas, cambios, catalogo, ocupacion, metricas
 from fastapi import HTTPException
-from sqlalchemy import and_, or_
-from typing import Union, Optional
+from sqlalchemy import tuple_
+from typing import Union, Optional, Iterable, Tuple, List, Dict
+from collections import defaultdict
+import heapq
 
+def buscar_solapamientos_jugadores(db: Session, jugadores: Iterable[Tuple[str, str]], dia: date, hora_inicio: time, hora_fin: time, reserva_id: Optional[int] = None) -> List:
+    """Devuelve, para todos los jugadores a la vez, las reservas solapadas en las que ya juegan.
+
+    Cada fila contiene name, apellido, reserva_id, pista_id, hora_inicio y hora_fin.
+    """
+    parejas = list({(name, apellido) for name, apellido in jugadores if name and apellido})
+    if not parejas:
+        return []
+
+    query = db.query(
+        models.Jugador.name,
+        models.Jugador.apellido,
+        models.Reserva.id.label("reserva_id"),
+        models.Reserva.pista_id,
+        models.Reserva.hora_inicio,
+        models.Reserva.hora_fin
+    ).join(models.Reserva, models.Jugador.reserva_id == models.Reserva.id).filter(
+        tuple_(models.Jugador.name, models.Jugador.apellido).in_(parejas),
+        models.Reserva.dia == dia,
+        models.Reserva.hora_inicio < hora_fin,
+        models.Reserva.hora_fin > hora_inicio
+    )
+
+    if reserva_id is not None:
+        query = query.filter(models.Reserva.id != reserva_id)
+
+    return query.order_by(models.Reserva.hora_inicio).all()
+
+def buscar_solapamiento_pista(db: Session, pista_id: int, dia: date, hora_inicio: time, hora_fin: time, reserva_id: Optional[int] = None):
+    """Devuelve una reserva de la pista que se cruza con el intervalo, o None."""
+    query = db.query(models.Reserva.id, models.Reserva.hora_inicio, models.Reserva.hora_fin).filter(
+        models.Reserva.pista_id == pista_id,
+        models.Reserva.dia == dia,
+        models.Reserva.hora_inicio < hora_fin,
+        models.Reserva.hora_fin > hora_inicio
+    )
+    if reserva_id is not None:
+        query = query.filter(models.Reserva.id != reserva_id)
+    return query.first()
+
+@metricas.seccion("validacion")
 def verificar_reserva(db: Session, reserva: Union[schemas.ReservaCreate, schemas.ReservaUpdate], reserva_id: Optional[int] = None):
     errores = []
 
-    # Verificar solapamiento de jugadores
-    for jugador in reserva.jugadores:
-        query = db.query(models.Reserva).filter(
-            models.Reserva.dia == reserva.dia,
-            models.Reserva.hora_inicio < reserva.hora_fin,
-            models.Reserva.hora_fin > reserva.hora_inicio,
-            models.Reserva.jugadores.any(
-                and_(
-                    models.Jugador.name == jugador.name,
-                    models.Jugador.apellido == jugador.apellido
-                )
-            )
+    # Verificar solapamiento de jugadores (una sola consulta para todos)
+    solapamientos = buscar_solapamientos_jugadores(
+        db,
+        [(j.name, j.apellido) for j in reserva.jugadores],
+        reserva.dia,
+        reserva.hora_inicio,
+        reserva.hora_fin,
+        reserva_id
+    )
+    jugadores_solapados = set()
+    for solapamiento in solapamientos:
+        clave = (solapamiento.name, solapamiento.apellido)
+        if clave in jugadores_solapados:
+            continue
+        jugadores_solapados.add(clave)
+        errores.append(
+            f"El jugador {solapamiento.name} {solapamiento.apellido} ya tiene una reserva solapada "
+            f"(pista {solapamiento.pista_id}, de {solapamiento.hora_inicio.strftime('%H:%M')} a {solapamiento.hora_fin.strftime('%H:%M')})."
         )
-        
-        if reserva_id is not None:
-            query = query.filter(models.Reserva.id != reserva_id)
-        
-        reservas_solapadas = query.all()
-        if reservas_solapadas:
-            errores.append(f"El jugador {jugador.name} {jugador.apellido} ya tiene una reserva solapada.")
 
     # Verificar jugadores repetidos
     nombres_jugadores = [(j.name.lower(), j.apellido.lower()) for j in reserva.jugadores]
     if len(set(nombres_jugadores)) != len(nombres_jugadores):
         errores.append("Hay jugadores repetidos en la reserva.")
 
-    # Verificar solapamiento de pista
-    query = db.query(models.Reserva).filter(
-        models.Reserva.pista_id == reserva.pista_id,
-        models.Reserva.dia == reserva.dia,
-        or_(
-            and_(
-                models.Reserva.hora_inicio < reserva.hora_fin,
-                models.Reserva.hora_fin > reserva.hora_inicio
-            ),
-            and_(
-                models.Reserva.hora_inicio >= reserva.hora_inicio,
-                models.Reserva.hora_inicio < reserva.hora_fin
-            ),
-            and_(
-                models.Reserva.hora_fin > reserva.hora_inicio,
-                models.Reserva.hora_fin <= reserva.hora_fin
-            )
-        )
-    )
-    
-    if reserva_id is not None:
-        query = query.filter(models.Reserva.id != reserva_id)
-    
-    reservas_solapadas_pista = query.all()
-    if reservas_solapadas_pista:
+    # Verificar solapamiento de pista (en memoria si el índice cubre el día; antes se le aplican
+    # las escrituras de los demás workers). La base de datos lo vuelve a comprobar al confirmar
+    # (crud.ReservaSolapada -> 409), que es lo que resuelve dos peticiones que compiten por la
+    # misma franja
+    cambios.registro.sincronizar(db)
+    if ocupacion.indice.cubre(reserva.dia):
+        ocupada = ocupacion.indice.solapamiento(reserva.pista_id, reserva.dia, reserva.hora_inicio, reserva.hora_fin, reserva_id)
+    else:
+        ocupada = buscar_solapamiento_pista(db, reserva.pista_id, reserva.dia, reserva.hora_inicio, reserva.hora_fin, reserva_id)
+    if ocupada:
         errores.append("La pista ya está reservada en ese horario.")
 
     # Verificar la cantidad de jugadores según el tipo de pista
-    pista = db.query(models.Pista).filter(models.Pista.id == reserva.pista_id).first()
+    pista = catalogo.pistas.obtener(db, reserva.pista_id)
+    if pista is None:
+        errores.append("La pista no existe.")
+        return errores
+
     jugadores_completos = [j for j in reserva.jugadores if j.name and j.apellido]
     
     if pista.individuales:
@@ -72,4 +103,128 @@ def verificar_reserva(db: Session, reserva: Union[schemas.ReservaCreate, schemas
         if len(jugadores_completos) != 4:
             errores.append("Para una pista que no permite individuales, debe haber exactamente 4 jugadores con datos completos.")
 
-    return errores
\ No newline at end of file
+    return errores
+
+# Validación de lotes de reservas: todas contra la base de datos y entre sí en una pasada
+
+def barrido_conflictos(existentes: List[Tuple[time, time, str]], nuevos: List[Tuple[time, time, int]], etiqueta_nuevo) -> dict:
+    """Línea de barrido sobre los intervalos de un mismo recurso (una pista o un jugador en un día).
+
+    Primero se comprueba cada intervalo nuevo contra los existentes: un barrido por hora de
+    inicio con un montículo de los existentes que siguen abiertos. Después se barren entre sí
+    solo los nuevos que han sobrevivido, de modo que uno rechazado no tumba a otro; de dos
+    nuevos que chocan falla el que empieza más tarde. Devuelve {indice del nuevo: etiqueta del
+    intervalo con el que choca}.
+    """
+    conflictos = {}
+
+    # 1) Nuevos contra existentes
+    eventos = [(inicio, 0, orden, fin, None, etiqueta) for orden, (inicio, fin, etiqueta) in enumerate(existentes)]
+    eventos += [(inicio, 1, orden, fin, indice, None) for orden, (inicio, fin, indice) in enumerate(nuevos)]
+    eventos.sort(key=lambda e: e[:3])
+    existentes_abiertos = []  # (fin, orden, etiqueta)
+    nuevos_abiertos = []  # (fin, orden, indice), solo los que aún no chocan con nada
+    for inicio, tipo, orden, fin, indice, etiqueta in eventos:
+        while existentes_abiertos and existentes_abiertos[0][0] <= inicio:
+            heapq.heappop(existentes_abiertos)
+        while nuevos_abiertos and nuevos_abiertos[0][0] <= inicio:
+            heapq.heappop(nuevos_abiertos)
+        if indice is None:
+            for _, _, abierto in nuevos_abiertos:
+                conflictos[abierto] = etiqueta
+            nuevos_abiertos.clear()
+            heapq.heappush(existentes_abiertos, (fin, orden, etiqueta))
+        elif existentes_abiertos:
+            conflictos[indice] = existentes_abiertos[0][2]
+        else:
+            heapq.heappush(nuevos_abiertos, (fin, orden, indice))
+
+    # 2) Los supervivientes entre sí: los aceptados no se solapan, así que basta con
+    # comparar con el último aceptado
+    aceptado = None  # (fin, indice)
+    supervivientes = sorted((inicio, orden, fin, indice) for orden, (inicio, fin, indice) in enumerate(nuevos)
+                            if indice not in conflictos)
+    for inicio, _, fin, indice in supervivientes:
+        if aceptado is not None and inicio < aceptado[0]:
+            conflictos[indice] = etiqueta_nuevo(aceptado[1])
+        else:
+            aceptado = (fin, indice)
+    return conflictos
+
+@metricas.seccion("validacion")
+def verificar_lote(db: Session, reservas: List[schemas.ReservaCreate]) -> Dict[int, List[str]]:
+    """Valida un lote de reservas con dos consultas en total. Devuelve {indice: errores}."""
+    errores: Dict[int, List[str]] = defaultdict(list)
+    ahora = datetime.now()
+
+    for indice, reserva in enumerate(reservas):
+        if reserva.hora_fin <= reserva.hora_inicio:
+            errores[indice].append("La hora de fin debe ser posterior a la de inicio.")
+        if datetime.combine(reserva.dia, reserva.hora_inicio) < ahora:
+            errores[indice].append("No se pueden crear reservas en el pasado.")
+        nombres_jugadores = [(j.name.lower(), j.apellido.lower()) for j in reserva.jugadores if j.name and j.apellido]
+        if len(set(nombres_jugadores)) != len(nombres_jugadores):
+            errores[indice].append("Hay jugadores repetidos en la reserva.")
+        pista = catalogo.pistas.obtener(db, reserva.pista_id)
+        if pista is None:
+            errores[indice].append("La pista no existe.")
+        elif pista.individuales and len(nombres_jugadores) not in [2, 4]:
+            errores[indice].append("Para una pista que permite individuales, debe haber 2 o 4 jugadores con datos completos.")
+        elif not pista.individuales and len(nombres_jugadores) != 4:
+            errores[indice].append("Para una pista que no permite individuales, debe haber exactamente 4 jugadores con datos completos.")
+
+    candidatas = [i for i in range(len(reservas)) if i not in errores]
+    if not candidatas:
+        return dict(errores)
+
+    dias = {reservas[i].dia for i in candidatas}
+    parejas = {(j.name, j.apellido) for i in candidatas for j in reservas[i].jugadores if j.name and j.apellido}
+
+    # Lo ya reservado en esos días: pistas y jugadores
+    ocupadas = db.query(
+        models.Reserva.id, models.Reserva.pista_id, models.Reserva.dia, models.Reserva.hora_inicio, models.Reserva.hora_fin
+    ).filter(
+        models.Reserva.dia.in_(dias),
+        models.Reserva.pista_id.in_({reservas[i].pista_id for i in candidatas})
+    ).all()
+    jugando = db.query(
+        models.Jugador.name, models.Jugador.apellido, models.Reserva.id, models.Reserva.dia,
+        models.Reserva.hora_inicio, models.Reserva.hora_fin
+    ).join(models.Reserva, models.Jugador.reserva_id == models.Reserva.id).filter(
+        tuple_(models.Jugador.name, models.Jugador.apellido).in_(parejas),
+        models.Reserva.dia.in_(dias)
+    ).all() if parejas else []
+
+    pistas_existentes = defaultdict(list)
+    for r in ocupadas:
+        if r.hora_inicio is not None and r.hora_fin is not None:
+            pistas_existentes[(r.pista_id, r.dia)].append((r.hora_inicio, r.hora_fin, f"reserva {r.id}"))
+    jugadores_existentes = defaultdict(list)
+    for r in jugando:
+        if r.hora_inicio is not None and r.hora_fin is not None:
+            jugadores_existentes[(r.name, r.apellido, r.dia)].append((r.hora_inicio, r.hora_fin, f"reserva {r.id}"))
+
+    etiqueta = lambda i: f"elemento {i} del lote"
+
+    pistas_nuevas = defaultdict(list)
+    for i in candidatas:
+        reserva = reservas[i]
+        pistas_nuevas[(reserva.pista_id, reserva.dia)].append((reserva.hora_inicio, reserva.hora_fin, i))
+    for clave, nuevos in pistas_nuevas.items():
+        for i, con in barrido_conflictos(pistas_existentes[clave], nuevos, etiqueta).items():
+            errores[i].append(f"La pista ya está reservada en ese horario ({con}).")
+
+    # Los elementos que ya no tienen pista no ocupan a sus jugadores
+    jugadores_nuevos = defaultdict(list)
+    for i in candidatas:
+        if i in errores:
+            continue
+        reserva = reservas[i]
+        for j in reserva.jugadores:
+            if j.name and j.apellido:
+                jugadores_nuevos[(j.name, j.apellido, reserva.dia)].append((reserva.hora_inicio, reserva.hora_fin, i))
+    for clave, nuevos in jugadores_nuevos.items():
+        for i, con in barrido_conflictos(jugadores_existentes[clave], nuevos, etiqueta).items():
+            errores[i].append(f"El jugador {clave[0]} {clave[1]} ya tiene una reserva solapada ({con}).")
+
+    return dict(errores)
@@ -1,9 +1,12 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from typing import List
-from app import crud, models, schemas
+from typing import List, Optional
+from datetime import date, timedelta
+from app import crud, models, schemas, cambios, catalogo, principales, security, paginacion, exportacion, idempotencia, eventos
 from app.database import get_db
 from app.auth import get_current_admin  # Nueva importación
+from app.reserva_validations import verificar_lote
 import logging
 
 logger = logging.getLogger(__name__)
@@ -22,13 +25,101 @@ def create_admin(admin: schemas.AdminCreate, db: Session = Depends(get_db), curr
     return new_admin
 
 @router.get("/", response_model=List[schemas.Admin])
-def read_admins(skip: int = 0, limit: int = 10, db: Session = Depends(get_db), current_admin: schemas.Admin = Depends(get_current_admin)):
+def read_admins(response: Response, skip: int = 0, limit: int = 10, cursor: Optional[str] = None, db: Session = Depends(get_db), current_admin: schemas.Admin = Depends(get_current_admin)):
+    despues_de = paginacion.cursor_id(cursor) if cursor else None
     try:
-        admins = crud.get_admins(db, skip=skip, limit=limit)
+        admins = crud.get_admins(db, skip=skip, limit=limit, despues_de=despues_de)
+        paginacion.poner_cursor_siguiente(response, admins, limit, paginacion.clave_id)
         return admins
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+# Métricas del pool de hashing de contraseñas
+@router.get("/hash-pool", response_model=dict)
+def read_hash_pool_stats(current_admin: schemas.Admin = Depends(get_current_admin)):
+    return security.pool_hash.estadisticas()
+
+# Estadísticas de las cachés en memoria del proceso
+@router.get("/cache", response_model=dict)
+def read_cache_stats(current_admin: schemas.Admin = Depends(get_current_admin)):
+    return {
+        "cambios": cambios.registro.estadisticas(),
+        "pistas": catalogo.pistas.estadisticas(),
+        "principales": principales.cache.estadisticas(),
+        "idempotencia": idempotencia.almacen.estadisticas(),
+        "eventos": eventos.bus.estadisticas()
+    }
+
+# Listado completo de reservas futuras, paginado por cursor (dia, hora_inicio, id)
+@router.get("/reservas", response_model=List[schemas.Reserva])
+def read_reservas_admin(
+    response: Response,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    desde: Optional[date] = None,
+    db: Session = Depends(get_db),
+    current_admin: schemas.Admin = Depends(get_current_admin)
+):
+    despues_de = paginacion.cursor_reserva(cursor) if cursor else None
+    reservas = crud.get_reservas(db, limit=limit, despues_de=despues_de, desde=desde)
+    paginacion.poner_cursor_siguiente(response, reservas, limit, paginacion.clave_reserva)
+    return reservas
+
+# Máximo de reservas por lote (incluidas las generadas por la recurrencia)
+MAX_RESERVAS_LOTE = 500
+
+def expandir_lote(lote: schemas.ReservaBatch) -> List[schemas.ReservaCreate]:
+    reservas = list(lote.reservas)
+    if lote.recurrencia is not None:
+        base = lote.recurrencia.reserva
+        dia = base.dia
+        while dia <= lote.recurrencia.hasta and len(reservas) <= MAX_RESERVAS_LOTE:
+            reservas.append(base.model_copy(update={"dia": dia}))
+            dia += timedelta(days=lote.recurrencia.cada_dias)
+    return reservas
+
+# Alta de muchas reservas (un torneo, una liga semanal) validadas juntas y escritas en una transacción
+@router.post("/reservas/batch", response_model=schemas.ResultadoBatchReservas)
+def create_reservas_batch(
+    lote: schemas.ReservaBatch,
+    db: Session = Depends(get_db),
+    current_admin: schemas.Admin = Depends(get_current_admin)
+):
+    reservas = expandir_lote(lote)
+    if not reservas:
+        raise HTTPException(status_code=400, detail="El lote no contiene reservas")
+    if len(reservas) > MAX_RESERVAS_LOTE:
+        raise HTTPException(status_code=400, detail=f"Un lote admite como máximo {MAX_RESERVAS_LOTE} reservas")
+
+    errores = verificar_lote(db, reservas)
+    resultado = schemas.ResultadoBatchReservas(
+        errores=[schemas.ErrorElementoBatch(indice=i, errores=e) for i, e in sorted(errores.items())]
+    )
+    validas = [r for i, r in enumerate(reservas) if i not in errores]
+    if validas and not (lote.todo_o_nada and errores):
+        resultado.creadas = [schemas.Reserva.model_validate(r) for r in crud.create_reservas_batch(db, validas)]
+    logger.info(f"Lote de reservas: {len(resultado.creadas)} creadas, {len(errores)} con errores")
+    return resultado
+
+# Exportación completa del histórico de reservas (con jugadores y pista), enviada por lotes
+@router.get("/reservas/export")
+def export_reservas(
+    formato: str = Query("ndjson", alias="format"),
+    desde: Optional[date] = None,
+    hasta: Optional[date] = None,
+    current_admin: schemas.Admin = Depends(get_current_admin)
+):
+    if formato not in exportacion.TIPOS_CONTENIDO:
+        raise HTTPException(status_code=400, detail="Formato no soportado; use ndjson o csv")
+    if desde and hasta and hasta < desde:
+        raise HTTPException(status_code=400, detail="La fecha 'hasta' debe ser posterior a 'desde'")
+    logger.info(f"Exportando reservas en {formato} (desde={desde}, hasta={hasta})")
+    return StreamingResponse(
+        exportacion.exportar_reservas(formato, desde, hasta),
+        media_type=exportacion.TIPOS_CONTENIDO[formato],
+        headers={"Content-Disposition": f'attachment; filename="reservas.{formato}"'}
+    )
+
 @router.get("/{admin_id}", response_model=schemas.Admin)
 def read_admin(admin_id: int, db: Session = Depends(get_db), current_admin: schemas.Admin = Depends(get_current_admin)):
     db_admin = crud.get_admin(db, admin_id=admin_id)
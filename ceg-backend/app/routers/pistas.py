@@ -1,8 +1,9 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
+from datetime import date, time
 from app.auth import get_current_admin  # Importación correcta
-from app import crud, schemas, models
+from app import crud, schemas, models, cambios, catalogo, ocupacion, paginacion, versiones, serializacion
 from app.database import get_db
 
 router = APIRouter()
@@ -43,10 +44,80 @@ def delete_pista(pista_id: int, db: Session = Depends(get_db), current_admin: mo
 # Ruta para obtener la lista de pistas (accesible para todos)
 @router.get("/", response_model=List[schemas.Pista])
 def read_pistas(
+    request: Request,
+    response: Response,
+    skip: int = 0,
+    limit: int = 10,
+    cursor: Optional[str] = None,
     db: Session = Depends(get_db)
 ):
-    pistas = crud.get_pistas(db)
-    return pistas
+    # Los kioscos sondean este listado: si el catálogo no ha cambiado se responde 304 sin cuerpo
+    etag = versiones.etag(db, "pistas", request)
+    no_modificado = versiones.no_modificado(request, etag)
+    if no_modificado:
+        return no_modificado
+    response.headers["ETag"] = etag
+    despues_de = paginacion.cursor_id(cursor) if cursor else None
+    pistas = catalogo.pistas.listar(db, skip=skip, limit=limit, despues_de=despues_de)
+    paginacion.poner_cursor_siguiente(response, pistas, limit, paginacion.clave_id)
+    return serializacion.respuesta_lista(schemas.Pista, pistas, response)
+
+# Ruta para obtener la disponibilidad de todas las pistas en un día (accesible para todos)
+@router.get("/disponibilidad", response_model=List[schemas.DisponibilidadPista])
+def read_disponibilidad(
+    dia: date,
+    desde: time = time(0, 0),
+    hasta: Optional[time] = None,
+    db: Session = Depends(get_db)
+):
+    if hasta is not None and hasta <= desde:
+        raise HTTPException(status_code=400, detail="La hora 'hasta' debe ser posterior a 'desde'")
+
+    pistas = catalogo.pistas.listar(db)
+
+    # Si el índice de ocupación cubre el día (al día con las escrituras de todos los workers)
+    # no hace falta consultar las reservas; si no, se cargan todas las del día en una sola consulta
+    cambios.registro.sincronizar(db)
+    intervalos = {}
+    if not ocupacion.indice.cubre(dia):
+        reservas = db.query(
+            models.Reserva.id,
+            models.Reserva.pista_id,
+            models.Reserva.hora_inicio,
+            models.Reserva.hora_fin
+        ).filter(models.Reserva.dia == dia).all()
+        for reserva in reservas:
+            if reserva.hora_inicio is not None and reserva.hora_fin is not None:
+                intervalos.setdefault(reserva.pista_id, []).append((reserva.hora_inicio, reserva.hora_fin, reserva.id))
+
+    inicio = ocupacion.minuto(desde)
+    fin = ocupacion.minuto(hasta) if hasta else ocupacion.MINUTOS_DIA
+    disponibilidad = []
+    for pista in pistas:
+        if ocupacion.indice.cubre(dia):
+            intervalos_pista = ocupacion.indice.intervalos(pista.id, dia)
+            mapa = ocupacion.indice.mapa(pista.id, dia)
+        else:
+            intervalos_pista = intervalos.get(pista.id, [])
+            mapa = ocupacion.mapa_de_bits(intervalos_pista)
+
+        franjas = []
+        if pista.tiempo_juego and pista.tiempo_juego > 0:
+            franjas = [
+                schemas.FranjaDisponibilidad(
+                    hora_inicio=ocupacion.hora(franja_inicio),
+                    hora_fin=ocupacion.hora(franja_fin),
+                    libre=reserva_id is None,
+                    reserva_id=reserva_id
+                )
+                for franja_inicio, franja_fin, reserva_id in ocupacion.calcular_franjas(mapa, intervalos_pista, pista.tiempo_juego, inicio, fin)
+            ]
+        disponibilidad.append(schemas.DisponibilidadPista(
+            pista=pista,
+            franjas=franjas,
+            minutos_ocupados=ocupacion.minutos_ocupados(mapa & ocupacion.mascara(inicio, fin))
+        ))
+    return disponibilidad
 
 # Ruta para obtener detalles de una pista específica (accesible para todos)
 @router.get("/{pista_id}", response_model=schemas.Pista)
@@ -54,7 +125,7 @@ def read_pista(
     pista_id: int,
     db: Session = Depends(get_db)
 ):
-    pista = crud.get_pista(db, pista_id=pista_id)
+    pista = catalogo.pistas.obtener(db, pista_id)
     if pista is None:
         raise HTTPException(status_code=404, detail="Pista not found")
     return pista
\ No newline at end of file
@@ -1,11 +1,14 @@
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Request, Response
 from sqlalchemy.exc import SQLAlchemyError
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import and_
-from app import crud, schemas, models
+from app import crud, crud_async, schemas, models, cambios, ocupacion, paginacion, versiones, eventos, serializacion
+from fastapi.responses import StreamingResponse
+import asyncio
 from pydantic import ValidationError
-from app.database import get_db
-from ..reserva_validations import verificar_reserva
+from app.database import get_db, get_async_db
+from ..reserva_validations import verificar_reserva, buscar_solapamientos_jugadores, buscar_solapamiento_pista
 from typing import List, Optional
 import logging
 from datetime import datetime, timedelta, date, time
@@ -19,27 +22,22 @@ logging.basicConfig(level=logging.INFO)
 
 def verificar_solapamiento_jugador(db: Session, nombre: str, apellido: str, dia: date, hora_inicio: time, hora_fin: time, reserva_id: Optional[int] = None):
     try:
-        query = db.query(models.Reserva).filter(
-            models.Reserva.dia == dia,
-            models.Reserva.hora_inicio < hora_fin,
-            models.Reserva.hora_fin > hora_inicio,
-            models.Reserva.jugadores.any(
-                and_(
-                    models.Jugador.name == nombre,
-                    models.Jugador.apellido == apellido
-                )
-            )
-        )
-        
-        if reserva_id is not None:
-            query = query.filter(models.Reserva.id != reserva_id)
+        solapamientos = buscar_solapamientos_jugadores(db, [(nombre, apellido)], dia, hora_inicio, hora_fin, reserva_id)
         
-        solapamiento = query.first()
-        
-        if solapamiento:
+        if solapamientos:
+            solapamiento = solapamientos[0]
             return {
                 "solapamiento": True,
-                "mensaje": f"El jugador {nombre} {apellido} ya tiene una reserva solapada el día {dia} entre {solapamiento.hora_inicio} y {solapamiento.hora_fin}."
+                "mensaje": f"El jugador {nombre} {apellido} ya tiene una reserva solapada el día {dia} entre {solapamiento.hora_inicio} y {solapamiento.hora_fin}.",
+                "reservas": [
+                    {
+                        "reserva_id": s.reserva_id,
+                        "pista_id": s.pista_id,
+                        "hora_inicio": s.hora_inicio,
+                        "hora_fin": s.hora_fin
+                    }
+                    for s in solapamientos
+                ]
             }
         
         return {"solapamiento": False, "mensaje": "No hay solapamiento"}
@@ -49,18 +47,17 @@ def verificar_solapamiento_jugador(db: Session, nombre: str, apellido: str, dia:
 
 def verificar_solapamiento_pista(db: Session, pista_id: int, dia: date, hora_inicio: time, hora_fin: time, reserva_id: Optional[int] = None):
     try:
-        query = db.query(models.Reserva).filter(
-            models.Reserva.pista_id == pista_id,
-            models.Reserva.dia == dia,
-            models.Reserva.hora_inicio < hora_fin,
-            models.Reserva.hora_fin > hora_inicio
-        )
-        
-        if reserva_id is not None:
-            query = query.filter(models.Reserva.id != reserva_id)
-        
-        solapamiento = query.first()
-        
+        cambios.registro.sincronizar(db)
+        if ocupacion.indice.cubre(dia):
+            solapamiento = ocupacion.indice.solapamiento(pista_id, dia, hora_inicio, hora_fin, reserva_id)
+            if solapamiento:
+                return {
+                    "solapamiento": True,
+                    "mensaje": f"La pista ya está reservada el día {dia} entre {solapamiento[0]} y {solapamiento[1]}."
+                }
+            return {"solapamiento": False, "mensaje": "La pista está disponible"}
+
+        solapamiento = buscar_solapamiento_pista(db, pista_id, dia, hora_inicio, hora_fin, reserva_id)
         if solapamiento:
             return {
                 "solapamiento": True,
@@ -73,7 +70,7 @@ def verificar_solapamiento_pista(db: Session, pista_id: int, dia: date, hora_ini
         raise HTTPException(status_code=500, detail=f"Error interno al verificar solapamiento de pista: {str(e)}")
 
 @router.post("/", response_model=schemas.Reserva)
-async def create_reserva(reserva: schemas.ReservaCreate, db: Session = Depends(get_db)):
+def create_reserva(reserva: schemas.ReservaCreate, db: Session = Depends(get_db)):
     try:
         logger.info(f"Intentando crear una reserva con datos: {reserva.dict()}")
 
@@ -92,41 +89,8 @@ async def create_reserva(reserva: schemas.ReservaCreate, db: Session = Depends(g
         if not any(j.tipo_jugador != "No Socio" for j in reserva.jugadores):
             raise HTTPException(status_code=400, detail="Debe haber al menos un jugador socio para realizar la reserva.")
 
-        # Verificar la cantidad de jugadores según el tipo de pista
-        pista = db.query(models.Pista).filter(models.Pista.id == reserva.pista_id).first()
-        jugadores_completos = [j for j in reserva.jugadores if j.name and j.apellido]
-        if pista.individuales:
-            if len(jugadores_completos) not in [2, 4]:
-                raise HTTPException(status_code=400, detail="Para una pista individual, debe haber 2 o 4 jugadores completos.")
-        else:
-            if len(jugadores_completos) != 4:
-                raise HTTPException(status_code=400, detail="Para una pista no individual, debe haber exactamente 4 jugadores completos.")
-
-        # Crear la reserva
-        db_reserva = models.Reserva(
-            pista_id=reserva.pista_id,
-            dia=reserva.dia,
-            hora_inicio=reserva.hora_inicio,
-            hora_fin=reserva.hora_fin,
-            individuales=reserva.individuales
-        )
-        db.add(db_reserva)
-        db.commit()
-        db.refresh(db_reserva)
-
-        # Crear los jugadores asociados
-        for jugador_data in reserva.jugadores:
-            if jugador_data.name and jugador_data.apellido:  # Solo crear jugadores con datos
-                db_jugador = models.Jugador(
-                    name=jugador_data.name,
-                    apellido=jugador_data.apellido,
-                    tipo_jugador=jugador_data.tipo_jugador,
-                    reserva_id=db_reserva.id
-                )
-                db.add(db_jugador)
-        
-        db.commit()
-        db.refresh(db_reserva)
+        # El número de jugadores según la pista ya lo ha comprobado verificar_reserva
+        db_reserva = crud.create_reserva(db, reserva)
         
         logger.info(f"Reserva creada con ID: {db_reserva.id}")
         return db_reserva
@@ -136,50 +100,121 @@ async def create_reserva(reserva: schemas.ReservaCreate, db: Session = Depends(g
     except HTTPException as he:
         logger.error(f"Error HTTP: {he.detail}")
         raise he
+    except crud.ReservaSolapada as rs:
+        logger.warning(f"Reserva rechazada por la base de datos: {rs}")
+        raise
     except Exception as e:
         db.rollback()
         logger.error(f"Error al crear la reserva: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/", response_model=List[schemas.Reserva])
-def read_reservas(db: Session = Depends(get_db)):
+def read_reservas(
+    request: Request,
+    response: Response,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    ahora = datetime.now()
+    # El tablero cambia con cada escritura y también con el paso del tiempo (la ventana de
+    # 24 horas avanza), así que el ETag incluye el minuto actual
+    etag = versiones.etag(db, "reservas", request, ahora.strftime("%Y%m%d%H%M"))
+    no_modificado = versiones.no_modificado(request, etag)
+    if no_modificado:
+        return no_modificado
+    response.headers["ETag"] = etag
+    response.headers[eventos.ULTIMO_EVENTO_HEADER] = str(eventos.bus.ultimo_id)
+    despues_de = paginacion.cursor_reserva(cursor) if cursor else None
     try:
-        ahora = datetime.now()
         limite = ahora + timedelta(hours=24)
         
-        reservas = db.query(models.Reserva).filter(
+        query = db.query(models.Reserva).filter(
             ((models.Reserva.dia == ahora.date()) & (models.Reserva.hora_fin > ahora.time())) |
             ((models.Reserva.dia > ahora.date()) & (models.Reserva.dia < limite.date())) |
             ((models.Reserva.dia == limite.date()) & (models.Reserva.hora_inicio <= limite.time()))
-        ).order_by(models.Reserva.dia, models.Reserva.hora_inicio).all()
+        ).options(
+            selectinload(models.Reserva.jugadores)
+        ).order_by(models.Reserva.dia, models.Reserva.hora_inicio, models.Reserva.id)
+        if despues_de is not None:
+            query = query.filter(crud.filtro_despues_de_reserva(*despues_de))
+        if limit is not None:
+            query = query.limit(limit)
+        reservas = query.all()
+        paginacion.poner_cursor_siguiente(response, reservas, limit, paginacion.clave_reserva)
         
         logger.info(f"Número de reservas encontradas: {len(reservas)}")
         for reserva in reservas:
             logger.info(f"Reserva: ID={reserva.id}, Día={reserva.dia}, Hora inicio={reserva.hora_inicio}")
         
-        return reservas
+        return serializacion.respuesta_lista(schemas.Reserva, reservas, response)
     except Exception as e:
         logger.error(f"Error en read_reservas: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/mis-reservas", response_model=List[schemas.ReservaConPista])
 async def read_mis_reservas(
-    db: Session = Depends(get_db),
+    limit: Optional[int] = None,
+    db: AsyncSession = Depends(get_async_db),
     current_socio: schemas.Socio = Depends(get_current_socio)
 ):
     logger.info(f"Buscando reservas para el socio: {current_socio.name} {current_socio.lastname}")
-    all_reservas = crud.get_reservas_by_jugador(db, current_socio.name, current_socio.lastname)
-    
     now = datetime.now()
     end = now + timedelta(hours=24)
     
-    filtered_reservas = [
-        r for r in all_reservas 
-        if now <= datetime.combine(r.dia, r.hora_inicio) <= end
-    ]
+    # La ventana de 24 horas se aplica en la consulta, no sobre todo el historial
+    filtered_reservas = await crud_async.get_reservas_by_jugador(
+        db, current_socio.name, current_socio.lastname, desde=now, hasta=end, limit=limit
+    )
     
     logger.info(f"Encontradas {len(filtered_reservas)} reservas para las próximas 24 horas")
-    return filtered_reservas
+    return serializacion.respuesta_lista(schemas.ReservaConPista, filtered_reservas)
+
+# Cambios del tablero en tiempo real (Server-Sent Events): creada, actualizada y eliminada.
+# El cliente carga GET /reservas/ una vez y se suscribe desde su cabecera X-Ultimo-Evento
+# (o reconecta con Last-Event-ID); si el historial ya no cubre ese id recibe "recargar".
+# El tablero y el flujo pueden atenderlos workers distintos: los ids son versiones del
+# registro de cambios compartido, y antes de empezar este worker se pone al día con él.
+@router.get("/stream")
+async def stream_reservas(request: Request, ultimo_evento: Optional[int] = None):
+    cabecera = request.headers.get("last-event-id")
+    if cabecera and cabecera.isdigit():
+        ultimo_evento = int(cabecera)
+    await eventos.sincronizar()
+
+    async def flujo():
+        suscripcion = eventos.bus.suscribir()
+        try:
+            ultimo = eventos.bus.ultimo_id if ultimo_evento is None else ultimo_evento
+            pendientes = eventos.bus.desde(ultimo)
+            if pendientes is None:
+                yield "event: recargar\ndata: {}\n\n"
+                ultimo = eventos.bus.ultimo_id
+                pendientes = []
+            for evento in pendientes:
+                ultimo = evento[0]
+                yield eventos.formato_sse(evento)
+            while not await request.is_disconnected():
+                try:
+                    evento = await asyncio.wait_for(suscripcion.cola.get(), timeout=eventos.EVENTOS_LATIDO)
+                except asyncio.TimeoutError:
+                    yield ": latido\n\n"
+                    continue
+                if evento is None:
+                    logger.warning("Cliente del flujo de reservas desconectado por ir atrasado")
+                    break
+                if evento[0] <= ultimo:
+                    continue
+                ultimo = evento[0]
+                yield eventos.formato_sse(evento)
+        finally:
+            eventos.bus.cancelar(suscripcion)
+
+    return StreamingResponse(
+        flujo(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @router.get("/{reserva_id}", response_model=schemas.Reserva)
 def read_reserva(reserva_id: int, db: Session = Depends(get_db)):
@@ -197,7 +232,7 @@ def delete_reserva(reserva_id: int, db: Session = Depends(get_db)):
 
 
 @router.put("/{reserva_id}", response_model=schemas.Reserva)
-async def update_reserva(reserva_id: int, reserva: schemas.ReservaUpdateWithJugadores, db: Session = Depends(get_db)):
+def update_reserva(reserva_id: int, reserva: schemas.ReservaUpdateWithJugadores, db: Session = Depends(get_db)):
     try:
         logger.info(f"Intentando actualizar la reserva con ID: {reserva_id}")
 
@@ -216,12 +251,14 @@ async def update_reserva(reserva_id: int, reserva: schemas.ReservaUpdateWithJuga
     except HTTPException as he:
         logger.error(f"Error de validación al actualizar la reserva: {he.detail}")
         raise he
+    except crud.ReservaSolapada:
+        raise
     except Exception as e:
         logger.error(f"Error inesperado al actualizar la reserva: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
     
 @router.put("/mis-reservas/{reserva_id}", response_model=schemas.ReservaConPista)
-async def update_mi_reserva(
+def update_mi_reserva(
     reserva_id: int,
     reserva: schemas.ReservaUpdate,
     db: Session = Depends(get_db),
@@ -256,6 +293,8 @@ async def update_mi_reserva(
         updated_reserva = crud.update_reserva(db, reserva_id=reserva_id, reserva=reserva)
         logger.info(f"Reserva {reserva_id} actualizada con éxito")
         return updated_reserva
+    except crud.ReservaSolapada:
+        raise
     except Exception as e:
         logger.error(f"Error al actualizar la reserva {reserva_id}: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error interno al actualizar la reserva: {str(e)}")
@@ -306,7 +345,7 @@ def check_solapamiento_pista(
         raise HTTPException(status_code=500, detail=f"Error inesperado: {str(e)}")
 
 @router.get("/mis-reservas/{reserva_id}", response_model=schemas.ReservaConPista)
-async def read_mi_reserva(
+def read_mi_reserva(
     reserva_id: int,
     db: Session = Depends(get_db),
     current_socio: schemas.Socio = Depends(get_current_socio)
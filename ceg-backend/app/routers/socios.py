@@ -1,9 +1,12 @@
 import logging
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, Response, status
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from typing import List
-from app import crud, schemas, models
-from app.database import get_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
+from app import crud, crud_async, schemas, models, paginacion, importacion, serializacion
+from app.security import PoolHashSaturado
+from app.database import get_db, get_async_db
 from app.auth import get_current_socio, get_current_admin
 logger = logging.getLogger(__name__)
 
@@ -12,20 +15,27 @@ admin_socio_router = APIRouter()
 
 # Rutas para socios
 @socio_router.get("/me", response_model=schemas.Socio)
-async def read_own_profile(current_socio: models.Socio = Depends(get_current_socio)):
+async def read_own_profile(current_socio: schemas.Socio = Depends(get_current_socio)):
     return current_socio
 
 @socio_router.put("/me", response_model=schemas.Socio)
 async def update_socio_me(
     socio_update: schemas.SocioUpdateMe,
-    current_socio: models.Socio = Depends(get_current_socio),
-    db: Session = Depends(get_db)
+    current_socio: schemas.Socio = Depends(get_current_socio),
+    db: AsyncSession = Depends(get_async_db)
 ):
     logger.info(f"Intento de actualización de perfil para socio: {current_socio.id}")
     try:
-        updated_socio = crud.update_socio_me(db, current_socio, socio_update)
+        # current_socio es una copia en caché: se modifica el registro de la sesión
+        db_socio = await crud_async.get_socio(db, current_socio.id)
+        if db_socio is None:
+            raise HTTPException(status_code=404, detail="Socio no encontrado")
+        updated_socio = await crud_async.update_socio_me(db, db_socio, socio_update)
         logger.info(f"Perfil actualizado para socio: {current_socio.id}")
         return updated_socio
+    except (HTTPException, PoolHashSaturado):
+        # La saturación del pool de hashing la convierte en 503 el manejador de app.main
+        raise
     except Exception as e:
         logger.error(f"Error al actualizar perfil del socio {current_socio.id}: {str(e)}")
         raise HTTPException(status_code=400, detail="Error al actualizar el perfil")
@@ -33,13 +43,17 @@ async def update_socio_me(
 # Rutas para administradores
 @admin_socio_router.get("/", response_model=List[schemas.Socio])
 async def read_socios(
+    response: Response,
     skip: int = 0, 
     limit: int = 100, 
+    cursor: Optional[str] = None,
     current_admin: models.Admin = Depends(get_current_admin),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    socios = crud.get_socios(db, skip=skip, limit=limit)
-    return socios
+    despues_de = paginacion.cursor_id(cursor) if cursor else None
+    socios = await crud_async.get_socios(db, skip=skip, limit=limit, despues_de=despues_de)
+    paginacion.poner_cursor_siguiente(response, socios, limit, paginacion.clave_id)
+    return serializacion.respuesta_lista(schemas.Socio, socios, response)
 
 @admin_socio_router.post("/", response_model=schemas.Socio)
 def create_socio(
@@ -52,6 +66,18 @@ def create_socio(
         raise HTTPException(status_code=400, detail="Socio already registered")
     return crud.create_socio(db=db, socio=socio)
 
+# Alta masiva: CSV (Content-Type text/csv, con cabecera) o array JSON de SocioCreate
+@admin_socio_router.post("/bulk", response_model=schemas.ResultadoImportacion)
+async def import_socios(
+    request: Request,
+    db: Session = Depends(get_db),
+    current_admin: schemas.Admin = Depends(get_current_admin)
+):
+    filas = importacion.leer_filas(await request.body(), request.headers.get("content-type", ""))
+    logger.info(f"Importando {len(filas)} socios")
+    # Las consultas y los hashes son bloqueantes: se ejecutan fuera del bucle de eventos
+    return await run_in_threadpool(importacion.importar_socios, db, filas)
+
 @admin_socio_router.put("/{socio_id}", response_model=schemas.Socio)
 def update_socio(
     socio_id: int,
@@ -72,6 +98,8 @@ def update_socio(
             return updated_socio
         else:
             raise HTTPException(status_code=400, detail="No se pudo actualizar el socio")
+    except PoolHashSaturado:
+        raise
     except Exception as e:
         logger.error(f"Error al actualizar socio: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
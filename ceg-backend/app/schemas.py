@@ -177,6 +177,18 @@ class Pista(PistaBase):
     class Config:
         from_attributes = True
 
+# Esquemas para la disponibilidad de las pistas
+class FranjaDisponibilidad(BaseModel):
+    hora_inicio: time
+    hora_fin: time
+    libre: bool
+    reserva_id: Optional[int] = None
+
+class DisponibilidadPista(BaseModel):
+    pista: Pista
+    franjas: List[FranjaDisponibilidad]
+    minutos_ocupados: int = 0
+
 class ReservaConPista(BaseModel):
     id: int
     dia: date
@@ -189,6 +201,39 @@ class ReservaConPista(BaseModel):
     class Config:
         from_attributes = True
 
+# Creación de reservas por lotes (torneos, bloques recurrentes)
+class RecurrenciaReserva(BaseModel):
+    reserva: ReservaCreate  # la primera ocurrencia; se repite cada `cada_dias` días hasta `hasta`
+    hasta: date
+    cada_dias: int = Field(7, ge=1)
+
+class ReservaBatch(BaseModel):
+    reservas: List[ReservaCreate] = []
+    recurrencia: Optional[RecurrenciaReserva] = None
+    todo_o_nada: bool = False  # si algún elemento falla no se crea ninguno
+
+class ErrorElementoBatch(BaseModel):
+    indice: int
+    errores: List[str]
+
+class ResultadoBatchReservas(BaseModel):
+    creadas: List[Reserva] = []
+    errores: List[ErrorElementoBatch] = []
+
+# Importación masiva de socios
+class ResultadoFilaImportacion(BaseModel):
+    fila: int
+    email: Optional[str] = None
+    estado: str  # "creado", "omitido" o "fallido"
+    id: Optional[int] = None
+    detalle: Optional[str] = None
+
+class ResultadoImportacion(BaseModel):
+    creados: int = 0
+    omitidos: int = 0
+    fallidos: int = 0
+    filas: List[ResultadoFilaImportacion] = []
+
 class SocioUpdateMe(BaseModel):
     name: Optional[str] = None
     lastname: Optional[str] = None
@@ -1,5 +1,10 @@
 import os
+import time
+import asyncio
+import threading
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, ProcessPoolExecutor, wait
 from datetime import datetime, timedelta
+from typing import List, Optional, Sequence
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 
@@ -8,14 +13,151 @@ SECRET_KEY = os.getenv("SECRET_KEY", "default_secret_key")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 30))
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Coste de bcrypt y pool de trabajadores que calcula los hashes
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
+PASSWORD_HASH_POOL = os.getenv("PASSWORD_HASH_POOL", "thread")  # "thread" o "process"
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", os.cpu_count() or 1))
+PASSWORD_HASH_QUEUE = int(os.getenv("PASSWORD_HASH_QUEUE", 64))
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto", bcrypt__rounds=BCRYPT_ROUNDS)
+
+def _verify(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
-def get_password_hash(password: str) -> str:
+def _hash(password: str) -> str:
     return pwd_context.hash(password)
 
+
+class PoolHashSaturado(Exception):
+    """La cola del pool de hashing está llena; el cliente debe reintentar más tarde."""
+
+
+class PoolHash:
+    """Ejecuta bcrypt en un pool de hilos o procesos con una cola acotada.
+
+    bcrypt libera el GIL, así que con hilos ya se aprovechan todos los núcleos; el
+    modo "process" aísla además el cálculo del proceso del servidor. Si hay más de
+    workers + cola tareas pendientes, las nuevas se rechazan con PoolHashSaturado
+    en lugar de acumular latencia.
+    """
+
+    def __init__(self, tipo: str = PASSWORD_HASH_POOL, workers: int = PASSWORD_HASH_WORKERS, cola: int = PASSWORD_HASH_QUEUE):
+        self.tipo = tipo
+        self.workers = max(1, workers)
+        self.cola = max(0, cola)
+        self._executor = None
+        self._lock = threading.Lock()
+        self._plazas = threading.BoundedSemaphore(self.workers + self.cola)
+        self.pendientes = 0
+        self.completadas = 0
+        self.rechazadas = 0
+        self.errores = 0
+        self.segundos_totales = 0.0
+
+    def _obtener_executor(self):
+        # Se crea al primer uso para que los procesos hijos no hereden estado del arranque
+        with self._lock:
+            if self._executor is None:
+                if self.tipo == "process":
+                    self._executor = ProcessPoolExecutor(max_workers=self.workers)
+                else:
+                    self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+            return self._executor
+
+    def enviar(self, funcion, *args) -> Future:
+        if not self._plazas.acquire(blocking=False):
+            with self._lock:
+                self.rechazadas += 1
+            raise PoolHashSaturado("Demasiadas operaciones de contraseña pendientes")
+        inicio = time.perf_counter()
+        with self._lock:
+            self.pendientes += 1
+
+        def terminar(futuro: Future):
+            self._plazas.release()
+            with self._lock:
+                self.pendientes -= 1
+                self.segundos_totales += time.perf_counter() - inicio
+                if futuro.exception() is not None:
+                    self.errores += 1
+                else:
+                    self.completadas += 1
+
+        try:
+            futuro = self._obtener_executor().submit(funcion, *args)
+        except Exception:
+            self._plazas.release()
+            with self._lock:
+                self.pendientes -= 1
+            raise
+        futuro.add_done_callback(terminar)
+        return futuro
+
+    def mapear(self, funcion, valores: Sequence, ventana: Optional[int] = None) -> List:
+        """Aplica `funcion` a cada valor en el pool, con como mucho `ventana` tareas en vuelo.
+
+        Pensado para lotes (importaciones): no encola miles de tareas de golpe, así que
+        deja plazas libres para los logins. Si el pool está saturado por otras peticiones
+        espera a que termine una tarea propia; sin tareas propias en vuelo lanza PoolHashSaturado.
+        """
+        ventana = max(1, ventana or self.workers)
+        resultados: List = [None] * len(valores)
+        en_vuelo = {}
+        siguiente = 0
+        while siguiente < len(valores) or en_vuelo:
+            while siguiente < len(valores) and len(en_vuelo) < ventana:
+                try:
+                    futuro = self.enviar(funcion, valores[siguiente])
+                except PoolHashSaturado:
+                    if not en_vuelo:
+                        raise
+                    break
+                en_vuelo[futuro] = siguiente
+                siguiente += 1
+            terminados, _ = wait(list(en_vuelo), return_when=FIRST_COMPLETED)
+            for futuro in terminados:
+                resultados[en_vuelo.pop(futuro)] = futuro.result()
+        return resultados
+
+    def cerrar(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def estadisticas(self) -> dict:
+        with self._lock:
+            terminadas = self.completadas + self.errores
+            return {
+                "tipo": self.tipo,
+                "workers": self.workers,
+                "cola": self.cola,
+                "bcrypt_rounds": BCRYPT_ROUNDS,
+                "pendientes": self.pendientes,
+                "completadas": self.completadas,
+                "errores": self.errores,
+                "rechazadas": self.rechazadas,
+                "segundos_medios": self.segundos_totales / terminadas if terminadas else 0.0
+            }
+
+
+pool_hash = PoolHash()
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return pool_hash.enviar(_verify, plain_password, hashed_password).result()
+
+def get_password_hash(password: str) -> str:
+    return pool_hash.enviar(_hash, password).result()
+
+def get_password_hashes(passwords: Sequence[str]) -> List[str]:
+    return pool_hash.mapear(_hash, passwords)
+
+async def averify_password(plain_password: str, hashed_password: str) -> bool:
+    return await asyncio.wrap_future(pool_hash.enviar(_verify, plain_password, hashed_password))
+
+async def aget_password_hash(password: str) -> str:
+    return await asyncio.wrap_future(pool_hash.enviar(_hash, password))
+
 def create_access_token(data: dict, expires_delta: timedelta = None) -> str:
     to_encode = data.copy()
     if expires_delta:
@@ -0,0 +1,89 @@
+import logging
+import os
+import typing
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Type
+
+from fastapi import Response
+from pydantic import BaseModel, TypeAdapter, ValidationError
+
+from app import schemas, metricas
+
+logger = logging.getLogger(__name__)
+
+# Ruta rápida de serialización de listados (opcional; por defecto se usa la de FastAPI)
+FAST_JSON_RESPONSES = os.getenv("FAST_JSON_RESPONSES", "false").lower() in ("1", "true", "yes")
+
+ESQUEMAS_LISTADOS = (schemas.Reserva, schemas.ReservaConPista, schemas.Socio, schemas.Pista)
+
+# Campo -> (esquema anidado, es_lista) para los campos que son relaciones del ORM
+Relaciones = Dict[str, Tuple[Type[BaseModel], bool]]
+
+
+class Compilado(typing.NamedTuple):
+    adaptador: TypeAdapter
+    relaciones: Relaciones
+
+
+_compilados: Dict[Type[BaseModel], Compilado] = {}
+
+
+def _relaciones(esquema: Type[BaseModel]) -> Relaciones:
+    relaciones = {}
+    for nombre, campo in esquema.model_fields.items():
+        tipo = campo.annotation
+        es_lista = typing.get_origin(tipo) in (list, List)
+        if es_lista:
+            tipo = typing.get_args(tipo)[0]
+        if isinstance(tipo, type) and issubclass(tipo, BaseModel):
+            relaciones[nombre] = (tipo, es_lista)
+    return relaciones
+
+
+def compilar(esquema: Type[BaseModel]) -> Compilado:
+    compilado = _compilados.get(esquema)
+    if compilado is None:
+        compilado = _compilados[esquema] = Compilado(TypeAdapter(List[esquema]), _relaciones(esquema))
+        for subesquema, _ in compilado.relaciones.values():
+            compilar(subesquema)
+    return compilado
+
+
+def preparar():
+    """Construye los TypeAdapter de los listados una sola vez (se llama al arrancar)."""
+    for esquema in ESQUEMAS_LISTADOS:
+        compilar(esquema)
+    logger.info(f"Serialización rápida de listados {'activada' if FAST_JSON_RESPONSES else 'desactivada'}")
+
+
+def _a_dict(objeto: Any, relaciones: Relaciones) -> Any:
+    # El __dict__ de un objeto del ORM ya tiene las columnas cargadas: leerlo es mucho más
+    # barato que pasar por los descriptores de cada atributo (from_attributes)
+    if objeto is None or isinstance(objeto, BaseModel):
+        return objeto
+    datos = dict(objeto.__dict__)
+    for nombre, (subesquema, es_lista) in relaciones.items():
+        valor = getattr(objeto, nombre)
+        subrelaciones = _compilados[subesquema].relaciones
+        datos[nombre] = [_a_dict(v, subrelaciones) for v in valor] if es_lista else _a_dict(valor, subrelaciones)
+    return datos
+
+
+@metricas.seccion("serializacion")
+def codificar_lista(esquema: Type[BaseModel], filas: Sequence[Any]) -> bytes:
+    """Valida las filas con el TypeAdapter del esquema y las serializa a JSON en pydantic-core."""
+    adaptador, relaciones = compilar(esquema)
+    try:
+        validadas = adaptador.validate_python([_a_dict(fila, relaciones) for fila in filas])
+    except ValidationError:
+        # Algún atributo no estaba cargado (p. ej. caducado tras un commit): ruta lenta
+        validadas = adaptador.validate_python(filas, from_attributes=True)
+    return adaptador.dump_json(validadas)
+
+
+def respuesta_lista(esquema: Type[BaseModel], filas: Sequence[Any], response: Optional[Response] = None):
+    """Con FAST_JSON_RESPONSES devuelve la respuesta ya codificada (conservando las cabeceras
+    puestas en `response`); si no, devuelve las filas para que FastAPI las serialice."""
+    if not FAST_JSON_RESPONSES:
+        return filas
+    cabeceras = dict(response.headers) if response is not None else None
+    return Response(content=codificar_lista(esquema, filas), media_type="application/json", headers=cabeceras)
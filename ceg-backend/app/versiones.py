@@ -0,0 +1,33 @@
+import hashlib
+from typing import Optional
+
+from fastapi import Request, Response
+from sqlalchemy.orm import Session
+
+from app import cambios
+
+
+def etag(db: Session, ambito: str, request: Request, *extra) -> str:
+    """ETag débil a partir de la versión del ámbito, los parámetros de la URL y `extra`.
+
+    La versión es la del último cambio del ámbito en el registro compartido (app.cambios),
+    la misma en todos los workers y tras un reinicio. Se lee *antes* de consultar: si una
+    escritura se cuela durante la consulta, el siguiente sondeo verá otra versión y
+    descargará los datos de nuevo.
+    """
+    cambios.registro.sincronizar(db)
+    partes = [str(cambios.registro.versiones.get(ambito, 0)), request.url.query, *map(str, extra)]
+    resumen = hashlib.sha1("|".join(partes).encode()).hexdigest()[:16]
+    return f'W/"{ambito}-{resumen}"'
+
+
+def no_modificado(request: Request, valor_etag: str) -> Optional[Response]:
+    """Respuesta 304 si el cliente ya tiene esa versión (If-None-Match), o None."""
+    cabecera = request.headers.get("if-none-match")
+    if not cabecera:
+        return None
+    # Comparación débil: se ignora el prefijo W/ de ambos lados
+    candidatas = {c.strip().removeprefix("W/") for c in cabecera.split(",")}
+    if "*" in candidatas or valor_etag.removeprefix("W/") in candidatas:
+        return Response(status_code=304, headers={"ETag": valor_etag})
+    return None
@@ -0,0 +1,343 @@
+"""Carga y latencia de los flujos reales de la API de reservas.
+
+Trabaja sobre una copia de test.db (o de la base que se indique) con las migraciones al
+día, añade pistas y socios de prueba,
+lanza cada escenario con N peticiones concurrentes y escribe un JSON con p50/p95/p99 y
+peticiones por segundo de cada uno, junto con el commit, para comparar entre versiones.
+
+Modos:
+  asgi     la aplicación en este mismo proceso, a través de httpx.ASGITransport
+  uvicorn  un servidor uvicorn con --workers N en un puerto local
+
+Uso (desde ceg-backend):
+  python -m bench.carga [--modo asgi|uvicorn] [--workers 4] [--concurrencia 16] [--salida run.json]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import platform
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ESCENARIOS = ("login", "reservar", "tablero", "verificar", "mis_reservas")
+
+# (método, url, argumentos de httpx)
+Peticion = Tuple[str, str, Dict[str, Any]]
+
+
+def preparar_base(origen: str, directorio: str) -> str:
+    """Copia la base SQLite `origen` y le aplica las migraciones (también los triggers de
+    solapamiento). Las migraciones no crean el esquema desde cero, así que se parte de una
+    base existente. Devuelve la URL de la copia."""
+    from alembic import command
+    from alembic.config import Config
+
+    destino = os.path.join(directorio, "carga.db")
+    shutil.copyfile(origen, destino)
+    url = f"sqlite:///{destino}"
+    configuracion = Config(os.path.join(RAIZ, "alembic.ini"))
+    configuracion.set_main_option("script_location", os.path.join(RAIZ, "alembic"))
+    os.environ["DATABASE_URL"] = url
+    command.upgrade(configuracion, "head")
+    return url
+
+
+def sembrar(pistas: int, socios: int, password: str) -> Tuple[List[int], List[Tuple[str, str, str]]]:
+    """Crea las pistas y los socios de la prueba; devuelve los ids de pista y (email, nombre, apellido)."""
+    from app import crud, models, schemas
+    from app.database import SessionLocal
+
+    with SessionLocal() as db:
+        nuevas = [
+            models.Pista(name=f"Pista carga {i}", tipo_pista="tierra", tiempo_juego=60, individuales=True)
+            for i in range(pistas)
+        ]
+        db.add_all(nuevas)
+        db.commit()
+        ids_pista = [p.id for p in nuevas]
+        nuevos = [
+            schemas.SocioCreate(name=f"Socio{i}", lastname="Carga", email=f"socio{i}@carga.es",
+                                phone="600000000", type="Socio", password=password)
+            for i in range(socios)
+        ]
+        crud.create_socios_bulk(db, nuevos)
+    return ids_pista, [(s.email, s.name, s.lastname) for s in nuevos]
+
+
+def franjas(horas: int) -> List[datetime]:
+    # Inicios de hora dentro de la ventana de 24 horas en la que se permite reservar; la
+    # franja de las 23:00 se salta porque terminaría al día siguiente
+    primera = (datetime.now() + timedelta(hours=1)).replace(minute=0, second=0, microsecond=0)
+    inicios = (primera + timedelta(hours=h) for h in range(horas))
+    return [inicio for inicio in inicios if inicio.hour < 23]
+
+
+def peticiones_reserva(pistas: List[int], socios: List[Tuple[str, str, str]], horas: int,
+                       contencion: int, azar: random.Random) -> List[Peticion]:
+    """Una reserva por pista y franja (repetida `contencion` veces para que compitan).
+
+    En cada franja, cada pista lleva una pareja de socios distinta, así que solo chocan las
+    copias de la misma reserva: se acepta una y el resto recibe 400/409.
+    """
+    peticiones = []
+    for inicio in franjas(horas):
+        for orden, pista_id in enumerate(pistas):
+            jugadores = [socios[(2 * orden + k) % len(socios)] for k in range(2)]
+            cuerpo = {
+                "dia": inicio.date().isoformat(),
+                "hora_inicio": inicio.strftime("%H:%M"),
+                "hora_fin": (inicio + timedelta(hours=1)).strftime("%H:%M"),
+                "pista_id": pista_id,
+                "individuales": True,
+                "jugadores": [{"name": n, "apellido": a, "tipo_jugador": "Socio"} for _, n, a in jugadores],
+            }
+            peticiones += [("POST", "/reservas/", {"json": cuerpo})] * contencion
+    azar.shuffle(peticiones)
+    return peticiones
+
+
+def peticiones_verificar(pistas: List[int], socios: List[Tuple[str, str, str]], horas: int,
+                         total: int, azar: random.Random) -> List[Peticion]:
+    peticiones = []
+    inicios = franjas(horas)
+    for i in range(total):
+        inicio = azar.choice(inicios)
+        params = {"dia": inicio.date().isoformat(), "hora_inicio": inicio.strftime("%H:%M"),
+                  "hora_fin": (inicio + timedelta(hours=1)).strftime("%H:%M")}
+        if i % 2:
+            _, nombre, apellido = azar.choice(socios)
+            peticiones.append(("GET", "/reservas/verificar_solapamiento_jugador/",
+                               {"params": {**params, "nombre": nombre, "apellido": apellido}}))
+        else:
+            peticiones.append(("GET", "/reservas/verificar_solapamiento_pista/",
+                               {"params": {**params, "pista_id": azar.choice(pistas)}}))
+    return peticiones
+
+
+def percentil(ordenados: List[float], p: float) -> float:
+    if not ordenados:
+        return 0.0
+    # Método del rango más cercano
+    return ordenados[max(0, math.ceil(p / 100 * len(ordenados)) - 1)]
+
+
+def resumen(tiempos: List[float], estados: Counter, duracion: float) -> dict:
+    ordenados = sorted(tiempos)
+    ms = lambda s: round(s * 1000, 2)
+    return {
+        "peticiones": len(tiempos),
+        "errores": sum(v for k, v in estados.items() if k == "error" or int(k) >= 500),
+        "estados": dict(sorted(estados.items())),
+        "duracion_s": round(duracion, 3),
+        "rps": round(len(tiempos) / duracion, 1) if duracion else 0.0,
+        "media_ms": ms(sum(ordenados) / len(ordenados)) if ordenados else 0.0,
+        "p50_ms": ms(percentil(ordenados, 50)),
+        "p95_ms": ms(percentil(ordenados, 95)),
+        "p99_ms": ms(percentil(ordenados, 99)),
+        "max_ms": ms(ordenados[-1]) if ordenados else 0.0,
+    }
+
+
+async def lanzar(cliente: httpx.AsyncClient, peticiones: List[Peticion], concurrencia: int) -> Tuple[dict, List[httpx.Response]]:
+    """Ejecuta las peticiones con `concurrencia` clientes a la vez y resume sus latencias."""
+    tiempos: List[float] = []
+    estados: Counter = Counter()
+    respuestas: List[Optional[httpx.Response]] = [None] * len(peticiones)
+    pendientes = iter(enumerate(peticiones))
+
+    async def cliente_virtual():
+        for indice, (metodo, url, argumentos) in pendientes:
+            inicio = time.perf_counter()
+            try:
+                respuesta = await cliente.request(metodo, url, **argumentos)
+            except httpx.HTTPError:
+                estados["error"] += 1
+            else:
+                estados[str(respuesta.status_code)] += 1
+                respuestas[indice] = respuesta
+            tiempos.append(time.perf_counter() - inicio)
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(cliente_virtual() for _ in range(concurrencia)))
+    return resumen(tiempos, estados, time.perf_counter() - inicio), respuestas
+
+
+async def ejecutar(cliente: httpx.AsyncClient, args, pistas, socios) -> Dict[str, dict]:
+    azar = random.Random(args.semilla)
+    resultados = {}
+
+    async def escenario(nombre: str, peticiones: List[Peticion]) -> List[httpx.Response]:
+        if nombre not in args.escenarios:
+            return []
+        if args.calentamiento and nombre not in ("login", "reservar"):
+            await lanzar(cliente, peticiones[:args.calentamiento], args.concurrencia)
+        resultados[nombre], respuestas = await lanzar(cliente, peticiones, args.concurrencia)
+        print(f"{nombre}: {json.dumps(resultados[nombre])}", file=sys.stderr)
+        return respuestas
+
+    logins = [("POST", "/token_socio", {"data": {"username": email, "password": args.password}})
+              for email, _, _ in socios]
+    logins = (logins * (args.logins // len(logins) + 1))[:args.logins]
+    respuestas = await escenario("login", logins)
+    tokens = [r.json()["access_token"] for r in respuestas if r is not None and r.status_code == 200]
+    if not tokens:
+        # Sin el escenario de login también hacen falta tokens para mis-reservas
+        _, respuestas = await lanzar(cliente, logins[:len(socios)], args.concurrencia)
+        tokens = [r.json()["access_token"] for r in respuestas if r is not None and r.status_code == 200]
+
+    await escenario("reservar", peticiones_reserva(pistas, socios, args.horas, args.contencion, azar))
+    await escenario("tablero", [("GET", "/reservas/", {})] * args.peticiones)
+    await escenario("verificar", peticiones_verificar(pistas, socios, args.horas, args.peticiones, azar))
+    await escenario("mis_reservas", [
+        ("GET", "/reservas/mis-reservas", {"headers": {"Authorization": f"Bearer {tokens[i % len(tokens)]}"}})
+        for i in range(args.peticiones)
+    ] if tokens else [])
+    return resultados
+
+
+async def modo_asgi(args, pistas, socios) -> Dict[str, dict]:
+    from app.main import app
+
+    # Los rechazos esperados de las reservas que compiten se registran como errores: en
+    # este modo se silencia el log de la aplicación para que no tape los resultados
+    logging.getLogger("app").setLevel(logging.CRITICAL)
+    # ASGITransport no envía los eventos de lifespan: el arranque (índice de ocupación,
+    # TypeAdapters...) se lanza a mano, igual que haría el servidor
+    await app.router.startup()
+    try:
+        transporte = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transporte, base_url="http://carga") as cliente:
+            return await ejecutar(cliente, args, pistas, socios)
+    finally:
+        await app.router.shutdown()
+
+
+def _puerto_libre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def modo_uvicorn(args, pistas, socios, directorio: str) -> Dict[str, dict]:
+    puerto = args.puerto or _puerto_libre()
+    registro = open(os.path.join(directorio, "uvicorn.log"), "wb")
+    servidor = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(puerto),
+         "--workers", str(args.workers), "--log-level", "warning", "--no-access-log"],
+        cwd=RAIZ, env=os.environ.copy(), stdout=registro, stderr=subprocess.STDOUT
+    )
+    limites = httpx.Limits(max_connections=args.concurrencia, max_keepalive_connections=args.concurrencia)
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{puerto}", limits=limites, timeout=60) as cliente:
+            for _ in range(300):
+                if servidor.poll() is not None:
+                    raise SystemExit(f"uvicorn ha terminado al arrancar; ver {registro.name}")
+                try:
+                    if (await cliente.get("/pistas/")).status_code == 200:
+                        break
+                except httpx.TransportError:
+                    pass
+                await asyncio.sleep(0.1)
+            else:
+                raise SystemExit(f"uvicorn no responde en el puerto {puerto}; ver {registro.name}")
+            return await ejecutar(cliente, args, pistas, socios)
+    finally:
+        servidor.terminate()
+        try:
+            servidor.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            servidor.kill()
+        registro.close()
+
+
+def commit_actual() -> Optional[str]:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=RAIZ, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        cambios = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=RAIZ,
+                                 capture_output=True, text=True, check=True).stdout.strip()
+        return commit + ("-sucio" if cambios else "")
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def argumentos(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--modo", choices=("asgi", "uvicorn"), default="asgi")
+    parser.add_argument("--workers", type=int, default=4, help="workers de uvicorn (modo uvicorn)")
+    parser.add_argument("--puerto", type=int, default=0, help="puerto de uvicorn (0 = uno libre)")
+    parser.add_argument("--concurrencia", type=int, default=16, help="peticiones simultáneas")
+    parser.add_argument("--peticiones", type=int, default=500, help="peticiones por escenario de lectura")
+    parser.add_argument("--logins", type=int, default=50)
+    parser.add_argument("--calentamiento", type=int, default=20, help="peticiones previas no medidas")
+    parser.add_argument("--pistas", type=int, default=4)
+    parser.add_argument("--socios", type=int, default=20)
+    parser.add_argument("--horas", type=int, default=20, help="franjas de una hora que se reservan")
+    parser.add_argument("--contencion", type=int, default=2, help="copias de cada reserva que compiten")
+    parser.add_argument("--semilla", type=int, default=1)
+    parser.add_argument("--password", default="carga")
+    parser.add_argument("--escenarios", nargs="+", choices=ESCENARIOS, default=list(ESCENARIOS))
+    parser.add_argument("--base", default=os.path.join(RAIZ, "test.db"), help="base SQLite de partida (se copia)")
+    parser.add_argument("--salida", help="fichero JSON de resultados (por defecto, la salida estándar)")
+    parser.add_argument("--conservar", action="store_true", help="no borrar la base de datos temporal")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = argumentos(argv)
+    if args.socios < 2 * args.pistas:
+        raise SystemExit("Hacen falta al menos dos socios por pista")
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger().setLevel(logging.WARNING)
+
+    directorio = tempfile.mkdtemp(prefix="ceg-carga-")
+    try:
+        preparar_base(args.base, directorio)
+        # La aplicación lee la configuración al importarse: se importa ya con la base nueva
+        os.environ.pop("ASYNC_DATABASE_URL", None)
+        pistas, socios = sembrar(args.pistas, args.socios, args.password)
+        if args.modo == "asgi":
+            escenarios = asyncio.run(modo_asgi(args, pistas, socios))
+        else:
+            escenarios = asyncio.run(modo_uvicorn(args, pistas, socios, directorio))
+    finally:
+        if args.conservar:
+            print(f"Base de datos conservada en {directorio}", file=sys.stderr)
+        else:
+            shutil.rmtree(directorio, ignore_errors=True)
+
+    resultado = {
+        "commit": commit_actual(),
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "modo": args.modo,
+        "workers": args.workers if args.modo == "uvicorn" else 1,
+        "concurrencia": args.concurrencia,
+        "python": platform.python_version(),
+        "configuracion": {k: getattr(args, k) for k in ("peticiones", "logins", "pistas", "socios", "horas", "contencion", "semilla")},
+        "escenarios": escenarios,
+    }
+    texto = json.dumps(resultado, indent=2, ensure_ascii=False)
+    if args.salida:
+        with open(args.salida, "w") as fichero:
+            fichero.write(texto + "\n")
+    else:
+        print(texto)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Tiempo de codificación de los listados por cada 1000 filas: ruta de FastAPI frente a la
+ruta rápida de app.serializacion (y orjson si está instalado, como referencia).
+
+Uso (desde ceg-backend): python -m bench.serializacion [filas] [repeticiones]
+"""
+import asyncio
+import json
+import sys
+import time
+from datetime import date, time as hora
+from typing import Callable, List
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+from pydantic import TypeAdapter
+
+from app import models, schemas, serializacion
+
+
+def reservas(n: int) -> List[models.Reserva]:
+    return [
+        models.Reserva(
+            id=i, pista_id=i % 8 + 1, dia=date(2026, 1, 1), hora_inicio=hora(i % 14 + 8), hora_fin=hora(i % 14 + 9),
+            individuales=i % 2 == 0,
+            jugadores=[
+                models.Jugador(id=i * 4 + k, name=f"Nombre{k}", apellido=f"Apellido{i}", tipo_jugador="socio", reserva_id=i)
+                for k in range(4)
+            ]
+        )
+        for i in range(n)
+    ]
+
+
+def socios(n: int) -> List[models.Socio]:
+    return [
+        models.Socio(id=i, name=f"Nombre{i}", lastname=f"Apellido{i}", email=f"socio{i}@club.es",
+                     phone="600000000", type="socio", hashed_password="x")
+        for i in range(n)
+    ]
+
+
+def mediana_ms(funcion: Callable[[], bytes], repeticiones: int) -> float:
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        funcion()
+        tiempos.append(time.perf_counter() - inicio)
+    return sorted(tiempos)[len(tiempos) // 2] * 1000
+
+
+def rutas(esquema, filas):
+    campo = create_response_field(name="Response", type_=List[esquema], mode="serialization")
+    bucle = asyncio.new_event_loop()
+
+    def fastapi():
+        contenido = bucle.run_until_complete(serialize_response(field=campo, response_content=filas))
+        return JSONResponse(contenido).body
+
+    resultado = {"fastapi": fastapi, "rapida": lambda: serializacion.codificar_lista(esquema, filas)}
+    try:
+        import orjson
+    except ImportError:
+        return resultado
+    adaptador = TypeAdapter(List[esquema])
+    resultado["orjson"] = lambda: orjson.dumps(adaptador.dump_python(
+        adaptador.validate_python(filas, from_attributes=True), mode="json"))
+    return resultado
+
+
+def main(n: int = 1000, repeticiones: int = 30):
+    serializacion.preparar()
+    for esquema, filas in ((schemas.Reserva, reservas(n)), (schemas.Socio, socios(n))):
+        funciones = rutas(esquema, filas)
+        referencia = json.loads(funciones["fastapi"]())
+        for nombre, funcion in funciones.items():
+            if json.loads(funcion()) != referencia:
+                raise SystemExit(f"{esquema.__name__}/{nombre}: la salida no coincide con la de FastAPI")
+            ms = mediana_ms(funcion, repeticiones) * 1000 / n
+            print(f"{esquema.__name__:<10} {nombre:<8} {ms:8.2f} ms / 1000 filas")
+
+
+if __name__ == "__main__":
+    main(*(int(a) for a in sys.argv[1:3]))
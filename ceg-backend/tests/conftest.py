@@ -0,0 +1,76 @@
+import os
+import tempfile
+from datetime import date, time, timedelta
+
+# La aplicación crea sus motores al importarse: la base de pruebas (un fichero temporal, no
+# test.db) tiene que estar configurada antes de importar nada de app
+_directorio = tempfile.TemporaryDirectory(prefix="ceg-tests-")
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(_directorio.name, "tests.db")
+os.environ.pop("ASYNC_DATABASE_URL", None)
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import cambios, models
+from app.database import Base, SessionLocal, engine
+
+
+@pytest.fixture(scope="session", autouse=True)
+def esquema():
+    Base.metadata.create_all(bind=engine)
+    yield
+    engine.dispose()
+    _directorio.cleanup()
+
+
+@pytest.fixture(scope="session")
+def cliente(esquema):
+    """Cliente HTTP de la aplicación (con su arranque y su parada, una vez por sesión)."""
+    from app.main import app
+    with TestClient(app) as cliente:
+        yield cliente
+
+
+@pytest.fixture
+def db():
+    sesion = SessionLocal()
+    try:
+        yield sesion
+    finally:
+        sesion.rollback()
+        # Cada prueba empieza con las tablas vacías (el contador de cambios sigue avanzando)
+        # y con las cachés del proceso por cargar
+        for tabla in reversed(Base.metadata.sorted_tables):
+            if tabla is not models.ContadorCambios.__table__:
+                sesion.execute(tabla.delete())
+        sesion.commit()
+        sesion.close()
+        cambios.registro.reiniciar()
+
+
+@pytest.fixture
+def sembrar(db):
+    """Devuelve una función que añade n reservas para mañana, cada una en su pista.
+
+    En todas juega «Plan Consulta» (el jugador que usan las comprobaciones de
+    tests.planes_consulta) junto a otro jugador distinto por reserva.
+    """
+    creadas = 0
+
+    def sembrar_reservas(n: int):
+        nonlocal creadas
+        dia = date.today() + timedelta(days=1)
+        for _ in range(n):
+            creadas += 1
+            pista = models.Pista(name=f"Pista prueba {creadas}", tipo_pista="tierra", tiempo_juego=60, individuales=True)
+            db.add(models.Reserva(
+                pista=pista, dia=dia, hora_inicio=time(0, 0), hora_fin=time(0, 30), individuales=True,
+                jugadores=[
+                    models.Jugador(name="Plan", apellido="Consulta", tipo_jugador="Socio"),
+                    models.Jugador(name=f"Jugador {creadas}", apellido="Prueba", tipo_jugador="No Socio"),
+                ],
+            ))
+        db.commit()
+
+    return sembrar_reservas
@@ -0,0 +1,183 @@
+import json
+from contextlib import contextmanager
+from datetime import date, datetime, time, timedelta
+from typing import Callable, Dict, List, Tuple
+
+from fastapi import Request, Response
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session
+
+from app import crud, models, schemas, cambios, catalogo
+from app.reserva_validations import verificar_reserva, buscar_solapamientos_jugadores
+from app.routers.reservas import verificar_solapamiento_pista, read_reservas
+
+
+@contextmanager
+def capturar_sentencias(db: Session):
+    """Guarda las sentencias SQL (y sus parámetros) que se ejecutan dentro del bloque."""
+    sentencias = []
+    engine = db.get_bind()
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if not executemany:
+            sentencias.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield sentencias
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+def _peticion(ruta: str) -> Request:
+    # Petición mínima para llamar directamente a los endpoints que leen cabeceras (ETag)
+    return Request({"type": "http", "method": "GET", "path": ruta, "query_string": b"", "headers": []})
+
+
+def _consultas(db: Session) -> List[Tuple[str, Callable[[], object], Tuple[str, ...]]]:
+    # Un día anterior a hoy obliga a consultar la base de datos aunque el índice de
+    # ocupación esté cargado
+    ayer = date.today() - timedelta(days=1)
+    pista = db.query(models.Pista).first()
+    pista_id = pista.id if pista else 0
+    reserva = schemas.ReservaUpdate(
+        pista_id=pista_id,
+        dia=ayer,
+        hora_inicio=time(10, 0),
+        hora_fin=time(11, 0),
+        individuales=True,
+        jugadores=[
+            schemas.JugadorCreate(name="Plan", apellido="Consulta"),
+            schemas.JugadorCreate(name="Otro", apellido="Jugador")
+        ]
+    )
+
+    # (nombre, función, índices de los que debe usarse al menos uno)
+    consultas = [
+        ("buscar_solapamientos_jugadores",
+         lambda: buscar_solapamientos_jugadores(db, [("Plan", "Consulta"), ("Otro", "Jugador")], ayer, time(10, 0), time(11, 0)),
+         ("ix_jugadores_name_apellido_reserva", "ix_reservas_dia_horas")),
+        ("verificar_solapamiento_pista",
+         lambda: verificar_solapamiento_pista(db, pista_id, ayer, time(10, 0), time(11, 0)),
+         ("ix_reservas_pista_dia_horas",)),
+        ("read_reservas", lambda: read_reservas(request=_peticion("/reservas/"), response=Response(), db=db), ()),
+        ("crud.get_socio_by_name_and_lastname",
+         lambda: crud.get_socio_by_name_and_lastname(db, "Plan", "Consulta"),
+         ("ix_socios_name_lastname",)),
+        ("crud.get_reservas_by_jugador",
+         lambda: crud.get_reservas_by_jugador(db, "Plan", "Consulta"),
+         ("ix_jugadores_name_apellido_reserva",)),
+        ("crud.get_reservas_by_jugador (ventana)",
+         lambda: crud.get_reservas_by_jugador(db, "Plan", "Consulta", desde=datetime.now(), hasta=datetime.now() + timedelta(hours=24)),
+         ("ix_jugadores_name_apellido_reserva",)),
+        ("crud.get_reservas", lambda: crud.get_reservas(db), ()),
+        ("Reserva.jugadores",
+         lambda: db.query(models.Jugador).filter(models.Jugador.reserva_id == 0).all(),
+         ("ix_jugadores_reserva_id",)),
+    ]
+    if pista:
+        consultas.insert(0, ("verificar_reserva",
+                             lambda: verificar_reserva(db, reserva),
+                             ("ix_jugadores_name_apellido_reserva", "ix_reservas_dia_horas", "ix_reservas_pista_dia_horas")))
+    return consultas
+
+
+def _recorre_tabla(detalle: str) -> bool:
+    # "SCAN jugadores" o "SCAN jugadores_1" (alias de joinedload); las subconsultas
+    # (anon_1) y los recorridos sobre un índice ("SCAN ... USING INDEX") no cuentan
+    partes = detalle.split()
+    if len(partes) != 2 or partes[0] != "SCAN":
+        return False
+    return partes[1].rstrip("_0123456789") in models.Base.metadata.tables
+
+
+def comprobar_planes(db: Session) -> List[str]:
+    """Ejecuta EXPLAIN QUERY PLAN sobre las consultas críticas y devuelve los problemas encontrados.
+
+    Una consulta es correcta si ninguna tabla se recorre entera y, cuando se indica,
+    el plan usa alguno de los índices esperados. Solo aplica a SQLite.
+    """
+    if db.get_bind().dialect.name != "sqlite":
+        return []
+
+    # El catálogo de pistas se carga entero a propósito (es una tabla diminuta);
+    # se calienta antes para que esa carga no cuente como recorrido de tabla
+    catalogo.pistas.listar(db)
+
+    problemas = []
+    for nombre, funcion, indices in _consultas(db):
+        with capturar_sentencias(db) as sentencias:
+            funcion()
+
+        detalles = []
+        for sentencia, parametros in sentencias:
+            plan = db.connection().exec_driver_sql("EXPLAIN QUERY PLAN " + sentencia, parametros).all()
+            detalles.extend(fila[-1] for fila in plan)
+
+        for detalle in detalles:
+            if _recorre_tabla(detalle):
+                problemas.append(f"{nombre}: recorre la tabla entera ({detalle})")
+        if indices and not any(indice in detalle for detalle in detalles for indice in indices):
+            problemas.append(f"{nombre}: no usa ninguno de los índices {', '.join(indices)} ({'; '.join(detalles)})")
+
+    db.rollback()
+    return problemas
+
+
+# Sentencias máximas que puede lanzar cada lectura (incluida la serialización de la
+# respuesta), sea cual sea el número de filas: si crece, hay cargas perezosas N+1
+PRESUPUESTO_SENTENCIAS = {
+    "read_reservas": 3,  # incluye la lectura del registro de cambios para el ETag
+    "crud.get_reservas_by_jugador": 3,
+    "crud.get_reservas": 2,
+}
+
+
+def _serializar(esquema, resultado):
+    # Con FAST_JSON_RESPONSES el endpoint ya devuelve la respuesta codificada
+    if isinstance(resultado, Response):
+        return json.loads(resultado.body)
+    return [esquema.model_validate(r) for r in resultado]
+
+
+def _lecturas(db: Session) -> List[Tuple[str, Callable[[], object]]]:
+    # El jugador con más reservas es el caso más exigente para get_reservas_by_jugador
+    jugador = db.query(models.Jugador.name, models.Jugador.apellido).group_by(
+        models.Jugador.name, models.Jugador.apellido
+    ).order_by(func.count().desc()).first()
+    name, apellido = jugador if jugador else ("Plan", "Consulta")
+
+    return [
+        ("read_reservas",
+         lambda: _serializar(schemas.Reserva, read_reservas(request=_peticion("/reservas/"), response=Response(), db=db))),
+        ("crud.get_reservas_by_jugador",
+         lambda: [schemas.ReservaConPista.model_validate(r) for r in crud.get_reservas_by_jugador(db, name, apellido)]),
+        ("crud.get_reservas",
+         lambda: [schemas.Reserva.model_validate(r) for r in crud.get_reservas(db)]),
+    ]
+
+
+def contar_sentencias(db: Session) -> Dict[str, int]:
+    """Sentencias que lanza cada lectura, incluida la serialización de la respuesta."""
+    cuentas = {}
+    # Las cachés del proceso se cargan una vez, fuera de la cuenta
+    cambios.registro.sincronizar(db)
+    for nombre, funcion in _lecturas(db):
+        # Sin objetos en la sesión, cada lectura paga todas sus cargas
+        db.expunge_all()
+        with capturar_sentencias(db) as sentencias:
+            funcion()
+        cuentas[nombre] = len(sentencias)
+
+    db.rollback()
+    return cuentas
+
+
+def comprobar_presupuesto(db: Session) -> List[str]:
+    """Devuelve las lecturas que superan su presupuesto de sentencias."""
+    return [
+        f"{nombre}: {cuenta} sentencias (máximo {PRESUPUESTO_SENTENCIAS[nombre]})"
+        for nombre, cuenta in contar_sentencias(db).items()
+        if cuenta > PRESUPUESTO_SENTENCIAS[nombre]
+    ]
+
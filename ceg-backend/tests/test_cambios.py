@@ -0,0 +1,92 @@
+from datetime import date, time, timedelta
+
+from app import cambios, crud, models, ocupacion, schemas
+
+
+def _otro_worker():
+    # Un registro y un índice propios, como los de otro proceso sobre la misma base de datos
+    registro = cambios.RegistroCambios()
+    indice = ocupacion.IndiceOcupacion()
+    registro.al_iniciar(lambda db, version: indice.cargar(db))
+    registro.suscribir("reservas", indice.aplicar)
+    registro.al_sincronizar(indice.avanzar)
+    return registro, indice
+
+
+def _reserva(pista_id, hora_inicio, hora_fin):
+    return schemas.ReservaCreate(
+        pista_id=pista_id, dia=date.today() + timedelta(days=1), hora_inicio=hora_inicio, hora_fin=hora_fin,
+        individuales=True, jugadores=[
+            schemas.JugadorCreate(name="Ana", apellido="Uno", tipo_jugador="Socio"),
+            schemas.JugadorCreate(name="Bea", apellido="Dos", tipo_jugador="No Socio"),
+        ],
+    )
+
+
+def test_el_indice_de_otro_worker_ve_las_escrituras(db):
+    pista = models.Pista(name="Central", tipo_pista="tierra", tiempo_juego=60, individuales=True)
+    db.add(pista)
+    db.commit()
+    registro, indice = _otro_worker()
+    registro.sincronizar(db)
+    manana = date.today() + timedelta(days=1)
+
+    creada = crud.create_reserva(db, _reserva(pista.id, time(10, 0), time(11, 0)))
+    assert indice.solapamiento(pista.id, manana, time(10, 30), time(11, 30)) is None
+    registro.sincronizar(db)
+    assert indice.solapamiento(pista.id, manana, time(10, 30), time(11, 30)) == (time(10, 0), time(11, 0), creada.id)
+
+    actualizada = _reserva(pista.id, time(12, 0), time(13, 0)).model_dump(exclude={"individuales"})
+    crud.update_reserva(db, creada.id, schemas.ReservaUpdateWithJugadores(**actualizada))
+    registro.sincronizar(db)
+    assert indice.solapamiento(pista.id, manana, time(10, 30), time(11, 30)) is None
+    assert indice.solapamiento(pista.id, manana, time(12, 30), time(13, 30)) is not None
+
+    crud.delete_reserva(db, creada.id)
+    registro.sincronizar(db)
+    assert indice.solapamiento(pista.id, manana, time(12, 30), time(13, 30)) is None
+
+
+def test_un_worker_atrasado_recarga_si_faltan_cambios(db):
+    pista = models.Pista(name="Central", tipo_pista="tierra", tiempo_juego=60, individuales=True)
+    db.add(pista)
+    db.commit()
+    registro, indice = _otro_worker()
+    registro.sincronizar(db)
+
+    creada = crud.create_reserva(db, _reserva(pista.id, time(10, 0), time(11, 0)))
+    crud.create_reserva(db, _reserva(pista.id, time(11, 0), time(12, 0)))
+    # La poda se ha llevado el primer cambio antes de que este worker lo leyera
+    db.query(models.Cambio).filter(models.Cambio.clave == creada.id).delete()
+    db.commit()
+    registro.sincronizar(db)
+
+    assert registro.recargas == 1
+    assert indice.solapamiento(pista.id, date.today() + timedelta(days=1), time(10, 0), time(12, 0)) is not None
+
+
+def test_el_indice_descarta_los_dias_pasados(db, monkeypatch):
+    pista = models.Pista(name="Central", tipo_pista="tierra", tiempo_juego=60, individuales=True)
+    db.add(pista)
+    db.commit()
+    registro, indice = _otro_worker()
+    registro.sincronizar(db)
+    manana = date.today() + timedelta(days=1)
+    pasado_manana = manana + timedelta(days=1)
+    crud.create_reserva(db, _reserva(pista.id, time(10, 0), time(11, 0)))
+    registro.sincronizar(db)
+    assert indice.mapa(pista.id, manana)
+
+    class _PasadoManana(date):
+        @classmethod
+        def today(cls):
+            return pasado_manana
+
+    # El worker sigue vivo cuando cambia el día: la siguiente sincronización avanza el índice
+    monkeypatch.setattr(ocupacion, "date", _PasadoManana)
+    registro.sincronizar(db)
+
+    assert not indice.cubre(manana)
+    assert indice.cubre(pasado_manana)
+    assert indice.mapa(pista.id, manana) == 0
+    assert indice.intervalos(pista.id, manana) == []
@@ -0,0 +1,25 @@
+from app import cambios, catalogo, crud, models, schemas
+
+
+def test_crud_devuelve_objetos_del_orm(db):
+    creada = crud.create_pista(db, schemas.PistaCreate(name="Central", tipo_pista="tierra", tiempo_juego=60, individuales=True))
+    assert isinstance(crud.get_pista(db, creada.id), models.Pista)
+    assert [p.id for p in crud.get_pistas(db, limit=None)] == [creada.id]
+    assert isinstance(catalogo.pistas.obtener(db, creada.id), schemas.Pista)
+
+
+def test_el_catalogo_ve_los_cambios_de_otro_worker(db):
+    pista = crud.create_pista(db, schemas.PistaCreate(name="Central", tipo_pista="tierra", tiempo_juego=60, individuales=True))
+    assert catalogo.pistas.obtener(db, pista.id).name == "Central"
+
+    # Otro worker modifica la pista: este proceso solo se entera por el registro de cambios
+    db.query(models.Pista).filter(models.Pista.id == pista.id).update({"name": "Pista 1"})
+    cambios.registrar(db, "pistas", "actualizada", pista.id)
+    db.commit()
+    assert catalogo.pistas.obtener(db, pista.id).name == "Pista 1"
+
+    db.query(models.Pista).filter(models.Pista.id == pista.id).delete()
+    cambios.registrar(db, "pistas", "eliminada", pista.id)
+    db.commit()
+    assert catalogo.pistas.obtener(db, pista.id) is None
+    assert catalogo.pistas.listar(db) == []
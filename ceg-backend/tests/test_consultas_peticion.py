@@ -0,0 +1,69 @@
+import logging
+import re
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from app import metricas, models
+from app.database import SQL_REPEAT_THRESHOLD, SessionLocal, async_engine, engine
+
+
+def _app_de_prueba():
+    app = FastAPI()
+    app.add_middleware(metricas.ConsultasMiddleware)
+
+    @app.get("/pistas/{n}")
+    def pistas(n: int):
+        # Una consulta por pista: la forma de la sentencia se repite n veces (N+1)
+        with SessionLocal() as db:
+            return [db.query(models.Pista).filter(models.Pista.id == i).first() is not None for i in range(n)]
+
+    return app
+
+
+def _sentencias(cabecera: str) -> int:
+    return int(re.match(r'db;desc="(\d+) sentencias";dur=[\d.]+, db-max;dur=[\d.]+$', cabecera).group(1))
+
+
+def test_server_timing_cuenta_las_sentencias_de_la_peticion(cliente, db):
+    pista = models.Pista(name="Central", tipo_pista="tierra", tiempo_juego=60, individuales=True)
+    db.add(pista)
+    db.commit()
+    cliente.get(f"/pistas/{pista.id}")  # la primera petición carga las cachés
+    ejecutadas = []
+
+    def contar(*args):
+        ejecutadas.append(args[2])
+
+    for motor in (engine, async_engine.sync_engine):
+        event.listen(motor, "before_cursor_execute", contar)
+    try:
+        respuesta = cliente.get("/pistas/", params={"limit": 5})
+    finally:
+        for motor in (engine, async_engine.sync_engine):
+            event.remove(motor, "before_cursor_execute", contar)
+
+    assert respuesta.status_code == 200
+    assert _sentencias(respuesta.headers["server-timing"]) == len(ejecutadas) > 0
+
+
+def test_avisa_de_n_mas_1_por_encima_del_umbral(db, caplog):
+    cliente = TestClient(_app_de_prueba())
+
+    with caplog.at_level(logging.WARNING, logger="app.metricas"):
+        respuesta = cliente.get(f"/pistas/{SQL_REPEAT_THRESHOLD}")
+    assert _sentencias(respuesta.headers["server-timing"]) == SQL_REPEAT_THRESHOLD
+    assert not [r for r in caplog.records if "N+1" in r.getMessage()]
+
+    with caplog.at_level(logging.WARNING, logger="app.metricas"):
+        respuesta = cliente.get(f"/pistas/{SQL_REPEAT_THRESHOLD + 1}")
+    assert _sentencias(respuesta.headers["server-timing"]) == SQL_REPEAT_THRESHOLD + 1
+    [aviso] = [r.getMessage() for r in caplog.records if "N+1" in r.getMessage()]
+    assert f"GET /pistas/{SQL_REPEAT_THRESHOLD + 1}" in aviso
+    assert f"{SQL_REPEAT_THRESHOLD + 1} veces" in aviso and "FROM pistas" in aviso
+
+
+def test_sin_sentencias_no_hay_cabecera(db):
+    respuesta = TestClient(_app_de_prueba()).get("/pistas/0")
+    assert "server-timing" not in respuesta.headers
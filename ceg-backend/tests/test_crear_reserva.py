@@ -0,0 +1,51 @@
+from datetime import datetime, timedelta
+
+from app import cambios, models, ocupacion
+
+
+def _reserva_json(pista_id, inicio, jugadores=("Ana", "Bea")):
+    return {
+        "pista_id": pista_id, "dia": inicio.date().isoformat(), "hora_inicio": inicio.strftime("%H:%M"),
+        "hora_fin": (inicio + timedelta(minutes=59)).strftime("%H:%M"), "individuales": True,
+        "jugadores": [
+            {"name": jugadores[0], "apellido": "Uno", "tipo_jugador": "Socio"},
+            {"name": jugadores[1], "apellido": "Dos", "tipo_jugador": "No Socio"},
+        ],
+    }
+
+
+def test_crea_la_reserva_con_sus_jugadores(cliente, db):
+    pista = models.Pista(name="Central", tipo_pista="tierra", tiempo_juego=60, individuales=True)
+    db.add(pista)
+    db.commit()
+    inicio = (datetime.now() + timedelta(hours=1)).replace(minute=0, second=0, microsecond=0)
+
+    respuesta = cliente.post("/reservas/", json=_reserva_json(pista.id, inicio))
+    assert respuesta.status_code == 200
+    reserva = db.get(models.Reserva, respuesta.json()["id"])
+    assert sorted(j.name for j in reserva.jugadores) == ["Ana", "Bea"]
+    assert [j["name"] for j in respuesta.json()["jugadores"]] == ["Ana", "Bea"]
+
+
+def test_la_pista_ocupada_en_el_flush_es_un_409_sin_escrituras_a_medias(cliente, db):
+    pista = models.Pista(name="Central", tipo_pista="tierra", tiempo_juego=60, individuales=True)
+    db.add(pista)
+    db.commit()
+    inicio = (datetime.now() + timedelta(hours=1)).replace(minute=0, second=0, microsecond=0)
+    cambios.registro.sincronizar(db)
+    # Otra petición ocupa la pista entre la validación y el commit: la fila existe en la base
+    # de datos, pero ni el índice de ocupación ni el registro de cambios la han visto todavía
+    db.add(models.Reserva(pista_id=pista.id, dia=inicio.date(), hora_inicio=inicio.time(),
+                          hora_fin=(inicio + timedelta(minutes=59)).time(), individuales=True))
+    db.commit()
+    assert ocupacion.indice.solapamiento(pista.id, inicio.date(), inicio.time(), (inicio + timedelta(minutes=59)).time()) is None
+    version = db.query(models.ContadorCambios.version).scalar()
+
+    respuesta = cliente.post("/reservas/", json=_reserva_json(pista.id, inicio, ("Carla", "Dani")))
+
+    assert respuesta.status_code == 409
+    assert respuesta.json()["detail"] == "La pista ya está reservada en ese horario."
+    assert db.query(models.Reserva).count() == 1
+    assert db.query(models.Jugador).count() == 0
+    assert db.query(models.ContadorCambios.version).scalar() == version
+    assert db.query(models.Cambio).filter(models.Cambio.version > version).count() == 0
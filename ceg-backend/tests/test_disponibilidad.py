@@ -0,0 +1,46 @@
+from datetime import date, time, timedelta
+
+import pytest
+
+from app import crud, ocupacion, schemas
+
+
+def _franjas(cliente, dia, desde, hasta):
+    respuesta = cliente.get("/pistas/disponibilidad", params={"dia": dia.isoformat(), "desde": desde, "hasta": hasta})
+    assert respuesta.status_code == 200
+    [pista] = respuesta.json()
+    return [(f["hora_inicio"][:5], f["hora_fin"][:5], f["libre"], f["reserva_id"]) for f in pista["franjas"]], pista["minutos_ocupados"]
+
+
+# Mañana lo sirve el índice de ocupación; ayer queda antes de lo que cubre y se consulta en SQL
+@pytest.mark.parametrize("dias", [1, -1])
+def test_franjas_libres_y_ocupadas_alrededor_de_una_reserva(cliente, db, dias):
+    dia = date.today() + timedelta(days=dias)
+    pista = crud.create_pista(db, schemas.PistaCreate(name="Central", tipo_pista="tierra", tiempo_juego=60, individuales=True))
+    reserva = crud.create_reserva(db, schemas.ReservaCreate(
+        pista_id=pista.id, dia=dia, hora_inicio=time(10, 0), hora_fin=time(11, 0), individuales=True,
+        jugadores=[schemas.JugadorCreate(name="Ana", apellido="Uno", tipo_jugador="Socio"),
+                   schemas.JugadorCreate(name="Bea", apellido="Dos", tipo_jugador="No Socio")],
+    ))
+    assert ocupacion.indice.cubre(dia) == (dias > 0)
+
+    franjas, ocupados = _franjas(cliente, dia, "08:00", "13:00")
+    # Las franjas que acaban justo cuando empieza la reserva o empiezan justo cuando acaba están libres
+    assert franjas == [
+        ("08:00", "09:00", True, None),
+        ("09:00", "10:00", True, None),
+        ("10:00", "11:00", False, reserva.id),
+        ("11:00", "12:00", True, None),
+        ("12:00", "13:00", True, None),
+    ]
+    assert ocupados == 60
+
+    # Con la rejilla desplazada, las dos franjas que pisan la reserva (por un minuto basta) están ocupadas
+    franjas, ocupados = _franjas(cliente, dia, "08:59", "12:59")
+    assert [f[2] for f in franjas] == [True, False, False, True]
+    assert ocupados == 60
+
+
+def test_hasta_anterior_a_desde_es_un_400(cliente, db):
+    respuesta = cliente.get("/pistas/disponibilidad", params={"dia": date.today().isoformat(), "desde": "12:00", "hasta": "10:00"})
+    assert respuesta.status_code == 400
@@ -0,0 +1,63 @@
+from datetime import date, time, timedelta
+
+from app import cambios, crud, eventos, models, schemas
+
+
+def _reserva(pista_id, hora_inicio, hora_fin):
+    return schemas.ReservaCreate(
+        pista_id=pista_id, dia=date.today() + timedelta(days=1), hora_inicio=hora_inicio, hora_fin=hora_fin,
+        individuales=True, jugadores=[
+            schemas.JugadorCreate(name="Ana", apellido="Uno", tipo_jugador="Socio"),
+            schemas.JugadorCreate(name="Bea", apellido="Dos", tipo_jugador="No Socio"),
+        ],
+    )
+
+
+def test_los_ids_de_los_eventos_son_versiones_del_registro(db):
+    pista = crud.create_pista(db, schemas.PistaCreate(name="Central", tipo_pista="tierra", tiempo_juego=60, individuales=True))
+    cambios.registro.sincronizar(db)
+    inicio = eventos.bus.ultimo_id
+
+    creada = crud.create_reserva(db, _reserva(pista.id, time(10, 0), time(11, 0)))
+    crud.create_pista(db, schemas.PistaCreate(name="Dos", tipo_pista="tierra", tiempo_juego=60, individuales=True))
+    crud.delete_reserva(db, creada.id)
+
+    pendientes = eventos.bus.desde(inicio)
+    version_creada = cambios.registro.versiones["reservas"] - 2
+    # La pista gasta una versión sin evento; el historial sigue completo desde `inicio`
+    assert [(e[0], e[1]) for e in pendientes] == [
+        (version_creada, "creada"), (cambios.registro.versiones["reservas"], "eliminada")
+    ]
+    assert eventos.bus.desde(pendientes[0][0]) == pendientes[1:]
+
+
+def test_desde_pide_recargar_si_el_historial_no_cubre_el_id(db):
+    # Al iniciar, el historial empieza vacío en la versión actual (la pista ya la ha avanzado)
+    crud.create_pista(db, schemas.PistaCreate(name="Central", tipo_pista="tierra", tiempo_juego=60, individuales=True))
+    cambios.registro.sincronizar(db)
+    version = eventos.bus.ultimo_id
+    assert eventos.bus.desde(version) == []
+    assert eventos.bus.desde(version - 1) is None
+    # Un id posterior viene de otra base de datos (o de un worker por delante): se recarga
+    assert eventos.bus.desde(version + 1) is None
+
+
+def test_otro_worker_reparte_las_escrituras_de_este(db):
+    pista = models.Pista(name="Central", tipo_pista="tierra", tiempo_juego=60, individuales=True)
+    db.add(pista)
+    db.commit()
+    # Un registro y un bus propios, como los de otro proceso sobre la misma base de datos
+    registro = cambios.RegistroCambios()
+    bus = eventos.BusEventos()
+    registro.al_iniciar(lambda db, version: bus.reiniciar(version))
+    registro.suscribir("reservas", bus.aplicar)
+    registro.sincronizar(db)
+    inicio = registro.version
+
+    creada = crud.create_reserva(db, _reserva(pista.id, time(10, 0), time(11, 0)))
+    assert bus.desde(inicio) == []
+    registro.sincronizar(db)
+
+    [evento] = bus.desde(inicio)
+    assert evento[0] == cambios.registro.version
+    assert evento[1] == "creada" and f'"id": {creada.id}' in evento[2]
@@ -0,0 +1,57 @@
+import csv
+import io
+import json
+from datetime import date, time, timedelta
+
+from app import auth, exportacion, models
+
+
+def _cabeceras_admin(db):
+    admin = models.Admin(name="root", hashed_password="x")
+    db.add(admin)
+    db.commit()
+    return {"Authorization": "Bearer " + auth.create_admin_token(admin)}
+
+
+def test_export_de_reservas_en_csv_y_ndjson(cliente, db, monkeypatch):
+    cabeceras = _cabeceras_admin(db)
+    # Lotes de dos reservas: el export sale en varios trozos
+    monkeypatch.setattr(exportacion, "TAMANO_LOTE", 2)
+    pista = models.Pista(name="Central", tipo_pista="tierra", tiempo_juego=60, individuales=True)
+    dia = date.today() + timedelta(days=1)
+    reservas = [
+        models.Reserva(pista=pista, dia=dia, hora_inicio=time(9 + i, 0), hora_fin=time(10 + i, 0), individuales=True,
+                       jugadores=[models.Jugador(name=f"Ana{i}", apellido="Uno", tipo_jugador="Socio"),
+                                  models.Jugador(name=f"Bea{i}", apellido="Dos", tipo_jugador="No Socio")])
+        for i in range(3)
+    ]
+    db.add_all(reservas)
+    db.commit()
+
+    with cliente.stream("GET", "/admin/reservas/export", params={"format": "csv"}, headers=cabeceras) as respuesta:
+        assert respuesta.status_code == 200
+        assert respuesta.headers["content-type"] == "text/csv; charset=utf-8"
+        assert respuesta.headers["content-disposition"] == 'attachment; filename="reservas.csv"'
+        texto = "".join(respuesta.iter_text())
+    filas = list(csv.reader(io.StringIO(texto)))
+    assert filas[0] == exportacion.COLUMNAS_CSV
+    # Una fila por jugador, en el orden del tablero
+    assert len(filas) == 1 + 6
+    assert filas[1] == [str(reservas[0].id), dia.isoformat(), "09:00:00", "10:00:00", str(pista.id), "Central", "True", "Ana0", "Uno", "Socio"]
+    assert [f[7] for f in filas[1:]] == ["Ana0", "Bea0", "Ana1", "Bea1", "Ana2", "Bea2"]
+
+    with cliente.stream("GET", "/admin/reservas/export", params={"format": "ndjson"}, headers=cabeceras) as respuesta:
+        assert respuesta.headers["content-type"] == "application/x-ndjson"
+        lineas = [json.loads(linea) for linea in respuesta.iter_lines() if linea]
+    assert [r["id"] for r in lineas] == [r.id for r in reservas]
+    assert lineas[2] == {
+        "id": reservas[2].id, "dia": dia.isoformat(), "hora_inicio": "11:00:00", "hora_fin": "12:00:00",
+        "pista_id": pista.id, "pista": "Central", "individuales": True,
+        "jugadores": [{"name": "Ana2", "apellido": "Uno", "tipo_jugador": "Socio"},
+                      {"name": "Bea2", "apellido": "Dos", "tipo_jugador": "No Socio"}],
+    }
+
+    # La cabecera y un trozo por lote, sin juntar todo el export en memoria
+    assert len(list(exportacion.exportar_reservas("csv"))) == 1 + 2
+
+    assert cliente.get("/admin/reservas/export", params={"format": "xml"}, headers=cabeceras).status_code == 400
@@ -0,0 +1,134 @@
+import asyncio
+import hashlib
+import json
+from datetime import datetime, timedelta
+
+import httpx
+
+from app import idempotencia, models
+
+
+def _pista(db):
+    pista = models.Pista(name="Central", tipo_pista="tierra", tiempo_juego=60, individuales=True)
+    db.add(pista)
+    db.commit()
+    return pista.id
+
+
+def _reserva_json(pista_id, nombre="Ana"):
+    inicio = (datetime.now() + timedelta(hours=1)).replace(minute=0, second=0, microsecond=0)
+    return {
+        "pista_id": pista_id, "dia": inicio.date().isoformat(), "hora_inicio": inicio.strftime("%H:%M"),
+        "hora_fin": (inicio + timedelta(minutes=59)).strftime("%H:%M"), "individuales": True,
+        "jugadores": [
+            {"name": nombre, "apellido": "Uno", "tipo_jugador": "Socio"},
+            {"name": "Bea", "apellido": "Dos", "tipo_jugador": "No Socio"},
+        ],
+    }
+
+
+def _otro_worker():
+    # Lo único que un worker guarda en memoria es la caché delante de la tabla
+    idempotencia.almacen._entradas.clear()
+
+
+def test_un_reintento_en_otro_worker_recibe_la_respuesta_guardada(cliente, db):
+    cuerpo = _reserva_json(_pista(db))
+    cabeceras = {"Idempotency-Key": "reintento-otro-worker"}
+    primera = cliente.post("/reservas/", json=cuerpo, headers=cabeceras)
+    assert primera.status_code == 200
+
+    _otro_worker()
+    reintento = cliente.post("/reservas/", json=cuerpo, headers=cabeceras)
+    assert reintento.status_code == 200
+    assert reintento.headers[idempotencia.REPLAYED_HEADER] == "true"
+    assert reintento.json() == primera.json()
+    assert db.query(models.Reserva).count() == 1
+
+
+def test_espera_a_la_peticion_en_curso_en_otro_worker(cliente, db):
+    cuerpo = json.dumps(_reserva_json(_pista(db))).encode()
+    cabeceras = {"Idempotency-Key": "en-curso-otro-worker", "Content-Type": "application/json"}
+    clave = idempotencia.clave_peticion("en-curso-otro-worker", "POST", "/reservas/", None)
+    # Otro worker ha reservado la clave y todavía no ha respondido
+    otro = idempotencia.AlmacenIdempotencia()
+    assert cliente.portal.call(otro.reclamar, clave, hashlib.sha256(cuerpo).hexdigest()) is None
+
+    async def escenario():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=cliente.app), base_url="http://test") as http:
+            peticion = asyncio.ensure_future(http.post("/reservas/", content=cuerpo, headers=cabeceras))
+            await asyncio.sleep(0.3)
+            assert not peticion.done()
+            await otro.guardar(clave, idempotencia.RespuestaGuardada(
+                200, [(b"content-type", b"application/json")], b'{"otro": "worker"}'
+            ))
+            return await peticion
+
+    respuesta = cliente.portal.call(escenario)
+    assert respuesta.status_code == 200
+    assert respuesta.json() == {"otro": "worker"}
+    assert db.query(models.Reserva).count() == 0
+
+
+def test_si_la_reserva_se_confirmo_sin_respuesta_no_se_repite(cliente, db):
+    cuerpo = json.dumps(_reserva_json(_pista(db))).encode()
+    clave = idempotencia.clave_peticion("confirmada-sin-respuesta", "POST", "/reservas/", None)
+    otro = idempotencia.AlmacenIdempotencia()
+    assert cliente.portal.call(otro.reclamar, clave, hashlib.sha256(cuerpo).hexdigest()) is None
+    # El otro worker confirmó la reserva en su transacción y murió antes de guardar la respuesta
+    db.query(models.ClaveIdempotencia).update({"confirmada": True, "caduca": datetime.utcnow()})
+    db.commit()
+
+    respuesta = cliente.post("/reservas/", content=cuerpo, headers={
+        "Idempotency-Key": "confirmada-sin-respuesta", "Content-Type": "application/json"
+    })
+    assert respuesta.status_code == 409
+    assert db.query(models.Reserva).count() == 0
+
+
+def test_la_reserva_confirma_la_clave_en_su_transaccion(cliente, db):
+    cuerpo = _reserva_json(_pista(db))
+    cliente.post("/reservas/", json=cuerpo, headers={"Idempotency-Key": "confirmada"})
+    fila = db.query(models.ClaveIdempotencia).one()
+    assert fila.confirmada and fila.status == 200
+
+
+def test_repite_la_respuesta_para_la_misma_clave_y_cuerpo(cliente, db):
+    cuerpo = _reserva_json(_pista(db))
+    cabeceras = {"Idempotency-Key": "repetida"}
+    primera = cliente.post("/reservas/", json=cuerpo, headers=cabeceras)
+    segunda = cliente.post("/reservas/", json=cuerpo, headers=cabeceras)
+
+    assert primera.status_code == segunda.status_code == 200
+    assert idempotencia.REPLAYED_HEADER not in primera.headers
+    assert segunda.headers[idempotencia.REPLAYED_HEADER] == "true"
+    assert segunda.content == primera.content
+    assert db.query(models.Reserva).count() == 1
+
+
+def test_agrupa_las_peticiones_simultaneas_con_la_misma_clave(cliente, db):
+    cuerpo = _reserva_json(_pista(db))
+    cabeceras = {"Idempotency-Key": "simultanea"}
+
+    async def escenario():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=cliente.app), base_url="http://test") as http:
+            return await asyncio.gather(*[http.post("/reservas/", json=cuerpo, headers=cabeceras) for _ in range(5)])
+
+    respuestas = cliente.portal.call(escenario)
+    assert [r.status_code for r in respuestas] == [200] * 5
+    assert len({r.content for r in respuestas}) == 1
+    assert sum(idempotencia.REPLAYED_HEADER in r.headers for r in respuestas) == 4
+    assert db.query(models.Reserva).count() == 1
+
+
+def test_otro_cuerpo_con_la_misma_clave_es_un_422(cliente, db):
+    pista_id = _pista(db)
+    cabeceras = {"Idempotency-Key": "reutilizada"}
+    assert cliente.post("/reservas/", json=_reserva_json(pista_id), headers=cabeceras).status_code == 200
+
+    respuesta = cliente.post("/reservas/", json=_reserva_json(pista_id, nombre="Carla"), headers=cabeceras)
+    assert respuesta.status_code == 422
+    _otro_worker()
+    respuesta = cliente.post("/reservas/", json=_reserva_json(pista_id, nombre="Carla"), headers=cabeceras)
+    assert respuesta.status_code == 422
+    assert db.query(models.Reserva).count() == 1
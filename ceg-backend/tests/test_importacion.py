@@ -0,0 +1,38 @@
+from app import auth, models
+
+
+def _cabeceras_admin(db):
+    admin = models.Admin(name="root", hashed_password="x")
+    db.add(admin)
+    db.commit()
+    return {"Authorization": "Bearer " + auth.create_admin_token(admin)}
+
+
+def test_import_de_socios_creados_omitidos_y_fallidos(cliente, db):
+    cabeceras = _cabeceras_admin(db)
+    db.add(models.Socio(name="Ya", lastname="Existe", email="ya@example.com", type="Socio", hashed_password="x"))
+    db.commit()
+    fichero = (
+        "name,lastname,email,phone,type,password\n"
+        "Ana,Uno,ana@example.com,600,Socio,secreta\n"
+        "Otra,Vez,ya@example.com,601,Socio,secreta\n"
+        "Ana,Repetida,ana@example.com,602,Socio,secreta\n"
+        ",Sin nombre,sin@example.com,603,Socio,secreta\n"
+    )
+
+    respuesta = cliente.post("/admin/socios/bulk", content=fichero.encode(),
+                             headers={**cabeceras, "Content-Type": "text/csv"})
+
+    assert respuesta.status_code == 200
+    resultado = respuesta.json()
+    assert (resultado["creados"], resultado["omitidos"], resultado["fallidos"]) == (1, 2, 1)
+    estados = [(f["fila"], f["estado"], f["detalle"]) for f in resultado["filas"]]
+    assert estados[:3] == [
+        (1, "creado", None),
+        (2, "omitido", "Email ya registrado"),
+        (3, "omitido", "Email repetido en el fichero"),
+    ]
+    assert estados[3][:2] == (4, "fallido") and "name" in estados[3][2]
+    creado = db.query(models.Socio).filter(models.Socio.email == "ana@example.com").one()
+    assert resultado["filas"][0]["id"] == creado.id and creado.lastname == "Uno"
+    assert db.query(models.Socio).count() == 2
@@ -0,0 +1,45 @@
+from app import models, paginacion
+
+
+def _recorrer(cliente, ruta, limit):
+    """Sigue X-Next-Cursor hasta que falta y devuelve los ids de todas las páginas."""
+    ids, paginas, cursor = [], 0, None
+    while True:
+        params = {"limit": limit}
+        if cursor is not None:
+            params["cursor"] = cursor
+        respuesta = cliente.get(ruta, params=params)
+        assert respuesta.status_code == 200
+        ids += [fila["id"] for fila in respuesta.json()]
+        paginas += 1
+        cursor = respuesta.headers.get(paginacion.NEXT_CURSOR_HEADER)
+        if cursor is None:
+            return ids, paginas
+
+
+def test_las_paginas_del_tablero_no_repiten_ni_saltan_reservas(cliente, db, sembrar):
+    # Todas empiezan mañana a las 00:00: el orden entre ellas lo decide el id
+    sembrar(7)
+    esperados = [r.id for r in db.query(models.Reserva).order_by(models.Reserva.id)]
+
+    ids, paginas = _recorrer(cliente, "/reservas/", 3)
+
+    assert ids == esperados
+    assert paginas == 3
+
+
+def test_las_paginas_de_pistas_siguen_el_id(cliente, db, sembrar):
+    sembrar(5)
+    esperados = [p.id for p in db.query(models.Pista).order_by(models.Pista.id)]
+
+    ids, paginas = _recorrer(cliente, "/pistas/", 2)
+
+    assert ids == esperados
+    assert paginas == 3
+
+
+def test_un_cursor_mal_formado_es_un_400(cliente, db):
+    for ruta in ("/reservas/", "/pistas/"):
+        for cursor in ("no-es-base64!", paginacion.codificar_cursor(["x"]), paginacion.codificar_cursor([1, 2, 3, 4])):
+            respuesta = cliente.get(ruta, params={"limit": 2, "cursor": cursor})
+            assert respuesta.status_code == 400, (ruta, cursor)
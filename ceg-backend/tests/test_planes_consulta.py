@@ -0,0 +1,18 @@
+from tests import planes_consulta
+
+
+def test_consultas_criticas_usan_indices(db, sembrar):
+    sembrar(20)
+
+    assert planes_consulta.comprobar_planes(db) == []
+
+
+def test_lecturas_sin_n_mas_1(db, sembrar):
+    # El número de sentencias de cada lectura no depende de cuántas reservas haya
+    sembrar(5)
+    con_n = planes_consulta.contar_sentencias(db)
+    sembrar(5)
+    con_2n = planes_consulta.contar_sentencias(db)
+
+    assert con_2n == con_n
+    assert planes_consulta.comprobar_presupuesto(db) == []
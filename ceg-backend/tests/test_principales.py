@@ -0,0 +1,94 @@
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+from app import auth, cambios, crud, models, principales, schemas
+from app.database import async_engine, engine
+
+
+def _otro_worker():
+    # Un registro y una caché propios, como los de otro proceso sobre la misma base de datos
+    registro = cambios.RegistroCambios()
+    cache = principales.CachePrincipales()
+    registro.al_iniciar(lambda db, version: cache.vaciar())
+    registro.suscribir("socios", lambda cambio: cache.invalidar("socio", cambio.clave))
+    registro.suscribir("admins", lambda cambio: cache.invalidar("admin", cambio.clave))
+    return registro, cache
+
+
+def _guardar(cache, rol, sub, principal):
+    cache.guardar(rol, sub, principal, cache.generacion)
+
+
+def test_la_baja_de_un_socio_invalida_la_cache_de_otro_worker(db):
+    socio = models.Socio(name="Ana", lastname="Uno", email="ana@example.com", phone="600000000", type="Socio", hashed_password="x")
+    db.add(socio)
+    db.commit()
+    registro, cache = _otro_worker()
+    registro.sincronizar(db)
+    _guardar(cache, "socio", socio.email, schemas.Socio.model_validate(socio))
+
+    crud.update_socio(db, socio.id, {"phone": "611111111"})
+    assert cache.obtener("socio", socio.email) is not None
+    registro.sincronizar(db)
+    assert cache.obtener("socio", socio.email) is None
+
+    _guardar(cache, "socio", socio.email, schemas.Socio.model_validate(socio))
+    crud.delete_socio(db, socio.id)
+    registro.sincronizar(db)
+    assert cache.obtener("socio", socio.email) is None
+
+
+def test_la_baja_de_un_admin_invalida_la_cache_de_otro_worker(db):
+    admin = models.Admin(name="root", hashed_password="x")
+    db.add(admin)
+    db.commit()
+    registro, cache = _otro_worker()
+    registro.sincronizar(db)
+    _guardar(cache, "admin", admin.name, schemas.Admin.model_validate(admin))
+    # Una consulta que empezó antes del cambio no puede guardar el valor antiguo
+    generacion = cache.generacion
+
+    crud.delete_admin(db, admin.id)
+    registro.sincronizar(db)
+    assert cache.obtener("admin", admin.name) is None
+    cache.guardar("admin", admin.name, schemas.Admin.model_validate(admin), generacion)
+    assert cache.obtener("admin", admin.name) is None
+
+
+@contextmanager
+def _contar_sentencias():
+    sentencias = []
+
+    def contar(*args):
+        sentencias.append(args[2])
+
+    for motor in (engine, async_engine.sync_engine):
+        event.listen(motor, "before_cursor_execute", contar)
+    try:
+        yield sentencias
+    finally:
+        for motor in (engine, async_engine.sync_engine):
+            event.remove(motor, "before_cursor_execute", contar)
+
+
+def test_un_socio_en_cache_no_toca_la_base_de_datos(cliente, db, monkeypatch):
+    monkeypatch.setattr(principales, "PRINCIPAL_CACHE_SYNC", 60)
+    socio = models.Socio(name="Ana", lastname="Uno", email="ana@example.com", phone="600000000", type="Socio", hashed_password="x")
+    db.add(socio)
+    db.commit()
+    cabeceras = {"Authorization": "Bearer " + auth.create_socio_token(socio)}
+    assert cliente.get("/socios/me", headers=cabeceras).status_code == 200
+
+    with _contar_sentencias() as sentencias:
+        assert cliente.get("/socios/me", headers=cabeceras).json()["email"] == "ana@example.com"
+    assert sentencias == []
+
+    # Pasado el intervalo se vuelve a leer el registro, y una baja hecha por otro worker
+    # (sin pasar por la caché de este) se aplica
+    db.delete(socio)
+    cambios.registrar(db, "socios", "eliminado", socio.id)
+    db.commit()
+    assert cliente.get("/socios/me", headers=cabeceras).status_code == 200
+    monkeypatch.setattr(principales, "PRINCIPAL_CACHE_SYNC", 0)
+    assert cliente.get("/socios/me", headers=cabeceras).status_code == 401
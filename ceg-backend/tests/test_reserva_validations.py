@@ -0,0 +1,35 @@
+from datetime import time
+
+from app.reserva_validations import barrido_conflictos
+
+
+def etiqueta(indice):
+    return f"elemento {indice} del lote"
+
+
+def test_nuevo_rechazado_por_existente_no_tumba_a_otro_nuevo():
+    # A choca con la reserva existente E; B solo choca con A, que ya está rechazada
+    existentes = [(time(11, 30), time(12, 0), "reserva E")]
+    nuevos = [(time(10, 0), time(12, 0), 0), (time(10, 30), time(11, 0), 1)]
+
+    assert barrido_conflictos(existentes, nuevos, etiqueta) == {0: "reserva E"}
+
+
+def test_existente_que_empieza_despues_del_nuevo():
+    existentes = [(time(10, 30), time(11, 30), "reserva E")]
+    nuevos = [(time(10, 0), time(11, 0), 0), (time(11, 30), time(12, 30), 1)]
+
+    assert barrido_conflictos(existentes, nuevos, etiqueta) == {0: "reserva E"}
+
+
+def test_entre_nuevos_falla_el_que_empieza_mas_tarde():
+    nuevos = [(time(11, 0), time(12, 0), 0), (time(10, 0), time(11, 30), 1), (time(11, 30), time(12, 30), 2)]
+
+    assert barrido_conflictos([], nuevos, etiqueta) == {0: "elemento 1 del lote"}
+
+
+def test_intervalos_contiguos_no_chocan():
+    existentes = [(time(9, 0), time(10, 0), "reserva E")]
+    nuevos = [(time(10, 0), time(11, 0), 0), (time(11, 0), time(12, 0), 1)]
+
+    assert barrido_conflictos(existentes, nuevos, etiqueta) == {}
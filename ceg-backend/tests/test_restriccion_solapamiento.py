@@ -0,0 +1,29 @@
+from datetime import date, time, timedelta
+
+import pytest
+
+from app import crud, models
+
+
+def _reserva(pista, hora_inicio, hora_fin):
+    return models.Reserva(pista=pista, dia=date.today() + timedelta(days=1),
+                          hora_inicio=hora_inicio, hora_fin=hora_fin, individuales=True)
+
+
+def test_create_all_impide_solapar_la_pista(db):
+    # La tabla la crea Base.metadata.create_all (conftest), sin pasar por las migraciones
+    pista = models.Pista(name="Central", tipo_pista="tierra", tiempo_juego=60, individuales=True)
+    db.add(_reserva(pista, time(10, 0), time(11, 0)))
+    db.commit()
+
+    db.add(_reserva(pista, time(10, 30), time(11, 30)))
+    with pytest.raises(crud.ReservaSolapada):
+        crud.commit_reserva(db)
+
+    contigua = _reserva(pista, time(11, 0), time(12, 0))
+    db.add(contigua)
+    crud.commit_reserva(db)
+
+    contigua.hora_inicio = time(10, 45)
+    with pytest.raises(crud.ReservaSolapada):
+        crud.commit_reserva(db)
@@ -0,0 +1,44 @@
+from datetime import date, time, timedelta
+
+import pytest
+
+from app import models, paginacion, schemas, serializacion
+
+
+@pytest.fixture
+def tablero(db):
+    dia = date.today() + timedelta(days=1)
+    for i, (nombre, apellido) in enumerate([("Íñigo", "Muñoz"), ("Zoë", "O'Brien \"Jr\""), ("Ana", "Uno")]):
+        pista = models.Pista(name=f"Pista {i} – cubierta", tipo_pista="tierra", tiempo_juego=60, individuales=i != 1)
+        db.add(models.Reserva(
+            pista=pista, dia=dia, hora_inicio=time(0, 0), hora_fin=time(0, 30, 15), individuales=i != 1,
+            jugadores=[models.Jugador(name=nombre, apellido=apellido, tipo_jugador="Socio"),
+                       models.Jugador(name="Bea", apellido="Dos", tipo_jugador="No Socio")],
+        ))
+    db.commit()
+
+
+@pytest.mark.parametrize("ruta", ["/reservas/", "/pistas/"])
+def test_la_ruta_rapida_da_el_mismo_json_que_fastapi(cliente, tablero, monkeypatch, ruta):
+    params = {"limit": 2}
+    monkeypatch.setattr(serializacion, "FAST_JSON_RESPONSES", False)
+    normal = cliente.get(ruta, params=params)
+    monkeypatch.setattr(serializacion, "FAST_JSON_RESPONSES", True)
+    rapida = cliente.get(ruta, params=params)
+
+    assert normal.status_code == rapida.status_code == 200
+    assert rapida.content == normal.content
+    assert rapida.json() == normal.json() and len(rapida.json()) == 2
+    assert rapida.headers["content-type"] == normal.headers["content-type"] == "application/json"
+    # Las cabeceras que el endpoint pone en `response` se conservan
+    for cabecera in ("ETag", paginacion.NEXT_CURSOR_HEADER):
+        assert rapida.headers[cabecera] == normal.headers[cabecera]
+
+
+def test_objetos_caducados_tras_un_commit(db, tablero):
+    reservas = db.query(models.Reserva).order_by(models.Reserva.id).all()
+    esperado = serializacion.compilar(schemas.Reserva).adaptador.dump_json(
+        [schemas.Reserva.model_validate(r) for r in reservas]
+    )
+    db.commit()  # caduca los atributos: se serializan por la ruta lenta (from_attributes)
+    assert serializacion.codificar_lista(schemas.Reserva, reservas) == esperado
@@ -0,0 +1,23 @@
+from fastapi import Request
+
+from app import cambios, crud, schemas, versiones
+
+
+def _peticion(query: bytes = b"") -> Request:
+    return Request({"type": "http", "method": "GET", "path": "/pistas/", "query_string": query, "headers": []})
+
+
+def test_etag_igual_en_todos_los_workers_y_tras_reiniciar(db):
+    antes = versiones.etag(db, "pistas", _peticion())
+    # Un worker recién arrancado parte de la versión de la base de datos, no de cero
+    cambios.registro.reiniciar()
+    assert versiones.etag(db, "pistas", _peticion()) == antes
+
+    crud.create_pista(db, schemas.PistaCreate(name="Central", tipo_pista="tierra", tiempo_juego=60, individuales=True))
+    despues = versiones.etag(db, "pistas", _peticion())
+    assert despues != antes
+    cambios.registro.reiniciar()
+    assert versiones.etag(db, "pistas", _peticion()) == despues
+
+    assert versiones.etag(db, "pistas", _peticion(b"limit=5")) != despues
+    assert versiones.etag(db, "reservas", _peticion()) != despues